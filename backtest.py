@@ -3,16 +3,23 @@
 import time as t
 from datetime import datetime, timedelta
 import config
-from collections import deque
 from sys import exit
 
+import numpy as np
+
+import libs.pricelog as pricelog
+price_log = pricelog.pricelog()
+
 ## Backtest class
 class backtesting(object):
     def __init__(self):
         self.backtesting, self.exchange_abbr, self.market = False, None, None
         self._curr_time, self._curr_price, self._end_time, self._curr_pricelog_line_no = None, None, None, None
         self.finished = False
-        self._price_history_queue = deque()
+        # Price history as arrays with a cursor at the current price, history before the start is kept for indicators
+        self._price_timestamps, self._price_values = np.empty(0), np.empty(0)
+        self._price_cursor, self._price_first_line_no = 0, 0
+        self.history_lines = 200000     # max number of ticks requested by tdlib (see get_nentries)
         # For proper timezone and DST handling 
         self.pytz_timezone = config.pytz_timezone
         self.td_price_base_constant = config.td_price_base_constant
@@ -48,28 +55,16 @@ class backtesting(object):
         if self.backtesting:
             #with open('price_log/' + self.market + '_' + self.exchange_abbr.lower() + '.csv') as file:
             filename = self.filename_define(self.market, self.exchange_abbr.lower())
-            with open(filename) as file:
-                start_line_no = 0
-                self._curr_pricelog_line_no = -1
-                for line in file:
-                    strs = line.split(',')
-                    self._curr_pricelog_line_no = self._curr_pricelog_line_no + 1
-                    # If starting earlier than available - finish
-                    if (float(strs[0]) > self._curr_time) and (self._curr_pricelog_line_no == 0):
-                        raise exceptions.IndexError('Backtesting time earlier than available')
-
-                    if not start_line_no and float(strs[0]) >= self._curr_time:
-                        start_line_no = self._curr_pricelog_line_no
-
-                    if start_line_no:
-                        if float(strs[0]) > self._end_time:
-                            #print('History will be stopped at the line with attributes {}'.format(line, self._end_time))
-                            break
-                        else:
-                            pair = (float(strs[0])), float(strs[1])
-                            self._price_history_queue.append(pair)
-
-            self._curr_pricelog_line_no = start_line_no
+            # Jumping to the start with the sparse timestamp index (sidecar file, updated if the log has grown)
+            # and reading only the lines between the start and the end time plus the history for indicators
+            self._price_first_line_no, self._price_cursor, self._price_timestamps, self._price_values = price_log.csv_window(
+                filename, self._curr_time, self._end_time, lines_before = self.history_lines)
+            # If starting earlier than available - finish
+            if self._price_first_line_no + self._price_cursor == 0 and self._price_timestamps.size > 0 and (
+                    self._price_timestamps[0] > self._curr_time):
+                raise IndexError('Backtesting time earlier than available')
+
+            self._curr_pricelog_line_no = self._price_first_line_no + self._price_cursor
             self._find_current_price()
 
     def get_market_price(self, exchange_abbr_in, market_in, logger = None):
@@ -78,21 +73,40 @@ class backtesting(object):
             raise exceptions.InputError('exchange_abbr_in or market_in is incorrect')
         return self._curr_price
 
-    # Finding the current price
+    # Finding the current price: moving the cursor to the first tick at or after the current time
     def _find_current_price(self):
-        while len(self._price_history_queue) > 0:
-            if self._price_history_queue[0][0] >= self._curr_time:
-                self._curr_price = self._price_history_queue[0][1]
-                return
-            else:
-                self._price_history_queue.popleft();
-                self._curr_pricelog_line_no = self._curr_pricelog_line_no + 1
+        self._price_cursor += np.searchsorted(self._price_timestamps[self._price_cursor:], self._curr_time, side = 'left')
+        self._curr_pricelog_line_no = self._price_first_line_no + self._price_cursor
+        if self._price_cursor < self._price_timestamps.size:
+            self._curr_price = float(self._price_values[self._price_cursor])
+            return
 
         #print ('\nCurr line {}, curr time {}\n'.format(self._curr_pricelog_line_no, self._curr_time))
         print('Price history finished')
         self.finished = True
         exit(0)
 
+    # Last nentries ticks up to the current price log line (views, no copy). None if history was not loaded
+    def price_history(self, nentries):
+        if not self.backtesting:
+            return None
+        end = self._price_cursor + 1
+        start = end - nentries
+        if start < 0 and self._price_first_line_no > 0:
+            return None
+        start = max(start, 0)
+        return self._price_timestamps[start:end], self._price_values[start:end]
+
+    # Ticks after the timestamp up to the current price log line (views)
+    def price_history_since(self, timestamp):
+        if not self.backtesting:
+            return None
+        end = self._price_cursor + 1
+        start = np.searchsorted(self._price_timestamps[:end], timestamp, side = 'right')
+        if start == 0 and self._price_first_line_no > 0:
+            return None
+        return self._price_timestamps[start:end], self._price_values[start:end]
+
     def time(self):        
         if not self.backtesting:
             return t.time()
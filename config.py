@@ -7,6 +7,18 @@ backtesting_use_db_labels = False   # to use pre-calculated labels from DB or to
 use_testnet = False # change to true for testing
 run_testmode = False     ### Testmode control if needed
 
+# Simulated exchange (libs/simexchange.py) used instead of exchange api in backtests if enabled
+backtesting_sim_exchange = False
+sim_latency = 1                     # seconds from placing an order until it can be filled
+sim_slippage = 0.0005               # price change on orders executed right away (taking liquidity)
+sim_fees = {                        # exchange: [maker fee, taker fee] as part of the order value
+    'bitmex': [-0.00025, 0.00075],
+    'oanda': [0, 0]
+}
+sim_funding_rate = 0.0001           # bitmex funding every 8 hours, paid by longs when positive
+sim_balance = {'bitmex': 1, 'oanda': 10000}     # starting balance (BTC / USD)
+sim_book_quantity = 1000000         # quantity in the simulated order book
+
 # Backtesting start and end dates (are overwritten if launched from terminal with --start --end)
 backtesting_start_d, backtesting_start_m, backtesting_start_y  = 5, 2, 2014
 backtesting_start_h, backtesting_start_min = 3, 0
@@ -55,6 +67,31 @@ sleep_sale = 60                                     # Sleep timer for sell order
 # Buy
 buy_sleep_timer = 60               # Sleep timer in seconds for buy task. changed to 3 minutes because orders were filling way too quickly at a higher price. 180 is 3 min
 
+# Control wake-ups: robots sleeping in the loops wake up when Telegram commands change their flags
+control_folder = 'control'          # folder with the per-user notification files
+control_poll = 0.5                  # seconds between the checks of the notification file while sleeping
+
+## Retries of exchange requests: capped exponential backoff with jitter
+retry_base = 1                      # seconds, the delay is random up to min(cap, base * 2^attempt)
+retry_rate_limit_base = 5           # seconds, base when the exchange returns rate limit errors
+retry_cap = 60                      # seconds, maximum delay
+retry_max_attempts = 8              # retries of a request
+
+## Circuit breaker per exchange shared by all the processes: requests fail fast while the exchange is down
+circuit_folder = 'circuit'          # folder with the state files
+circuit_failures = 5                # consecutive failures to open the circuit
+circuit_open_seconds = 60           # time to fail fast before a probe request
+circuit_probe_seconds = 10          # time for the probe request before others may try
+
+## Rate limits of exchange requests shared by all the processes (token bucket per exchange account)
+rate_limit_db = 'ratelimit.db'      # sqlite file with the buckets
+rate_limits = {                     # exchange: [requests per second, bucket size (burst)] for each account (api key)
+    'bitmex': [1, 30],
+    'oanda': [20, 60]
+}
+rate_limit_reserve = 0.25           # part of the bucket reserved for orders: status reads wait when below it
+rate_limit_max_wait = 60            # seconds, a request is sent anyway after waiting this long
+
 ## Interval and number of checks to get current (last) prices
 steps_ticker = 3 
 sleep_ticker = 10               # so that ticker in total takes 30 seconds 
@@ -77,6 +114,10 @@ nix_folder = '/home/ubuntu/Robot/'                       # your unix machine fol
 timedelta = 10                                                      # convert price information to your local time. For Sydney, it is 10 during DST (Oct-Apr). Shift from DST is handled automatically.
 td_price_base_constant = 2                              # price base for TDlib. For 4H, it should be 2 during DST (Oct-Apr). Shift from DST is handled automatically.     
 pytz_timezone = 'Australia/Sydney'                  # for proper daylight saving time detection
+price_log_binary = True                                     # binary price logs (price_log/*.bin) for fast reading of the last ticks
+price_log_csv = True                                           # csv price logs (used by backtests and ml workflow)
+bar_cache_mb = 100                                             # memory cap for OHLC bars shared between indicator calls
+td_streaming = True                                             # TD / RSI / MA are updated with new ticks only instead of recalculating the whole history on every call
 local_curr = 'AUD'                                               # symbol to change the price to your local currency (for balance command)    
 local_curr_fixed = 1.25                                       # exchange from USD to your local in case the url request does not work   
 
@@ -87,6 +128,12 @@ dir_to = '/home/ubuntu/Dropbox/Exchange/'
 # Commands to start a terminal in your *nix environment
 cmd_init = 'gnome-terminal --tab --profile Active -e "python3 ' + nix_folder + 'robot.py '                       # do not remove this space in the end
 
+# Job host (robot_host.py): jobs run as forks of one process with the libraries loaded once instead of a terminal per job
+job_host_enabled = False            # daemon and restart_jobs submit the jobs to the host queue instead of cmd_init
+job_host_folder = 'job_queue'       # folder with the submitted jobs
+job_host_poll = 1                   # seconds between the checks of the queue
+job_host_max_jobs = 500             # jobs running at the same time, others wait in the queue
+
 
 ############## Telegram settings ####################
 
@@ -136,6 +183,15 @@ markets_list = [
     #['XBTZ18', 'BMEX', 'standard'],
 ]
 
+# Price collector: instruments are fetched concurrently, with limits per exchange
+price_collector_interval = 1                    # seconds between the starts of collection cycles
+price_collector_timeout = 10                    # seconds to wait for a price of an instrument
+price_collector_batch = True                    # all the instruments of an exchange in one request (gettickers)
+price_collector_limits = {                      # exchange: [requests per second, concurrent requests]
+    'bitmex': [1, 2],
+    'oanda': [10, 4]
+}
+
 exch_supported =  ['bmex', 'oanda']    # supported exchanges
 exch_short =  ['bmex', 'oanda']  # exchanges where shorts are supported
 
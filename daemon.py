@@ -19,6 +19,12 @@ from libs.telegramlib import telegram
 import libs.sqltools as sqltools
 sql = sqltools.sql()
 
+import libs.controlchannel as controlchannel   # waking up robots after changing their flags
+control_channel = controlchannel.controlchannel()
+
+import libs.jobhost as jobhost   # jobs submitted to robot_host.py if enabled
+job_host = jobhost.jobhost()
+
 import libs.platformlib as platform                                  # detecting the OS and setting proper folders
 from libs.coinigylib import coinigy                                      # library to work with coinigy
 
@@ -168,6 +174,7 @@ def telegram_close_position_execute(user_to, value):
                 "WHERE job_id = {} AND userid = {}".format(msg_text,
                                                                                                 user_to)  # flagging for cancellation
             sql.query(sql_string)
+            control_channel.notify(user_to)
             send_chat_message(user_to, 'Job ' + msg_text.upper() + ' flagged for closing')
         except:
             send_chat_message(user_to, 'Incorrect task name')
@@ -176,6 +183,7 @@ def telegram_close_position_execute(user_to, value):
         send_chat_message(user_to, 'Marked everything for closing')
         sql_string = "UPDATE jobs SET selling = 1 WHERE userid = {}".format(user_to)
         sql.query(sql_string)
+        control_channel.notify(user_to)
 
     responses_df.loc[user_to] = None
 
@@ -295,14 +303,15 @@ def telegram_new_sell_execute(user_to, value):
             entry_price_str = '--entry_cutoff_price={}'.format(run_price_curr)
         except: 
             entry_price_str = ''
-        if platform_run == 'Windows':
-            cmd_str = cmd_init + ' '.join(['process', run_simulation_param, run_exchange, run_market,
-                                           run_price_curr, user_id_str, entry_price_str, strategy_str])
+        command = ' '.join(['process', run_simulation_param, run_exchange, run_market,
+                            run_price_curr, user_id_str, entry_price_str, strategy_str])
+        if config.job_host_enabled:
+            job_host.submit(command)
+        elif platform_run == 'Windows':
+            os.system(cmd_init + command)
         else:
             # Nix
-            cmd_str = cmd_init + ' '.join(['process', run_simulation_param, run_exchange, run_market,
-                                           run_price_curr, user_id_str, entry_price_str, strategy_str]) + '"'
-        os.system(cmd_str)
+            os.system(cmd_init + command + '"')
 
         # Check if launched
 
@@ -515,17 +524,18 @@ def telegram_initiate_execute(user_to, value):
         # Run depending on the platform
         user_id_str = '--userid={}'.format(user_to)
         strategy_str = '--core_strategy={}'.format(strategy_name)
-        if platform_run == 'Windows':
-            cmd_str = cmd_init + ' '.join(
-                ['initiate', buy_mode, buy_exchange, buy_market, buy_total, buy_price, buy_time_limit, user_id_str, strategy_str])
-
+        command = ' '.join(
+            ['initiate', buy_mode, buy_exchange, buy_market, buy_total, buy_price, buy_time_limit, user_id_str, strategy_str])
+        if config.job_host_enabled:
+            cmd_str = command
+            job_host.submit(command)
+        elif platform_run == 'Windows':
+            cmd_str = cmd_init + command
+            os.system(cmd_str)
         else:
             # Nix
-            cmd_str = cmd_init + ' '.join(
-                ['initiate', buy_mode, buy_exchange, buy_market, buy_total, buy_price, buy_time_limit,
-                 user_id_str, strategy_str]) + '"'
-
-        os.system(cmd_str)
+            cmd_str = cmd_init + command + '"'
+            os.system(cmd_str)
         send_chat_message(user_to, 'New task requested successfully (strategy: {}). Please allow for a few minutes for this task to launch.'.format(strategy_name))
         print("Started a new buy job: ", cmd_str)
 
@@ -553,6 +563,7 @@ def telegram_db_clean_execute(user_to, value):
         for tbl_name in ['buys', 'jobs', 'bback', 'buy_hold']:
             sql_string = "UPDATE {} SET abort_flag=1 WHERE userid = {}".format(tbl_name, user_to)
             sql.query(sql_string)
+        control_channel.notify(user_to)
 
         time.sleep(90)
         send_chat_message(user_to, "Cleaning the database...")
@@ -991,6 +1002,9 @@ def telegram_keys_set_2(user_to, value):
             user_id, key_id, key_secret, strategy, exchange)
         sql.query(sql_string)
 
+    # Clients made with the previous keys are not used anymore
+    exch_api.client_pool.invalidate(user_id)
+
     # Checking balance to ensure that the keys are correct   #finish
     send_chat_message(user_to, 'Validating the keys...')
     api_validate = telegram_balance(user_id, exchange = exchange, strategy = strategy)
@@ -1199,18 +1213,25 @@ def telegram_status(user_to):   # fix short flag
     if rows == []:
         no_longs = True
     else:
+        exchange_names = {'bina': 'binance', 'btrx': 'bittrex'}
+        # Current prices: one request per exchange
+        longs_markets = {}
+        for row in rows:
+            longs_markets.setdefault(exchange_names.get(row[4], row[4]), []).append(row[1])
+        longs_prices = {exchange: e_api.gettickers(exchange, markets) or {} for exchange, markets in longs_markets.items()}
+
         for row in rows:
             re_l_market = row[1]
             re_l_price = row[2]
             re_l_q = row[3]
-            re_l_exchange = row[4]
-            if re_l_exchange == 'bina':
-                re_l_exchange = 'binance'
-            elif re_l_exchange == 'btrx':
-                re_l_exchange = 'bittrex'
-            re_l_curr_price = float(e_api.getticker(re_l_exchange, re_l_market))
-
-            re_price_prop = round((re_l_curr_price / re_l_price) * 100, 1)
+            re_l_exchange = exchange_names.get(row[4], row[4])
+            re_l_curr_price = longs_prices[re_l_exchange].get(re_l_market)
+
+            # No price (request failed) or the market is closed (False)
+            if re_l_curr_price is None or re_l_curr_price is False:
+                re_price_prop = 'n/a'
+            else:
+                re_price_prop = round((float(re_l_curr_price) / re_l_price) * 100, 1)
             reply_string_long += "\n{} ({}), current price: {} % of EP, Q: {}\n".format(re_l_market, re_l_exchange,
                                                                                         re_price_prop, re_l_q)
 
@@ -1340,24 +1361,28 @@ def telegram_abort_execute(user_to, value):
         sql_string = "UPDATE jobs SET abort_flag = 1 WHERE job_id = {} AND userid = {}".format(id,
                                                                                                user_to)  # flagging for cancellation
         sql.query(sql_string)
+        control_channel.notify(user_to)
         reply = 'Job {} flagged for cancelling'.format(msg_text)
         send_chat_message(user_to, reply)
     if tmp_list[int(msg_text)][1] == 'buys':
         sql_string = "UPDATE buys SET abort_flag = 1 WHERE job_id = {} AND userid = {}".format(id,
                                                                                                user_to)  # flagging for cancellation
         sql.query(sql_string)
+        control_channel.notify(user_to)
         reply = 'Buy {} flagged for cancelling'.format(msg_text)
         send_chat_message(user_to, reply)
     if tmp_list[int(msg_text)][1] == 'bback':
         sql_string = "UPDATE bback SET abort_flag = 1 WHERE id = {} AND userid = {}".format(id,
                                                                                             user_to)  # flagging for cancellation
         sql.query(sql_string)
+        control_channel.notify(user_to)
         reply = 'Reentry {} flagged for cancelling'.format(msg_text)
         send_chat_message(user_to, reply)
     if tmp_list[int(msg_text)][1] == 'buy_hold':
         sql_string = "UPDATE buy_hold SET abort_flag = 1 WHERE job_id = {} AND userid = {}".format(id,
                                                                                                    user_to)  # flagging for cancellation
         sql.query(sql_string)
+        control_channel.notify(user_to)
         reply = 'Buy on hold {} flagged for cancelling'.format(msg_text)
         send_chat_message(user_to, reply)
 
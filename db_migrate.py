@@ -0,0 +1,45 @@
+# Applying schema migrations (indexes) to workflow.db and reporting the query plans of the hot queries
+# Run after updating the code and after td_stats / labels_generated are created by backfills
+# Exits with code 1 if a hot query scans a table instead of using an index
+import argparse
+from sys import exit
+
+import libs.migrations as migrations
+
+def parse_params():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', type=str, default='workflow.db', help="Database file")
+    parser.add_argument('--plans', action='store_true', help="Only report the query plans, no changes")
+    args, unknown = parser.parse_known_args()
+    return args
+
+### Start
+print('Use example: db_migrate.py --db=workflow.db [--plans]')
+
+args = parse_params()
+db_migrations = migrations.migrations(args.db)
+
+if not args.plans:
+    applied = db_migrations.migrate()
+    for version, description in applied:
+        print('Applied version {}: {}'.format(version, description))
+    if applied == []:
+        print('Schema is up to date')
+
+regressions = 0
+for name, plan, uses_index in db_migrations.query_plans():
+    if uses_index is None:
+        status = 'skipped'
+    elif uses_index:
+        status = 'ok'
+    else:
+        status = 'TABLE SCAN'
+        regressions += 1
+    print('{}: {}'.format(name, status))
+    for line in plan:
+        print('    {}'.format(line))
+
+if regressions > 0:
+    print('{} queries do not use indexes'.format(regressions))
+    exit(1)
+print('Done')
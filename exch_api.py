@@ -12,8 +12,12 @@ from datetime import datetime
 
 # Config
 import config
+import libs.clientpool as clientpool
+import libs.retrypolicy as retrypolicy
+import libs.ratelimiter as ratelimiter
 
 ## Exchange libraries
+import requests
 # Bitmex: https://github.com/BitMEX/api-connectors/tree/master/official-http/python-swaggerpy
 import bitmex
 import bravado
@@ -28,6 +32,16 @@ import oandapyV20.endpoints.instruments as instruments
 import oandapyV20.endpoints.transactions as transactions
 import oandapyV20.endpoints.orders as orders
 
+# Exchange clients shared by the api instances of the process
+client_pool = clientpool.clientpool()
+
+# Retries and the circuit breaker (shared by the processes) for exchange requests
+retry_policy = retrypolicy.retrypolicy()
+circuit_breaker = retrypolicy.circuitbreaker()
+
+# Requests of all the processes go through the shared rate limiter, orders have the priority over status reads
+rate_limiter = ratelimiter.ratelimiter()
+order_functions = ['buylimit', 'selllimit', 'closepositions', 'cancel']
 
 
 class api(object):
@@ -75,32 +89,46 @@ class api(object):
         # Decimal precision
         decimal.getcontext().prec = 20
 
-        # Initialising clients with api keys: bitmex
-        if not config.use_testnet:
-            self.bitmex = bitmex.bitmex(
-                api_key=self.bitmex_apikey,
-                api_secret=self.bitmex_secret,
-                test=False)
-        else:
-            # Use this for testnet  #islobodch acc
-            print('(i) Note: using testnet - bitmex')
-            self.bitmex = bitmex.bitmex(
-                api_key = config.testnet_keys['key_bitmex'],
-                api_secret = config.testnet_keys['secret_bitmex'],
-                test=True)
-        
-        # Initialising clients with api keys: oanda
+        # Clients with api keys from the pool (reused while the keys are the same)
         if not config.use_testnet:
-            self.oanda = API(access_token = self.secret_id_oanda, environment='live')
+            self.bitmex = client_pool.get((user, 'standard', 'bitmex', False),
+                (self.bitmex_apikey, self.bitmex_secret), self.bitmex_client)
+            self.oanda = client_pool.get((user, 'traditional', 'oanda', False),
+                (self.key_id_oanda, self.secret_id_oanda), self.oanda_client)
             self.oanda_account_id = self.key_id_oanda
         else:
-            print('(i) Note: using testnet - oanda')
-            self.oanda = API(access_token = config.testnet_keys['secret_oanda'])
+            # Use this for testnet  #islobodch acc
+            print('(i) Note: using testnet - bitmex, oanda')
+            self.bitmex = client_pool.get((None, 'standard', 'bitmex', True),
+                (config.testnet_keys['key_bitmex'], config.testnet_keys['secret_bitmex']), self.bitmex_client)
+            self.oanda = client_pool.get((None, 'traditional', 'oanda', True),
+                (config.testnet_keys['key_oanda'], config.testnet_keys['secret_oanda']), self.oanda_client)
             self.oanda_account_id = config.testnet_keys['key_oanda']
 
+        # Accounts for the rate limits (exchanges limit the requests per api key), the user if there is no key
+        bitmex_account = config.testnet_keys['key_bitmex'] if config.use_testnet else self.bitmex_apikey
+        self.rate_limit_accounts = {
+            'bitmex': bitmex_account if bitmex_account is not None else user,
+            'oanda': self.oanda_account_id if self.oanda_account_id is not None else user
+        }
+        self.user = user
+
         # Contracts to use
         self.contracts_to_use = None
 
+        # Exchange adapters used by this instance
+        self.adapters = {}
+
+
+    # Clients (created by the pool)
+    def bitmex_client(self, credentials):
+        return bitmex.bitmex(api_key=credentials[0], api_secret=credentials[1], test=config.use_testnet)
+
+    def oanda_client(self, credentials):
+        if not config.use_testnet:
+            return API(access_token=credentials[1], environment='live')
+        else:
+            return API(access_token=credentials[1])
 
     # Returns the keys (or none) 
     def keys_select(self, user, strategy, exchange):
@@ -143,7 +171,7 @@ class api(object):
         else:
             return False
 
-    # Ticker
+    # Ticker, False if the market is not tradeable now (same as in oanda_tickers)
     def oanda_ticker(self, market):
         params={"instruments": market}
         request = pricing.PricingInfo(self.oanda_account_id, params=params)
@@ -152,7 +180,23 @@ class api(object):
             ticker = rv['closeoutBid']
             return Decimal(ticker)
         else: 
-            return None 
+            return False
+
+    # Tickers of several markets in one request: {market: price, False if not tradeable, None if not returned}
+    def oanda_tickers(self, markets):
+        params={"instruments": ','.join(markets)}
+        request = pricing.PricingInfo(self.oanda_account_id, params=params)
+        prices = {rv['instrument']: rv for rv in self.oanda.request(request)['prices']}
+        tickers = {}
+        for market in markets:
+            rv = prices.get(market)
+            if rv is None:
+                tickers[market] = None
+            elif rv['status'] == 'tradeable':
+                tickers[market] = Decimal(rv['closeoutBid'])
+            else:
+                tickers[market] = False
+        return tickers
 
     # Get instrument precision
     def oanda_precision(self, market):
@@ -329,7 +373,8 @@ class api(object):
 
             # Price may not be in the order (if trying out market orders for example)
             if 'price' not in list(order_info.keys()):
-                order_info['price'] = self.oanda_ticker(market)
+                price = self.oanda_ticker(market)
+                order_info['price'] = price if price is not False else None    # closed market: no price
 
             # On the platform filledTime in keys mean that the order was actually filled
             if 'filledTime' in list(order_info.keys()):
@@ -466,6 +511,18 @@ class api(object):
         ticker = self.bitmex.Trade.Trade_get(symbol=market, count=1, reverse=True).result()[0][0]['price']
         return Decimal(ticker)
 
+    # Tickers of several markets in one request (last price of the instruments): {market: price, None if not returned}
+    def bitmex_tickers(self, markets):
+        symbols = {self.market_std(market): market for market in markets}
+        rows = self.bitmex.Instrument.Instrument_get(filter=json.dumps({'symbol': list(symbols.keys())}),
+            columns=json.dumps(['lastPrice'])).result()[0]
+        prices = {row['symbol']: row['lastPrice'] for row in rows}
+        tickers = {}
+        for symbol, market in symbols.items():
+            price = prices.get(symbol)
+            tickers[market] = Decimal(str(price)) if price is not None else None
+        return tickers
+
     # Balance info
     def bitmex_get_balance(self, currency):
         output = {}  # to make consistent with the overall script
@@ -759,187 +816,65 @@ class api(object):
     ############################################################################
     # can also create a wrapper to check that this is not None (robot.py, coinigylib)
 
-    # A function returning try counters
-    def keep_trying(self, attempt, error):
-        attempt_continue = True
-        attempt +=1
-        attempt_limit = 200
-        sleep_time = 5
-
-        print("Retrying (full error):", error)
-        err_message = str(error)
-
-        time.sleep(sleep_time)
-        if attempt > attempt_limit:
-            print(("Terminating after {} tries. {}".format(attempt, err_message)))
-            attempt_continue = False
-
-        # If api key failure 
-        if (err_message.lower().find('invalid api key') >= 0) or (err_message.lower().find('unauthorized') >= 0):
-            print("Terminating because of the incorrect key")
-            attempt_continue = False     
-        
-        return attempt_continue, attempt
+    # Retry decision for a failed request: sleeps for the backoff and returns (continue, attempt)
+    def keep_trying(self, exchange, attempt, kind, error_msg):
+        if kind in retrypolicy.breaker_kinds:
+            circuit_breaker.record_failure(exchange)
+        if kind == 'auth':
+            print("Terminating because of the incorrect key:", error_msg)
+            return False, attempt
+        if not retry_policy.should_retry(attempt, kind):
+            if kind in retrypolicy.retry_kinds:
+                print(("Terminating after {} tries. {}".format(attempt + 1, error_msg)))
+            return False, attempt
+        print("Retrying ({}, full error):".format(kind), error_msg)
+        if circuit_breaker.is_open(exchange):
+            print("Terminating because {} is unavailable (circuit open)".format(exchange))
+            return False, attempt
+        time.sleep(retry_policy.delay(attempt, kind))
+        return True, attempt + 1
+
+    # Requests fail fast while the exchange is unavailable for all the processes
+    def circuit_closed(self, exchange):
+        if circuit_breaker.is_open(exchange):
+            print("(i) {} is unavailable (circuit open), not sending the request".format(exchange))
+            return False
+        return True
+
+    ### Adapter of the exchange (None if not supported), one instance per api
+    def adapter(self, exchange):
+        if exchange not in self.adapters:
+            adapter_class = exchange_adapters.get(exchange)
+            self.adapters[exchange] = adapter_class(self) if adapter_class is not None else None
+        return self.adapters[exchange]
+
+    # Account of the requests to the exchange for the rate limiter
+    def rate_limit_account(self, exchange):
+        return self.rate_limit_accounts.get(exchange, self.user)
 
-    ### Func wrapper
+    ### Func wrapper: the function of the exchange adapter, retried with the policy depending on the error
     def func_wrapper(self, func_name, exchange, market, param1=None, param2=None, param3=None):
+        adapter = self.adapter(exchange)
+        if adapter is None:
+            return None
+        function = getattr(adapter, func_name, None)
+        if function is None:    # not supported on the exchange
+            return None
 
-        tries, done = 0, False
-        while not done:
+        tries = 0
+        while self.circuit_closed(exchange):
             try:
-                ### Main functions block
-                if exchange not in ['bitmex', 'oanda']:
-                    result = None
-
-                # Get ticker
-                if func_name == 'is_market_open':
-                    if exchange == 'bitmex':
-                        result = True
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_market_hours(market)
-                        done = True
-
-                # Get ticker
-                if func_name == 'getticker':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_ticker(market)
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_ticker(market)
-                        done = True
-
-                # Getopenorders
-                if func_name == 'getopenorders':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_openorders(market)
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_openorders(market)
-                        done = True
-
-                # Cancel
-                if func_name == 'cancel':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_cancel(market, param1)
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_cancel(market, param1)
-                        done = True
-
-                # Getorderhistory
-                if func_name == 'getorderhistory':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_get_sell_ordhist(market)
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_get_sell_ordhist(market, param1)
-                        done = True
-
-                # Getorder
-                if func_name == 'getorder':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_get_order(market, param1)
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_get_order(market, param1)
-                        done = True
-
-                # Getbalance
-                if func_name == 'getbalance':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_get_balance(param1)
-                        done = True
-                    elif exchange == 'oanda':  # traditional market balance is always in fiat
-                        result = self.oanda_balance()
-                        done = True
-
-                # Getorderbook
-                if func_name == 'getorderbook':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_orderbook(market, param1)  # will process depending on the type
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_orderbook(market, param1)  # will process depending on the type
-                        done = True
-
-                # Getorderbook
-                if func_name == 'results_over_time':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_results_over_time(market, param1, param2)
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_results_over_time(market, param1, param2, lastid=param3)
-                        done = True
-
-                # Detailed trade hist
-                if func_name == 'detailed_trade_history':
-                    if exchange == 'bitmex':
-                        market = self.market_std(market)
-                        result = self.bitmex.Execution.Execution_getTradeHistory(symbol=market, reverse=True, count=500).result()[0]
-                        done = True
-
-                # Getpositions
-                if func_name == 'getpositions':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_openpositions(market)
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_getpositions(market)
-                        done = True
-
-                # Closepositions
-                if func_name == 'closepositions':
-                    if exchange == 'bitmex':
-                        result = self.bitmex_closepositions(param1, market, param2)
-                        done = True
-                    elif exchange == 'oanda':
-                        result = self.oanda_closepositions(param1, market, param2, short_flag=param3)
-                        done = True
-
-                # Cancel orders
-                if func_name == 'cancel_orders':
-                    if exchange in ['bitmex', 'oanda']:
-                        my_orders = self.getopenorders(exchange, market)
-                        if my_orders != '':
-                            for val in my_orders:
-                                print("Cancelling open order: {}, quantity {}, remaining {}, price {}".format(
-                                    val['OrderUuid'],
-                                    val['Quantity'],
-                                    val['QuantityRemaining'],
-                                    val['Price']))
-                                self.cancel(exchange, market, val['OrderUuid'])
-                        result = 'completed'
-                        done = True
-                        return result
-
-                # Return result for all cases
+                if func_name not in adapter.local_functions:
+                    rate_limiter.acquire(exchange, 'order' if func_name in order_functions else 'read',
+                        self.rate_limit_account(exchange))
+                result = function(market, param1, param2, param3)
+                circuit_breaker.record_success(exchange)
                 return result
-
-                ### End of main functions block
-
-            # Errors handled with bravado for bitmex
-            except  bravado.exception.HTTPError as error:
-                try: # cause this could be None
-                    error_msg = str(error.swagger_result['error']['message'])
-                except:
-                    error_msg = '\n---\n{}\n---'.format(str(error))
-                attempt_continue, tries = self.keep_trying(tries, error_msg)
+            except Exception as error:
+                kind, error_msg = adapter.classify_error(error)
+                attempt_continue, tries = self.keep_trying(exchange, tries, kind, error_msg)
                 if not attempt_continue:
                     return None
-            except V20Error as e:
-                # Errors 500, 503, 502, 504 are related to availability
-                if int(e.code) in [500, 502, 503, 504]:
-                    attempt_continue, tries = self.keep_trying(tries, e.msg)
-                    if not attempt_continue:
-                        return None
-                else:
-                    print(("Oanda exchange error {:d} {:s}".format(e.code, e.msg)))
-                    return None
-            except:
-                err_msg = traceback.format_exc()
-                print(("Different error occured: {}".format(err_msg)))
-                return None
 
     ### Functions mapped to the wrapper
     # Market hours
@@ -950,6 +885,11 @@ class api(object):
     def getticker(self, exchange, market):
         return self.func_wrapper('getticker', exchange, market)
 
+    # Price tickers of several markets of the exchange in one request: {market: price}
+    # False for markets which are not tradeable now (oanda), None if there is no price
+    def gettickers(self, exchange, markets):
+        return self.func_wrapper('gettickers', exchange, markets)
+
     # Open orders
     def getopenorders(self, exchange, market):
         return self.func_wrapper('getopenorders', exchange, market)
@@ -999,47 +939,32 @@ class api(object):
 
     # Limit sell order
     def selllimit(self, exchange, market, sell_q_step, price_to_sell, contracts=None, postonly=False):
-        tries, done = 0, False
+        return self.order_wrapper('selllimit', exchange, market, sell_q_step, price_to_sell, contracts, postonly)
+
+    # Limit buy order
+    def buylimit(self, exchange, market, quantity, buy_rate, contracts=None, postonly=False):
+        return self.order_wrapper('buylimit', exchange, market, quantity, buy_rate, contracts, postonly)
+
+    # Orders are retried as other functions, in addition the number of contracts is decreased on balance errors
+    def order_wrapper(self, func_name, exchange, market, quantity, rate, contracts, postonly):
+        adapter = self.adapter(exchange)
+        if adapter is None:     # not supported exchange
+            return None
         if self.contracts_to_use is None:
             self.contracts_to_use = contracts
-        while not done:
+
+        tries = 0
+        while self.circuit_closed(exchange):
             try:
-                if exchange == 'bitmex':
-                    if not postonly:
-                        result = self.bitmex_selllimit(market, sell_q_step, price_to_sell, self.contracts_to_use, postonly)
-                        done = True
-                        self.contracts_to_use = None
-                        return result
-                    else:   # going into a pricing cycle in postonly
-                        tick = self.bitmex_ticksize(market)
-                        print("(i) ticksize:", tick)
-                        print("(i) price", price_to_sell)   
-                        pricing_cycle = True
-                        while pricing_cycle:
-                            result = self.bitmex_selllimit(market, sell_q_step, price_to_sell, self.contracts_to_use, postonly)
-                            if type(result) != type('str'):
-                                if result['ordStatus'] == 'Canceled':
-                                    print('(i) order canceled because of post-only flag')
-                                    price_to_sell += tick
-                                    print('(i) price changed to:', price_to_sell)
-                                else:
-                                    pricing_cycle = False
-                                time.sleep(1)
-                        done = True
-                        self.contracts_to_use = None
-                        return result
-                elif exchange == 'oanda': # traditional market - there is no post-only there 
-                    result = self.oanda_selllimit(market, sell_q_step, price_to_sell, postonly_flag=postonly)
-                    done = True
-                    return result         
-                else:   # not supported exchange
+                rate_limiter.acquire(exchange, 'order', self.rate_limit_account(exchange))
+                result = getattr(adapter, func_name)(market, quantity, rate, self.contracts_to_use, postonly)
+                circuit_breaker.record_success(exchange)
+                self.contracts_to_use = None
+                return result
+            except Exception as error:
+                kind, error_msg = adapter.classify_error(error)
+                if kind not in retrypolicy.retry_kinds:
                     return None
-            # Errors handled with bravado for bitmex
-            except  bravado.exception.HTTPError as error:
-                try: # cause this could be None
-                    error_msg = str(error.swagger_result['error']['message'])
-                except:
-                    error_msg = '\n---\n{}\n---'.format(str(error))
 
                 # Could be related to the balance due to prices switching. decrease contracts then and trying again
                 if (error_msg.lower().find('available balance') >= 0) or (error_msg.lower().find('invalid order') >= 0):
@@ -1050,99 +975,199 @@ class api(object):
                     return None
 
                 # Check attempts to continue
-                attempt_continue, tries = self.keep_trying(tries, error_msg)
+                attempt_continue, tries = self.keep_trying(exchange, tries, kind, error_msg)
                 if not attempt_continue:
                     return None
 
-            # Errors handling for OANDA
-            except V20Error as e:
-                # Errors 500, 503, 502, 504 are related to availability
-                if int(e.code) in [500, 502, 503, 504]:
-                    attempt_continue, tries = self.keep_trying(tries, e.msg)
-                    if not attempt_continue:
-                        return None
-                else:
-                    print(("Oanda exchange error {:d} {:s}".format(e.code, e.msg)))
-                    return None
 
-            # Other unknown error
+### Exchange adapters
+# An adapter implements the wrapper functions of one exchange: func_name(market, param1, param2, param3) as called
+# by func_wrapper, buylimit / selllimit(market, quantity, rate, contracts, postonly) and classify_error.
+# Functions an adapter does not have are not supported on the exchange (None is returned)
+# New venues are added with register_adapter(exchange, adapter_class)
+exchange_adapters = {}
+
+def register_adapter(exchange, adapter_class):
+    exchange_adapters[exchange] = adapter_class
+
+
+class exchange_adapter(object):
+    local_functions = ['cancel_orders']     # functions which do not send requests themselves (not rate limited)
+
+    def __init__(self, api):
+        self.api = api
+
+    # Returns (kind, error message), kinds are in retrypolicy. Connection problems are treated as unavailability,
+    # other unknown errors are not retried
+    def classify_error(self, error):
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return 'unavailable', str(error)
+        err_msg = traceback.format_exc()
+        print(("Different error occured: {}".format(err_msg)))
+        return 'fatal', err_msg
+
+    def cancel_orders(self, market, param1=None, param2=None, param3=None):
+        my_orders = self.api.getopenorders(self.exchange, market)
+        if my_orders != '':
+            for val in my_orders:
+                print("Cancelling open order: {}, quantity {}, remaining {}, price {}".format(
+                    val['OrderUuid'],
+                    val['Quantity'],
+                    val['QuantityRemaining'],
+                    val['Price']))
+                self.api.cancel(self.exchange, market, val['OrderUuid'])
+        return 'completed'
+
+
+class bitmex_adapter(exchange_adapter):
+    exchange = 'bitmex'
+    local_functions = ['cancel_orders', 'is_market_open']
+
+    # Errors handled with bravado for bitmex
+    def classify_error(self, error):
+        if isinstance(error, bravado.exception.HTTPError):
+            try: # cause this could be None
+                error_msg = str(error.swagger_result['error']['message'])
             except:
-                err_msg = traceback.format_exc()
-                print(("Different error occured: {}".format(err_msg)))
-                return None
-                    
-    # Limit buy order
-    def buylimit(self, exchange, market, quantity, buy_rate, contracts=None, postonly=False):
+                error_msg = '\n---\n{}\n---'.format(str(error))
+            status_code = getattr(error, 'status_code', None)
+            if status_code == 429:
+                return 'rate_limit', error_msg
+            if status_code in [500, 502, 503, 504]:
+                return 'unavailable', error_msg
+            if (status_code in [401, 403] or error_msg.lower().find('invalid api key') >= 0
+                    or error_msg.lower().find('unauthorized') >= 0):
+                return 'auth', error_msg
+            return 'request', error_msg
+        return exchange_adapter.classify_error(self, error)
+
+    def is_market_open(self, market, param1=None, param2=None, param3=None):
+        return True
+
+    def getticker(self, market, param1=None, param2=None, param3=None):
+        return self.api.bitmex_ticker(market)
+
+    def gettickers(self, markets, param1=None, param2=None, param3=None):
+        return self.api.bitmex_tickers(markets)
+
+    def getopenorders(self, market, param1=None, param2=None, param3=None):
+        return self.api.bitmex_openorders(market)
+
+    def cancel(self, market, orderid, param2=None, param3=None):
+        return self.api.bitmex_cancel(market, orderid)
+
+    def getorderhistory(self, market, lastid=None, param2=None, param3=None):
+        return self.api.bitmex_get_sell_ordhist(market)
+
+    def getorder(self, market, item, param2=None, param3=None):
+        return self.api.bitmex_get_order(market, item)
+
+    def getbalance(self, market, currency, param2=None, param3=None):
+        return self.api.bitmex_get_balance(currency)
+
+    def getorderbook(self, market, type, param2=None, param3=None):
+        return self.api.bitmex_orderbook(market, type)     # will process depending on the type
+
+    def results_over_time(self, market, timestamp_from, timestamp_to, lastid=None):
+        return self.api.bitmex_results_over_time(market, timestamp_from, timestamp_to)
+
+    def detailed_trade_history(self, market, param1=None, param2=None, param3=None):
+        market = self.api.market_std(market)
+        return self.api.bitmex.Execution.Execution_getTradeHistory(symbol=market, reverse=True, count=500).result()[0]
+
+    def getpositions(self, market, do_retry=None, param2=None, param3=None):
+        return self.api.bitmex_openpositions(market)
+
+    def closepositions(self, market, positions, price, short_flag=None):
+        return self.api.bitmex_closepositions(positions, market, price)
+
+    def selllimit(self, market, quantity, rate, contracts, postonly):
+        return self.limit_order(self.api.bitmex_selllimit, market, quantity, rate, contracts, postonly, 1)
+
+    def buylimit(self, market, quantity, rate, contracts, postonly):
+        return self.limit_order(self.api.bitmex_buylimit, market, quantity, rate, contracts, postonly, -1)
+
+    # Post-only orders go into a pricing cycle: the price is moved by a tick (direction) while the order is canceled
+    def limit_order(self, order_function, market, quantity, rate, contracts, postonly, direction):
+        if not postonly:
+            return order_function(market, quantity, rate, contracts, postonly)
+
+        tick = self.api.bitmex_ticksize(market)
+        print("(i) ticksize:", tick)
+        print("(i) price", rate)
+        pricing_cycle = True
+        while pricing_cycle:
+            result = order_function(market, quantity, rate, contracts, postonly)
+            if type(result) != type('str'):
+                if result['ordStatus'] == 'Canceled':
+                    print('(i) order canceled because of post-only flag')
+                    rate += tick * direction
+                    print('(i) price changed to:', rate)
+                else:
+                    pricing_cycle = False
+                time.sleep(1)
+        return result
 
-        tries, done = 0, False
-        if self.contracts_to_use is None:
-            self.contracts_to_use = contracts
-        while not done:
-            try:
-                if exchange == 'bitmex':
-                    if not postonly:
-                        result = self.bitmex_buylimit(market, quantity, buy_rate, self.contracts_to_use, postonly)
-                        done = True
-                        self.contracts_to_use = None
-                        return result
-                    else:   # going into a pricing cycle in postonly
-                        tick = self.bitmex_ticksize(market)
-                        print("(i) ticksize:", tick)
-                        print("(i) price", buy_rate)                      
-                        pricing_cycle = True
-                        while pricing_cycle:
-                            result = self.bitmex_buylimit(market, quantity, buy_rate, contracts, postonly)
-                            if type(result) != type('str'):
-                                if result['ordStatus'] == 'Canceled':
-                                    print('(i) order canceled because of post-only flag')
-                                    buy_rate -= tick
-                                    print('(i) price changed to:', buy_rate)
-                                else:
-                                    pricing_cycle = False
-                                time.sleep(1)
-                        done = True
-                        self.contracts_to_use = None
-                        return result
-                elif exchange == 'oanda': # traditional market - there is no post-only there 
-                    result = self.oanda_buylimit(market, quantity, buy_rate, postonly_flag=postonly)
-                    done = True
-                    return result                            
-                else:   # not supported exchange
-                    return None
 
-            # Errors handled with bravado for bitmex
-            except  bravado.exception.HTTPError as error:
-                try: # cause this could be None
-                    error_msg = str(error.swagger_result['error']['message'])
-                except:
-                    error_msg = '\n---\n{}\n---'.format(str(error))
+class oanda_adapter(exchange_adapter):
+    exchange = 'oanda'
 
-                # Could be related to the balance due to prices switching. decrease contracts then and trying again
-                if (error_msg.lower().find('available balance') >= 0) or (error_msg.lower().find('invalid order') >= 0):
-                    self.contracts_to_use = int(self.contracts_to_use * 0.98)
-                    print('(i) decreased the number of contracts to', self.contracts_to_use)
-                # until the decreased quantity is zero
-                if self.contracts_to_use == 0:
-                    return None
+    # Errors 500, 503, 502, 504 are related to availability
+    def classify_error(self, error):
+        if isinstance(error, V20Error):
+            if int(error.code) in [500, 502, 503, 504]:
+                return 'unavailable', error.msg
+            if int(error.code) == 429:
+                return 'rate_limit', error.msg
+            print(("Oanda exchange error {:d} {:s}".format(error.code, error.msg)))
+            if int(error.code) in [401, 403]:
+                return 'auth', error.msg
+            return 'fatal', error.msg
+        return exchange_adapter.classify_error(self, error)
 
-                # Check attempts to continue
-                attempt_continue, tries = self.keep_trying(tries, error_msg)
-                if not attempt_continue:
-                    return None
+    def is_market_open(self, market, param1=None, param2=None, param3=None):
+        return self.api.oanda_market_hours(market)
 
-            # Errors handling for OANDA
-            except V20Error as e:
-                # Errors 500, 503, 502, 504 are related to availability
-                if int(e.code) in [500, 502, 503, 504]:
-                    attempt_continue, tries = self.keep_trying(tries, e.msg)
-                    if not attempt_continue:
-                        return None
-                else:
-                    print(("Oanda exchange error {:d} {:s}".format(e.code, e.msg)))
-                    return None
+    def getticker(self, market, param1=None, param2=None, param3=None):
+        return self.api.oanda_ticker(market)
 
-            # Other unknown error
-            except:
-                err_msg = traceback.format_exc()
-                print(("Different error occured: {}".format(err_msg)))
-                return None
+    def gettickers(self, markets, param1=None, param2=None, param3=None):
+        return self.api.oanda_tickers(markets)
+
+    def getopenorders(self, market, param1=None, param2=None, param3=None):
+        return self.api.oanda_openorders(market)
+
+    def cancel(self, market, orderid, param2=None, param3=None):
+        return self.api.oanda_cancel(market, orderid)
+
+    def getorderhistory(self, market, lastid, param2=None, param3=None):
+        return self.api.oanda_get_sell_ordhist(market, lastid)
+
+    def getorder(self, market, item, param2=None, param3=None):
+        return self.api.oanda_get_order(market, item)
+
+    def getbalance(self, market, currency=None, param2=None, param3=None):
+        return self.api.oanda_balance()    # traditional market balance is always in fiat
+
+    def getorderbook(self, market, type, param2=None, param3=None):
+        return self.api.oanda_orderbook(market, type)  # will process depending on the type
+
+    def results_over_time(self, market, timestamp_from, timestamp_to, lastid=0):
+        return self.api.oanda_results_over_time(market, timestamp_from, timestamp_to, lastid=lastid)
+
+    def getpositions(self, market, do_retry=None, param2=None, param3=None):
+        return self.api.oanda_getpositions(market)
+
+    def closepositions(self, market, positions, price, short_flag=None):
+        return self.api.oanda_closepositions(positions, market, price, short_flag=short_flag)
+
+    # Traditional market - there is no post-only there
+    def selllimit(self, market, quantity, rate, contracts, postonly):
+        return self.api.oanda_selllimit(market, quantity, rate, postonly_flag=postonly)
+
+    def buylimit(self, market, quantity, rate, contracts, postonly):
+        return self.api.oanda_buylimit(market, quantity, rate, postonly_flag=postonly)
+
+
+register_adapter('bitmex', bitmex_adapter)
+register_adapter('oanda', oanda_adapter)
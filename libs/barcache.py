@@ -0,0 +1,95 @@
+from collections import OrderedDict
+import _thread
+
+import pandas as pd
+import numpy as np
+
+# OHLC bars cache shared by tdlib calls
+# Key: (market, exchange, period, price_base, timezone shift). Bars are kept as arrays (bar start in ns of local time,
+# float32 open / high / low / close), extended with the ticks which arrived since the last call
+# and evicted in least recently used order when the memory cap is reached
+class barcache(object):
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = _thread.allocate_lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)['nbytes']
+            entry['nbytes'] = sum(entry[column].nbytes for column in ['index', 'open', 'high', 'low', 'close'])
+            self.entries[key] = entry
+            self.nbytes += entry['nbytes']
+            # Least recently used first; the entry just added stays
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last = False)
+                self.nbytes -= evicted['nbytes']
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.nbytes = 0
+
+    ### Conversions
+    # Entry from resampled bars. The number of bars is kept the same when the entry is extended
+    def entry_from_bars(self, bars, last_tick_time, binary = False):
+        return {
+            'index': bars.index.values.astype('datetime64[ns]').astype('int64'),
+            'open': bars['open'].values.astype('float32'),
+            'high': bars['high'].values.astype('float32'),
+            'low': bars['low'].values.astype('float32'),
+            'close': bars['close'].values.astype('float32'),
+            'max_bars': len(bars.index),
+            'last_tick_time': last_tick_time,
+            'binary': binary
+        }
+
+    # Bars dataframe (new arrays so that the caller can add columns or change values)
+    def to_frame(self, entry):
+        index = pd.DatetimeIndex(entry['index'].astype('datetime64[ns]'), name = 'timestamp')
+        bars = pd.DataFrame({column: entry[column].copy() for column in ['open', 'high', 'low', 'close']}, index = index)
+        return bars[['open', 'high', 'low', 'close']]
+
+    # Adding bars resampled from new ticks. Returns None if the bars do not fit the grid (the entry should be rebuilt)
+    def extend(self, entry, bars, last_tick_time, period_ns, remove_nans = False):
+        entry = dict(entry, last_tick_time = last_tick_time)
+        if len(bars.index) == 0:
+            return entry
+
+        new = self.entry_from_bars(bars, last_tick_time)
+        shift = new['index'][0] - entry['index'][-1]
+        if shift < 0 or shift % period_ns != 0:
+            return None
+
+        # Current bar continues
+        if shift == 0:
+            last = {column: entry[column].copy() for column in ['open', 'high', 'low', 'close']}
+            if np.isnan(last['open'][-1]):
+                last['open'][-1] = new['open'][0]
+            last['high'][-1] = np.fmax(last['high'][-1], new['high'][0])
+            last['low'][-1] = np.fmin(last['low'][-1], new['low'][0])
+            if not np.isnan(new['close'][0]):
+                last['close'][-1] = new['close'][0]
+            entry.update(last)
+            for column in ['index', 'open', 'high', 'low', 'close']:
+                new[column] = new[column][1:]
+        # Empty bars in between
+        elif shift > period_ns and not remove_nans:
+            empty_no = int(shift // period_ns) - 1
+            empty_index = entry['index'][-1] + period_ns * np.arange(1, empty_no + 1, dtype = 'int64')
+            new['index'] = np.concatenate([empty_index, new['index']])
+            for column in ['open', 'high', 'low', 'close']:
+                new[column] = np.concatenate([np.full(empty_no, np.nan, dtype = 'float32'), new[column]])
+
+        for column in ['index', 'open', 'high', 'low', 'close']:
+            entry[column] = np.concatenate([entry[column], new[column]])[-entry['max_bars']:]
+        return entry
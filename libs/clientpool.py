@@ -0,0 +1,27 @@
+import threading
+
+# Exchange clients shared in the process, keyed by (user, strategy, exchange, testnet)
+# Creating a client is expensive (bitmex downloads and parses the swagger spec, both open new http sessions),
+# so clients are reused by every exch_api.api of the user and keep their connections alive. An entry is created
+# again only when the keys change (e.g. after /keys_update), which is noticed when the keys read from the db
+# differ from the ones the client was made with
+class clientpool(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}   # key: [credentials, client]
+
+    # Client for the key, factory(credentials) creates one if there is none or the credentials are different
+    def get(self, key, credentials, factory):
+        with self.lock:
+            entry = self.clients.get(key)
+            if entry is None or entry[0] != credentials:
+                entry = [credentials, factory(credentials)]
+                self.clients[key] = entry
+            return entry[1]
+
+    # Dropping the clients of a user (or all)
+    def invalidate(self, user = None):
+        with self.lock:
+            for key in list(self.clients.keys()):
+                if user is None or str(key[0]) == str(user):
+                    del self.clients[key]
@@ -75,13 +75,10 @@ class coinigy(object):
     ### Price data from DB
     def price_db_read(self, ticker):
         db_ticker = None
-        sql_string = "SELECT last_update, price FROM market_info WHERE market = '{}'".format(ticker.upper())
-        #print(">>>", sql_string)
-
-        rows = sql.query(sql_string)
-        if rows != []:
-            last_updated = rows[0][0]
-            db_ticker = float(rows[0][1])
+        info = sql.market_info(ticker.upper())
+        if info is not None:
+            last_updated = info['last_update']
+            db_ticker = float(info['price'])
             diff = (time()-last_updated)/60
 
             # Check time
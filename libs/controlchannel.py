@@ -0,0 +1,44 @@
+import os
+import time
+
+import config
+
+# Wake-ups for robots when a control flag is changed (Telegram abort / close / buyback stop)
+# The flags themselves stay in the db. The daemon touches a file per user in the control folder after setting
+# a flag and robots of the user wait on the file modification time instead of sleeping, so they check the flags
+# right away instead of at the next sleep_timer tick
+class controlchannel(object):
+    def __init__(self, folder = None):
+        self.folder = folder if folder is not None else config.control_folder
+        self.poll = config.control_poll    # seconds between checks of the file while waiting
+
+    def filename(self, user_id):
+        return os.path.join(self.folder, 'user_{}'.format(user_id))
+
+    def mtime(self, user_id):
+        try:
+            return os.stat(self.filename(user_id)).st_mtime_ns
+        except OSError:
+            return None
+
+    # Notify the robots of a user (called after the flags are updated in the db)
+    def notify(self, user_id):
+        try:
+            os.makedirs(self.folder, exist_ok = True)
+            with open(self.filename(user_id), 'a'):
+                pass
+            os.utime(self.filename(user_id), None)
+        except OSError as e:
+            print('Control notification failed: {}'.format(e))
+
+    # Sleep for up to the number of seconds. Returns True if woken up by a notification
+    def wait(self, user_id, seconds):
+        time_end = time.time() + seconds
+        mtime_start = self.mtime(user_id)
+        while True:
+            time_left = time_end - time.time()
+            if time_left <= 0:
+                return False
+            time.sleep(min(self.poll, time_left))
+            if self.mtime(user_id) != mtime_start:
+                return True
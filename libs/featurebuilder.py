@@ -0,0 +1,182 @@
+import time as t
+
+import pandas as pd
+import numpy as np
+
+import backtest
+from libs.tdstream import tdstream
+
+# Resampling
+import libs.resampler as resampler
+bars_resampler = resampler.resampler()
+
+# Binary / csv price logs
+import libs.pricelog as pricelog
+price_log = pricelog.pricelog()
+
+# Bulk features for ML (labels_generated rows) for many data points at once
+# Ticks are read once, each period is resampled once over the full history and TD / RSI / MA are moved forward
+# through the bars with a stream. For every data point the current (not closed) bar is built from the ticks up to
+# the point, the same as stats() with tail = 2 gives when run at the point, so the values are joined as of the point
+class featurebuilder(object):
+    def __init__(self, td_info, exchange, market, period_arr = ['1h', '4h', '1d'], ma_periods = [30, 20, 10]):
+        self.td_info = td_info
+        self.exchange = exchange
+        self.market = market
+        self.period_arr = period_arr
+        self.ma_periods = ma_periods
+        self.remove_nans = td_info.is_traditional(exchange)
+
+    # Ticks up to the timestamp from the price log (nans removed)
+    def read_ticks(self, timestamp_until):
+        filename = self.td_info.filename_define(self.market, self.exchange)
+        _, _, timestamps, prices = price_log.csv_window(filename, 0, timestamp_until)
+        use = ~np.isnan(prices)
+        return timestamps[use], prices[use].astype('float32')
+
+    # Bars timezone shift and base depend on DST at the point: points are grouped by (shift, bases)
+    def points_settings(self, timestamps):
+        b_test = backtest.backtesting()
+        settings = []
+        for timestamp in timestamps:
+            b_test._curr_time = timestamp
+            price_bases = tuple([self.td_info.get_period(period, b_test) for period in self.period_arr])
+            settings.append((b_test.timedelta_str, price_bases))
+        return settings
+
+    # Current bar of every point: position of the bar in bars, its start and open / high / low / close so far
+    def current_bars(self, local_ns, prices, ticks_no, bars_index, period_ns, offset_ns):
+        first, bins = bars_resampler.bins(local_ns, period_ns, offset_ns)
+        bin_starts = first + bins * period_ns
+        highs = pd.Series(prices).groupby(bins).cummax().values
+        lows = pd.Series(prices).groupby(bins).cummin().values
+
+        last_ticks = ticks_no - 1    # last tick up to the point
+        current_starts = bin_starts[last_ticks]
+        open_ticks = np.searchsorted(bin_starts, current_starts, side = 'left')
+        positions = np.searchsorted(bars_index, current_starts, side = 'left')
+        return (positions, current_starts, prices[open_ticks], highs[last_ticks], lows[last_ticks], prices[last_ticks])
+
+    # Features of one period for the points (list of dicts, None if the point should be skipped)
+    def period_features(self, period, local_ns, prices, ticks_no, offset_ns, date_points):
+        period_ns = self.td_info.period_seconds(period)[0] * 10**9
+        bars = bars_resampler.ohlc(local_ns[:ticks_no.max()], prices[:ticks_no.max()], period_ns, offset_ns,
+            remove_nans = self.remove_nans)
+        bars_index = bars.index.values.astype('datetime64[ns]').astype('int64')
+        positions, starts, opens, highs, lows, closes = self.current_bars(
+            local_ns, prices, ticks_no, bars_index, period_ns, offset_ns)
+
+        stream = tdstream(self.td_info, self.market, self.exchange, period, short_flag = True,
+            history = max(self.ma_periods) + 5)
+        closed_no = None
+        results = []
+        for i, date_point in enumerate(date_points):
+            position = int(positions[i])
+            if position < 6:    # not enough bars for TD
+                results.append(None)
+                continue
+
+            # Moving the stream forward through the bars closed by now
+            if closed_no is None:
+                stream.prime_bars(bars.iloc[:position + 1])
+                closed_no = position
+            while closed_no < position:
+                bar = bars.iloc[closed_no]
+                stream.close_bar([bars_index[closed_no] / 10**9,
+                    float(bar['open']), float(bar['high']), float(bar['low']), float(bar['close'])])
+                closed_no += 1
+
+            # Checks for 1H: the last bar should be the one of the point
+            bar_start = pd.Timestamp(int(starts[i]))
+            if period == '1h' and (bar_start.hour != date_point.hour or bar_start.day != date_point.day):
+                print('(i) skipping because of incomplete data: D{}-H{} vs index D{}-H{}'.format(
+                    date_point.day, date_point.hour, bar_start.day, bar_start.hour))
+                results.append(None)
+                continue
+
+            row, _, _ = stream.bar_values([starts[i] / 10**9,
+                float(opens[i]), float(highs[i]), float(lows[i]), float(closes[i])])
+            results.append(self.row_features(row, stream.rows, stream.columns))
+
+        return results
+
+    # Same values as df_perc_calc for the current bar and the previous one
+    def row_features(self, row, rows, columns):
+        values = dict(zip(columns, row))
+        previous = dict(zip(columns, rows[-1]))
+        # Prices are float32 in bars, the ratios are calculated the same way
+        close, high, low, previous_close = [np.float32(value) for value in
+            [values['close'], values['high'], values['low'], previous['close']]]
+
+        features = {
+            'rsi': values['rsi'],
+            'td_setup': values['td_setup'],
+            'td_direction': int(values['td_direction'] == 'green'),   # 1 for green, 0 for red
+            'if_countdown_down': values['if_countdown_down'],
+            'if_countdown_up': values['if_countdown_up'],
+            'countdown_up': values['countdown_up'],
+            'countdown_down': values['countdown_down']
+        }
+
+        # Moving averages including the current bar (nan if there is a nan in the window, as rolling mean does)
+        last_closes = [r[4] for r in list(rows)[-(max(self.ma_periods) - 1):]] + [values['close']]
+        for maperiod in self.ma_periods:
+            if len(last_closes) >= maperiod:
+                features['ma_{}'.format(maperiod)] = np.mean(last_closes[-maperiod:])
+            else:
+                features['ma_{}'.format(maperiod)] = np.float64(np.nan)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            features['close_percent_change'] = 100*(close - previous_close)/close
+            features['rsi_percent_change'] = 100*(values['rsi'] - previous['rsi'])/values['rsi']
+            features['high_to_close'] = high/close
+            features['low_to_close'] = low/close
+            for maperiod in sorted(self.ma_periods):
+                features['close_to_ma{}'.format(maperiod)] = close/features['ma_{}'.format(maperiod)]
+        return features
+
+    # labels_generated rows for the data points (datetimes in local time of the machine, as in backtests)
+    def build(self, date_points):
+        point_timestamps = np.array([t.mktime(date_point.timetuple()) for date_point in date_points])
+        timestamps, prices = self.read_ticks(point_timestamps.max())
+        ticks_no = np.searchsorted(timestamps, point_timestamps, side = 'right')
+
+        settings = self.points_settings(point_timestamps)
+        results = {period: [None] * len(date_points) for period in self.period_arr}
+        for setting in sorted(set(settings)):
+            timedelta_str, price_bases = setting
+            points = np.array([i for i, point_setting in enumerate(settings) if point_setting == setting and ticks_no[i] > 0])
+            if points.size == 0:
+                continue
+            local_ns = bars_resampler.local_ns(timestamps, pd.Timedelta(timedelta_str).value)
+            for period, price_base in zip(self.period_arr, price_bases):
+                print("Settings {}, period {}: {} points".format(setting, period, points.size))
+                features = self.period_features(period, local_ns, prices, ticks_no[points],
+                    self.td_info.period_offset_ns(period, price_base), [date_points[i] for i in points])
+                for i, point_features in zip(points, features):
+                    results[period][i] = point_features
+
+        # Joining the periods, the point is skipped if any period is missing
+        rows, index = [], []
+        for i, date_point in enumerate(date_points):
+            if any(results[period][i] is None for period in self.period_arr):
+                continue
+            row = {}
+            for period in self.period_arr:
+                for column, value in results[period][i].items():
+                    row['{}_{}'.format(column, period)] = value
+            rows.append(row)
+            index.append(date_point)
+
+        columns = ['{}_{}'.format(column, period) for period in self.period_arr for column in self.columns()]
+        features = pd.DataFrame(rows, index = pd.Index(index, name = 'timestamp'), columns = columns)
+        features['exchange'] = self.exchange
+        features['market'] = self.market
+        return features
+
+    # Columns of one period in the order of item_analyse
+    def columns(self):
+        ma_columns = ['ma_{}'.format(maperiod) for maperiod in self.ma_periods]
+        close_to_ma = ['close_to_ma{}'.format(maperiod) for maperiod in sorted(self.ma_periods)]
+        return (['rsi', 'td_setup', 'td_direction', 'if_countdown_down', 'if_countdown_up', 'countdown_up', 'countdown_down']
+            + ma_columns + ['close_percent_change', 'rsi_percent_change', 'high_to_close', 'low_to_close'] + close_to_ma)
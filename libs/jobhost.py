@@ -0,0 +1,120 @@
+import os
+import gc
+import sys
+import time
+import random
+import signal
+import traceback
+
+import config
+
+# Host for many robot jobs started from one process (robot_host.py) instead of a terminal with python per job
+# The host imports the robot with its libraries (pandas, xgboost, tdlib, exchange clients code) once and starts
+# every job as a fork of itself: the job starts right away without the imports and the memory of the loaded
+# libraries is shared by all the jobs (copy on write), so each job only adds the memory of its own data.
+# Jobs stay separate processes: an error or exit() in a job does not affect the others, and prices, rate limits,
+# the circuit breaker and control flags are already shared between processes through the db and the files.
+# Jobs are submitted as files with the launch parameters (same as for robot.py) to the queue folder
+class jobhost(object):
+    def __init__(self, folder = None):
+        self.folder = folder if folder is not None else config.job_host_folder
+        self.poll = config.job_host_poll            # seconds between the checks of the queue
+        self.max_jobs = config.job_host_max_jobs    # running jobs, new ones wait in the queue
+        self.jobs = {}      # pid: command
+        self.stopping = False
+
+    # Adding a job to the queue (daemon, restart_jobs), command is the robot.py parameters
+    def submit(self, command):
+        try:
+            os.makedirs(self.folder, exist_ok = True)
+            filename = os.path.join(self.folder, '{}_{}.job'.format(time.time_ns(), os.getpid()))
+            with open(filename + '.tmp', 'w') as f:
+                f.write(command)
+            os.replace(filename + '.tmp', filename)     # the host only sees complete files
+            return True
+        except OSError as e:
+            print('Job submit failed: {}'.format(e))
+            return False
+
+    # Commands waiting in the queue, oldest first
+    def queued(self):
+        try:
+            filenames = sorted([name for name in os.listdir(self.folder) if name.endswith('.job')])
+        except OSError:
+            return []
+        return [os.path.join(self.folder, name) for name in filenames]
+
+    def start(self, command, target):
+        sys.stdout.flush()  # otherwise the output buffered so far would be printed by the job too
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid != 0:
+            self.jobs[pid] = command
+            return pid
+
+        # Job process: own session (Ctrl-C or closing the host terminal does not stop the job),
+        # default signal handling and own random state (retry and rate limit jitter)
+        exit_code = 0
+        try:
+            os.setsid()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            random.seed()
+            target(command)
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 0
+        except BaseException:
+            print('Job "{}" failed: {}'.format(command, traceback.format_exc()))
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    # Collecting finished jobs
+    def reap(self):
+        while self.jobs != {}:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.jobs = {}
+                return
+            if pid == 0:
+                return
+            command = self.jobs.pop(pid, None)
+            print('Job finished (pid {}, exit code {}): {}'.format(pid, os.waitstatus_to_exitcode(status), command))
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    # Main loop: starting the queued jobs with target(command) in forks until stopped (SIGTERM / Ctrl-C)
+    # Running jobs keep working when the host stops and are not restarted by the next host
+    def run(self, target):
+        if not hasattr(os, 'fork'):
+            print('Job host needs fork (not available on this platform), use robot.py per job')
+            return
+        signal.signal(signal.SIGTERM, self.stop)
+        os.makedirs(self.folder, exist_ok = True)
+
+        # Objects loaded so far are moved out of the garbage collector so that its passes in the jobs
+        # do not write to (and copy) the pages shared with the host
+        gc.collect()
+        gc.freeze()
+        print('Job host started (pid {}), queue: {}'.format(os.getpid(), self.folder))
+
+        try:
+            while not self.stopping:
+                self.reap()
+                for filename in self.queued()[:max(self.max_jobs - len(self.jobs), 0)]:
+                    try:
+                        with open(filename) as f:
+                            command = f.read().strip()
+                        os.remove(filename)
+                    except OSError:
+                        continue
+                    if command != '':
+                        pid = self.start(command, target)
+                        print('Job started (pid {}, running {}): {}'.format(pid, len(self.jobs), command))
+                time.sleep(self.poll)
+        except KeyboardInterrupt:
+            pass
+        print('Job host stopped, running jobs: {}'.format(len(self.jobs)))
@@ -0,0 +1,135 @@
+import sqlite3 as lite
+
+# Versioned schema changes for workflow.db. The applied version is kept in PRAGMA user_version
+# Indexes are defined per table: tables created later by pandas to_sql (td_stats, labels_generated) get them
+# when migrate() is run again, as index creation is skipped while the table does not exist
+indexes = [
+    # table, index name, columns, unique
+    ['td_stats', 'ix_td_stats_market_period_timestamp', ['market', 'period', 'timestamp'], False],
+    ['labels_generated', 'ix_labels_generated_market_exchange_timestamp', ['market', 'exchange', 'timestamp'], False],
+    ['jobs', 'ix_jobs_market_userid', ['market', 'userid', 'core_strategy'], False],
+    ['jobs', 'ix_jobs_userid', ['userid'], False],
+    ['buys', 'ix_buys_market_userid', ['market', 'userid'], False],
+    ['buys', 'ix_buys_userid', ['userid'], False],
+    ['bback', 'ix_bback_userid', ['userid'], False],
+    ['workflow', 'ix_workflow_market_exchange_userid', ['market', 'exchange', 'userid', 'core_strategy'], False],
+    ['keys', 'ix_keys_user_strategy_exchange', ['user', 'strategy', 'exchange'], False],
+    ['market_info', 'ux_market_info_market', ['market'], True],
+    ['market_info', 'ix_market_info_version', ['version'], False]
+]
+
+# Version, description, statements as (table, sql) run before the indexes of the version are created, index names
+versions = [
+    [1, 'Indexes for the hot queries', [], [
+        'ix_td_stats_market_period_timestamp', 'ix_labels_generated_market_exchange_timestamp',
+        'ix_jobs_market_userid', 'ix_jobs_userid', 'ix_buys_market_userid', 'ix_buys_userid', 'ix_bback_userid',
+        'ix_workflow_market_exchange_userid', 'ix_keys_user_strategy_exchange']],
+    [2, 'Unique market in market_info (duplicates removed, the latest row is kept)', [
+        ['market_info', "DELETE FROM market_info WHERE id NOT IN (SELECT MAX(id) FROM market_info GROUP BY market)"]
+    ], ['ux_market_info_market']],
+    # Change counter: every insert or update of a row sets its version above all the others, so that readers
+    # only fetch rows with versions above the last one they have seen
+    [3, 'Change counter in market_info', [
+        ['market_info', "ALTER TABLE market_info ADD COLUMN version INTEGER DEFAULT 0"],
+        ['market_info', "CREATE TRIGGER IF NOT EXISTS market_info_version_insert AFTER INSERT ON market_info BEGIN "
+            "UPDATE market_info SET version = (SELECT MAX(version) FROM market_info) + 1 WHERE id = NEW.id; END"],
+        ['market_info', "CREATE TRIGGER IF NOT EXISTS market_info_version_update "
+            "AFTER UPDATE OF price, last_update, prediction, probability ON market_info BEGIN "
+            "UPDATE market_info SET version = (SELECT MAX(version) FROM market_info) + 1 WHERE id = NEW.id; END"]
+    ], ['ix_market_info_version']]
+]
+
+# Hot queries (name, table, sql with sample values) to check the plans: a table scan instead of an index is a regression
+hot_queries = [
+    ['tdlib.analysis_combined', 'td_stats', "SELECT * FROM td_stats where market = 'USD-BTC' AND period = '4h' "
+        "AND timestamp <= '2018-01-01 00:00' order by timestamp desc limit 10"],
+    ['tdlib.get_features', 'labels_generated', "SELECT * FROM labels_generated where timestamp <= '2018-01-01 00:00' and market = 'USD-BTC' "
+        "and exchange = 'bmex' order by timestamp desc limit 1"],
+    ['robot prediction', 'market_info', "SELECT prediction, probability FROM market_info WHERE market = 'USD-BTC'"],
+    ['sqltools.check_sell_flag', 'jobs', "SELECT selling FROM jobs WHERE market = 'USD-BTC' AND userid = 1 AND core_strategy = 'standard'"],
+    ['sqltools.control_flags', 'jobs', "SELECT abort_flag, selling FROM jobs WHERE job_id = 1 AND userid = 1"],
+    ['daemon jobs', 'jobs', "SELECT * FROM jobs WHERE userid = 1"],
+    ['daemon buys', 'buys', "SELECT * FROM buys WHERE market = 'USD-BTC' AND userid = 1"],
+    ['daemon bback', 'bback', "SELECT * FROM bback WHERE userid = 1"],
+    ['robot workflow', 'workflow', "SELECT wf_id, run_mode FROM workflow WHERE market = 'USD-BTC' AND exchange = 'bmex' "
+        "AND userid = 1 AND core_strategy = 'standard'"],
+    ['daemon keys', 'keys', "SELECT id FROM keys WHERE user = 1 AND strategy='standard' AND exchange = 'bmex'"]
+]
+
+class migrations(object):
+    def __init__(self, dbname = 'workflow.db'):
+        self.dbname = dbname
+
+    # Transactions are handled explicitly so that schema changes of a version are applied together
+    def connect(self):
+        con = lite.connect(self.dbname, timeout = 30)
+        con.isolation_level = None
+        return con
+
+    def version(self, con):
+        return con.execute('PRAGMA user_version').fetchone()[0]
+
+    def table_exists(self, con, table):
+        return con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table, )).fetchone() is not None
+
+    # Creating the index if the table is there. Returns True if created or existed
+    def create_index(self, con, name):
+        table, name, columns, unique = [index for index in indexes if index[1] == name][0]
+        if not self.table_exists(con, table):
+            return False
+        con.execute('CREATE {}INDEX IF NOT EXISTS `{}` ON `{}` ({})'.format(
+            'UNIQUE ' if unique else '', name, table, ', '.join(['`{}`'.format(column) for column in columns])))
+        return True
+
+    # Applying the versions which are not applied yet, then the indexes of tables created since
+    # Returns the list of (version, description) applied
+    def migrate(self):
+        con = self.connect()
+        applied = []
+        try:
+            for version, description, statements, index_names in versions:
+                if version <= self.version(con):
+                    continue
+                self.apply(con, statements, index_names, version)
+                applied.append([version, description])
+
+            # Tables which did not exist when the version was applied
+            current = self.version(con)
+            self.apply(con, [], [index[1] for index in indexes if self.index_version(index[1]) <= current])
+        finally:
+            con.close()
+        return applied
+
+    def apply(self, con, statements, index_names, version = None):
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            for table, statement in statements:
+                if self.table_exists(con, table):
+                    con.execute(statement)
+            for name in index_names:
+                self.create_index(con, name)
+            if version is not None:
+                con.execute('PRAGMA user_version = {}'.format(version))
+            con.execute('COMMIT')
+        except:
+            con.execute('ROLLBACK')
+            raise
+
+    def index_version(self, name):
+        return [version[0] for version in versions if name in version[3]][0]
+
+    # Query plans of the hot queries: list of (name, plan lines, uses an index)
+    def query_plans(self):
+        con = self.connect()
+        plans = []
+        try:
+            for name, table, query in hot_queries:
+                if not self.table_exists(con, table):
+                    plans.append([name, ['table {} does not exist'.format(table)], None])
+                    continue
+                plan = [row[-1] for row in con.execute('EXPLAIN QUERY PLAN ' + query).fetchall()]
+                uses_index = not any(line.startswith('SCAN') and 'INDEX' not in line for line in plan)
+                plans.append([name, plan, uses_index])
+        finally:
+            con.close()
+        return plans
@@ -0,0 +1,50 @@
+import os
+import hashlib
+import _thread
+
+import xgboost as xgb
+
+# Boosters loaded once per process and shared by all the predictions
+# The model file is checked with os.stat on each use: when mtime or size change the content hash is compared
+# and the booster is reloaded only if the model really changed (hot reload after retraining)
+class modelregistry(object):
+    def __init__(self, nthread = 4):
+        self.nthread = nthread
+        self.models = {}    # filename: {'booster', 'mtime', 'size', 'hash'}
+        self.lock = _thread.allocate_lock()
+
+    def file_hash(self, filename):
+        with open(filename, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def load(self, filename):
+        bst = xgb.Booster({'nthread': self.nthread})  # init model
+        bst.load_model(filename)  # load the model
+        return bst
+
+    # Booster for the model file, loaded or reloaded if needed
+    def get(self, filename):
+        stat = os.stat(filename)
+        with self.lock:
+            model = self.models.get(filename)
+            if model is not None and model['mtime'] == stat.st_mtime and model['size'] == stat.st_size:
+                return model['booster']
+
+            file_hash = self.file_hash(filename)
+            if model is None or model['hash'] != file_hash:
+                model = {'booster': self.load(filename), 'hash': file_hash}
+            model.update({'mtime': stat.st_mtime, 'size': stat.st_size})
+            self.models[filename] = model
+            return model['booster']
+
+    # Class probabilities without building a DMatrix (older xgboost versions do not have inplace_predict)
+    def predict(self, filename, X):
+        bst = self.get(filename)
+        if hasattr(bst, 'inplace_predict'):
+            return bst.inplace_predict(X)
+        else:
+            return bst.predict(xgb.DMatrix(X))
+
+    def clear(self):
+        with self.lock:
+            self.models = {}
@@ -0,0 +1,126 @@
+import asyncio
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# Concurrent price collection for the price logger
+# Exchange api calls are blocking (and retried inside func_wrapper), so they are run in threads while the cycle is
+# coordinated with asyncio: every instrument is requested at the same time, limited per exchange by requests per second
+# and concurrent requests, and each one has its own timeout. Ticks (exchange, market, receive time, price) go to
+# a queue which is read by the writer, so a slow instrument does not delay the prices of the others
+# With batches (gettickers) all the instruments of an exchange come in one request instead
+class pricecollector(object):
+    def __init__(self, e_api, instruments, writer, cycle_end = None):
+        self.e_api = e_api
+        self.instruments = instruments      # {exchange: [markets]}
+        self.writer = writer                # writer(exchange, market, timestamp, price) for each tick
+        self.cycle_end = cycle_end          # cycle_end() after all the ticks of a cycle are written
+        self.interval = config.price_collector_interval
+        self.timeout = config.price_collector_timeout
+        self.batch = config.price_collector_batch   # one request per exchange for all its markets
+        self.limits = {exchange: config.price_collector_limits.get(exchange, [1, 1]) for exchange in instruments}
+        self.in_flight = set()      # (exchange, markets) still being requested (e.g. retries after a timeout)
+        self.executor = ThreadPoolExecutor(max_workers = sum([limit[1] for limit in self.limits.values()]) + 1)
+        # Writes (db, files, messages) are blocking too: one thread so that they stay in order
+        self.write_executor = ThreadPoolExecutor(max_workers = 1)
+
+    # Blocking request of the markets: {market: price, None if there is no price, False if the market is closed}
+    # With batches all the markets of the exchange are requested at once (gettickers), otherwise one market
+    def quote(self, exchange, markets):
+        if self.batch:
+            try:
+                tickers = self.e_api.gettickers(exchange, markets) or {}
+            except:
+                tickers = {}
+            prices = {}
+            for market in markets:
+                price = tickers.get(market)
+                prices[market] = price if (price is None or price is False) else float(price)
+            return prices
+
+        market = markets[0]
+        try:
+            if not self.e_api.is_market_open(exchange, market):
+                return {market: False}
+        except:
+            print("Warning: cannot check if the market is open for {} (connection issues)".format(market))
+        try:
+            price = self.e_api.getticker(exchange, market)
+            return {market: price if (price is None or price is False) else float(price)}
+        except:
+            return {market: None}
+
+    # Waiting for a request slot of the exchange (requests per second)
+    async def rate_wait(self, exchange):
+        requests_per_second = self.limits[exchange][0]
+        now = time.time()
+        slot = max(now, self.next_request[exchange])
+        self.next_request[exchange] = slot + 1 / requests_per_second
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def fetch(self, queue, exchange, markets):
+        key = (exchange, tuple(markets))
+        if key in self.in_flight:
+            print("> {}: previous request is still running, skipping".format(', '.join(markets)))
+            return
+        self.in_flight.add(key)
+        async with self.semaphores[exchange]:
+            await self.rate_wait(exchange)
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.quote, exchange, markets)
+            # In flight until the thread is done even if the wait times out
+            future.add_done_callback(lambda f: self.in_flight.discard(key))
+            try:
+                prices = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                print("> {}: no response in {}s".format(', '.join(markets), self.timeout))
+                prices = {}
+        timestamp = time.time()
+        for market in markets:
+            await queue.put([exchange, market, timestamp, prices.get(market)])
+
+    # Requests of a cycle: one per exchange with batches, otherwise one per market
+    def requests(self):
+        if self.batch:
+            return [[exchange, markets] for exchange, markets in self.instruments.items() if markets != []]
+        return [[exchange, [market]] for exchange, markets in self.instruments.items() for market in markets]
+
+    # Storage writer: ticks from the queue, None marks the end of a cycle
+    # An error in a write is printed and the writer goes on, so that the cycle (waiting on the queue) is not stuck
+    async def write(self, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            tick = await queue.get()
+            try:
+                if tick is None:
+                    if self.cycle_end is not None:
+                        await loop.run_in_executor(self.write_executor, self.cycle_end)
+                else:
+                    await loop.run_in_executor(self.write_executor, self.writer, *tick)
+            except Exception:
+                print("Price write failed for {}: {}".format(tick[:2] if tick is not None else 'cycle end',
+                    traceback.format_exc()))
+            finally:
+                queue.task_done()
+
+    async def collect(self, cycles = None):
+        self.semaphores = {exchange: asyncio.Semaphore(self.limits[exchange][1]) for exchange in self.instruments}
+        self.next_request = {exchange: 0 for exchange in self.instruments}
+        queue = asyncio.Queue()
+        writer = asyncio.ensure_future(self.write(queue))
+        cycle = 0
+        try:
+            while cycles is None or cycle < cycles:
+                time_start = time.time()
+                await asyncio.gather(*[self.fetch(queue, exchange, markets) for exchange, markets in self.requests()])
+                await queue.put(None)
+                await queue.join()
+                cycle += 1
+                await asyncio.sleep(max(0, self.interval - (time.time() - time_start)))
+        finally:
+            writer.cancel()
+
+    def run(self, cycles = None):
+        asyncio.run(self.collect(cycles))
@@ -0,0 +1,275 @@
+import os
+import csv
+import mmap
+import struct
+
+import numpy as np
+
+# Binary price log: fixed width records (float64 timestamp, float64 price), little endian
+# Record N starts at byte N * 16 so the last N ticks or a time range are found by offset arithmetic / binary search
+# instead of reading the whole file. CSV logs can be converted both ways for compatibility
+record_dtype = np.dtype([('timestamp', '<f8'), ('price', '<f8')])
+record_struct = struct.Struct('<dd')
+
+# Sparse index for csv logs (sidecar .idx file): line number, byte offset and timestamp of every Nth line
+index_dtype = np.dtype([('line_no', '<i8'), ('offset', '<i8'), ('timestamp', '<f8')])
+
+class pricelog(object):
+    def __init__(self, file_prefix = 'price_log/'):
+        self.file_prefix = file_prefix
+        self.handles = {}   # open append handles (writer side)
+
+    # Defining filename, same naming as csv logs
+    def filename_define(self, market, exch_use, binary = True):
+        market = market.replace('/', '_')
+        if binary:
+            extension = 'bin'
+        else:
+            extension = 'csv'
+        return '{}{}_{}.{}'.format(self.file_prefix, market, exch_use.lower(), extension)
+
+    ### Writing
+    # Handle kept open between appends. A partially written record (e.g. after a crash) is cut off
+    def writer_handle(self, filename):
+        if filename not in self.handles:
+            if os.path.exists(filename):
+                size = os.path.getsize(filename)
+                if size % record_dtype.itemsize != 0:
+                    with open(filename, 'r+b') as f:
+                        f.truncate(size - size % record_dtype.itemsize)
+            self.handles[filename] = open(filename, 'ab')
+        return self.handles[filename]
+
+    def append(self, filename, timestamp, price):
+        f = self.writer_handle(filename)
+        f.write(record_struct.pack(timestamp, price))
+        f.flush()   # readers should see the tick right away
+
+    def close(self):
+        for f in self.handles.values():
+            f.close()
+        self.handles = {}
+
+    ### Reading
+    # Memory mapped records (zero copy). None if there is no data yet
+    def records(self, filename):
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return None
+        records_no = size // record_dtype.itemsize
+        if records_no == 0:
+            return None
+        return np.memmap(filename, dtype = record_dtype, mode = 'r', shape = (records_no, ))
+
+    def entries_no(self, filename):
+        try:
+            return os.path.getsize(filename) // record_dtype.itemsize
+        except OSError:
+            return 0
+
+    # Last n ticks (up to and including the timestamp if provided) as timestamps and prices arrays
+    def tail(self, filename, n, timestamp = None):
+        records = self.records(filename)
+        if records is None:
+            return None, None
+        end = records.shape[0]
+        if timestamp is not None:
+            end = np.searchsorted(records['timestamp'], timestamp, side = 'right')
+        start = max(end - n, 0)
+        return records['timestamp'][start:end], records['price'][start:end]
+
+    # Ticks after the timestamp (and up to timestamp_until if provided)
+    def since(self, filename, timestamp, timestamp_until = None):
+        records = self.records(filename)
+        if records is None:
+            return None, None
+        start = np.searchsorted(records['timestamp'], timestamp, side = 'right')
+        if timestamp_until is not None:
+            end = np.searchsorted(records['timestamp'], timestamp_until, side = 'right')
+        else:
+            end = records.shape[0]
+        return records['timestamp'][start:end], records['price'][start:end]
+
+    ### Compatibility with csv logs
+    # Timestamps and prices from csv lines (bytes), parsed by numpy without creating python objects per line
+    # Blank, partially written or otherwise malformed lines are skipped (the lines are then parsed one by one)
+    def csv_parse(self, data):
+        data = data.replace(b'\r', b'')
+        chars = np.frombuffer(data, dtype = np.uint8)
+        newlines, commas = np.flatnonzero(chars == 10), np.flatnonzero(chars == 44)
+        lines_no = newlines.size + (1 if data[-1:] not in [b'', b'\n'] else 0)
+        # Exactly one comma in every line
+        if commas.size == lines_no and np.array_equal(np.searchsorted(newlines, commas), np.arange(lines_no)):
+            try:
+                values = np.fromstring(data.replace(b'\n', b',').decode(), dtype = 'float64', sep = ',')
+                if values.size == 2 * lines_no:
+                    values = values.reshape(-1, 2)
+                    return values[:, 0], values[:, 1]
+            except ValueError:
+                pass
+        return self.csv_parse_lines(data)
+
+    def csv_parse_lines(self, data):
+        timestamps, prices = [], []
+        for line in data.split(b'\n'):
+            fields = line.split(b',')
+            if len(fields) != 2:
+                continue
+            try:
+                timestamp, price = float(fields[0]), float(fields[1])
+            except ValueError:
+                continue
+            timestamps.append(timestamp)
+            prices.append(price)
+        return np.array(timestamps, dtype = 'float64'), np.array(prices, dtype = 'float64')
+
+    # Last n lines of a csv log. The file is memory mapped and scanned backwards from the end in chunks,
+    # so the cost depends on the tail size and not on the file size. A last line which is not complete yet is skipped
+    def csv_tail(self, filename, n, chunk_size = 1048576):
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return np.empty(0), np.empty(0)
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                end = mm.rfind(b'\n') + 1
+                start = end
+                newlines_no = 0
+                while start > 0:
+                    chunk_start = max(start - chunk_size, 0)
+                    chunk = np.frombuffer(mm, dtype = np.uint8, count = start - chunk_start, offset = chunk_start)
+                    newlines = np.flatnonzero(chunk == 10)
+                    del chunk
+                    if start == end:   # newline in the end of the last line is not counted
+                        newlines = newlines[:-1]
+                    if newlines_no + newlines.size >= n:
+                        start = chunk_start + newlines[newlines.size - (n - newlines_no)] + 1
+                        break
+                    newlines_no += newlines.size
+                    start = chunk_start
+                return self.csv_parse(mm[start:end])
+            finally:
+                mm.close()
+
+    # Lines of a csv log with timestamps after the given one. The tail size is increased until it covers the timestamp
+    def csv_since(self, filename, timestamp, n = 1024):
+        while True:
+            timestamps, prices = self.csv_tail(filename, n)
+            if timestamps.size < n or timestamps[0] <= timestamp:
+                break
+            n *= 4
+        start = np.searchsorted(timestamps, timestamp, side = 'right')
+        return timestamps[start:], prices[start:]
+
+    ### Sparse timestamp index for csv logs
+    def index_filename(self, filename):
+        return os.path.splitext(filename)[0] + '.idx'
+
+    # Building the index or extending it with the lines added since the last update
+    def csv_index_update(self, filename, step = 10000, chunk_size = 4194304):
+        index_filename = self.index_filename(filename)
+        index = np.empty(0, dtype = index_dtype)
+        if os.path.exists(index_filename) and os.path.getsize(index_filename) % index_dtype.itemsize == 0:
+            index = np.fromfile(index_filename, dtype = index_dtype)
+            if index.size > 1 and index['line_no'][1] != step:
+                index = np.empty(0, dtype = index_dtype)   # built with another step
+
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return index
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                end = mm.rfind(b'\n') + 1  # complete lines only
+                if index.size > 0 and index['offset'][-1] >= end:
+                    index = np.empty(0, dtype = index_dtype)   # log was rewritten
+
+                new_entries = []
+                if index.size > 0:
+                    line_no, position = int(index['line_no'][-1]), int(index['offset'][-1])
+                else:
+                    line_no, position = 0, 0
+                    if end > 0:
+                        new_entries.append((0, 0))
+
+                # Line starts found with numpy per chunk; line_no is the number of the line the chunk starts in
+                while position < end:
+                    chunk_end = min(position + chunk_size, end)
+                    chunk = np.frombuffer(mm, dtype = np.uint8, count = chunk_end - position, offset = position)
+                    line_starts = position + np.flatnonzero(chunk == 10) + 1
+                    del chunk
+                    numbers = line_no + 1 + np.arange(line_starts.size)
+                    use = (numbers % step == 0) & (line_starts < end)
+                    new_entries.extend(zip(numbers[use].tolist(), line_starts[use].tolist()))
+                    line_no += line_starts.size
+                    position = chunk_end
+
+                if new_entries != []:
+                    entries = np.empty(len(new_entries), dtype = index_dtype)
+                    for i, (entry_line_no, offset) in enumerate(new_entries):
+                        entries[i] = entry_line_no, offset, float(mm[offset:mm.find(b',', offset)])
+                    if index.size == 0:
+                        entries.tofile(index_filename)
+                    else:
+                        with open(index_filename, 'ab') as index_file:
+                            entries.tofile(index_file)
+                    index = np.concatenate([index, entries])
+            finally:
+                mm.close()
+
+        return index
+
+    # Lines with timestamp_from <= timestamp <= timestamp_until and up to lines_before lines preceding them (history).
+    # The index is used to jump close to the start, then only the window is read in chunks
+    # Returns the line number of the first returned line, position of the first line with timestamp_from and the arrays
+    def csv_window(self, filename, timestamp_from, timestamp_until, lines_before = 0, step = 10000, chunk_size = 4194304):
+        index = self.csv_index_update(filename, step)
+        if index.size == 0:
+            return 0, 0, np.empty(0), np.empty(0)
+        position = max(np.searchsorted(index['timestamp'], timestamp_from, side = 'left') - 1, 0)
+        position = max(position - (lines_before + step - 1) // step, 0)
+        line_no, offset = int(index['line_no'][position]), int(index['offset'][position])
+
+        timestamps_list, prices_list = [], []
+        with open(filename, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                end = mm.rfind(b'\n') + 1
+                while offset < end:
+                    chunk_end = mm.rfind(b'\n', offset, min(offset + chunk_size, end)) + 1
+                    if chunk_end <= offset:   # line longer than the chunk
+                        chunk_end = mm.find(b'\n', offset, end) + 1
+                    timestamps, prices = self.csv_parse(mm[offset:chunk_end])
+                    timestamps_list.append(timestamps)
+                    prices_list.append(prices)
+                    offset = chunk_end
+                    if timestamps.size > 0 and timestamps[-1] > timestamp_until:
+                        break
+            finally:
+                mm.close()
+
+        if timestamps_list == []:
+            return line_no, 0, np.empty(0), np.empty(0)
+        timestamps, prices = np.concatenate(timestamps_list), np.concatenate(prices_list)
+        start = np.searchsorted(timestamps, timestamp_from, side = 'left')
+        end = np.searchsorted(timestamps, timestamp_until, side = 'right')
+        first = max(start - lines_before, 0)
+        return line_no + first, start - first, timestamps[first:end], prices[first:end]
+
+    def csv_import(self, filename_csv, filename_bin):
+        values = np.loadtxt(filename_csv, delimiter = ',', dtype = 'float64', ndmin = 2)
+        records = np.empty(values.shape[0], dtype = record_dtype)
+        records['timestamp'] = values[:, 0]
+        records['price'] = values[:, 1]
+        records.tofile(filename_bin)
+        return records.shape[0]
+
+    def csv_export(self, filename_bin, filename_csv):
+        records = self.records(filename_bin)
+        if records is None:
+            return 0
+        with open(filename_csv, 'w', newline='') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            for timestamp, price in records.tolist():
+                csvwriter.writerow([timestamp, price])
+        return records.shape[0]
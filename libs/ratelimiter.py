@@ -0,0 +1,66 @@
+import time
+import random
+
+import config
+import libs.sqltools as sqltools
+
+# Token bucket per exchange account shared by all the processes (robots, daemon, monitor, price logger)
+# Exchanges limit the requests per account (api key), so every account has its own bucket with the limits of the exchange
+# and the robots of different users do not wait for each other. Buckets are rows in a small sqlite db: taking a token is one UPDATE which refills the bucket for the time passed
+# and takes the token only if enough are left, so it is atomic between processes without extra locks
+# Orders (priority 'order') may use the whole bucket while status reads ('read') leave a reserve for the orders,
+# so when the limit is close the reads wait and the orders still go through
+class ratelimiter(object):
+    def __init__(self, dbname = None):
+        self.sql = sqltools.sql()
+        self.sql.dbname = dbname if dbname is not None else config.rate_limit_db
+        self.limits = config.rate_limits            # exchange: [tokens per second, bucket size] for each account
+        self.reserve = config.rate_limit_reserve    # part of the bucket only orders can use
+        self.max_wait = config.rate_limit_max_wait  # seconds, the request is sent anyway after waiting this long
+        self.created = set()
+
+    # Bucket name: exchange and account (api key or user id), only the exchange if the account is unknown
+    def bucket_name(self, exchange, account = None):
+        if account is None:
+            return exchange
+        return '{}:{}'.format(exchange, account)
+
+    def bucket(self, exchange, name):
+        if name not in self.created:
+            with self.sql.transaction() as cur:
+                cur.execute("CREATE TABLE IF NOT EXISTS account_buckets (bucket TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+                cur.execute("INSERT OR IGNORE INTO account_buckets(bucket, tokens, updated) VALUES (?, ?, ?)",
+                    (name, self.limits[exchange][1], time.time()))
+            self.created.add(name)
+
+    # Takes a token, returns True if taken or False if the wait is needed (then the seconds to wait)
+    def take(self, exchange, name, priority):
+        rate, size = self.limits[exchange]
+        floor = 0 if priority == 'order' else size * self.reserve    # tokens to leave in the bucket
+        now = time.time()
+        refilled = "MIN(?, tokens + (? - updated) * ?)"
+        with self.sql.transaction() as cur:
+            cur.execute("UPDATE account_buckets SET tokens = {} - 1, updated = ? WHERE bucket = ? AND {} - 1 >= ?".format(
+                refilled, refilled), (size, now, rate, now, name, size, now, rate, floor))
+            if cur.rowcount == 1:
+                return True, 0
+            tokens = cur.execute("SELECT {} FROM account_buckets WHERE bucket = ?".format(refilled),
+                (size, now, rate, name)).fetchone()[0]
+        return False, (floor + 1 - tokens) / rate
+
+    # Waits until a token is available for the request of the account
+    def acquire(self, exchange, priority = 'read', account = None):
+        if exchange not in self.limits:
+            return
+        name = self.bucket_name(exchange, account)
+        self.bucket(exchange, name)
+        time_start = time.time()
+        while True:
+            taken, wait = self.take(exchange, name, priority)
+            if taken:
+                return
+            if time.time() - time_start > self.max_wait:
+                print('(i) rate limit wait for {} is over {}s, sending the request'.format(name, self.max_wait))
+                return
+            # Jitter so that the waiting processes do not come back at the same moment
+            time.sleep(wait * random.uniform(1, 1.5))
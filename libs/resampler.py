@@ -0,0 +1,81 @@
+import pandas as pd
+import numpy as np
+
+minute_ns = 60 * 10**9
+day_ns = 86400 * 10**9
+
+# OHLC resampling on numpy arrays, same bars as pandas resample(period, base = price_base).ohlc():
+# bins start at midnight of the first tick day shifted by the base and empty bins are nans
+# Several periods are built in one pass: ticks are grouped into 1 minute bars once and every period is aggregated
+# from these minute bars (periods and bases which are not whole minutes are aggregated from ticks)
+class resampler(object):
+
+    # Timestamps in seconds to local time in ns. Converted by pandas so that the bin edges are exactly the same
+    def local_ns(self, timestamps, shift_ns):
+        timestamps = np.asarray(timestamps, dtype = 'float64')
+        return pd.to_datetime(timestamps, unit = 's').values.astype('datetime64[ns]').astype('int64') + shift_ns
+
+    # First bin start and bin numbers for (sorted) times
+    def bins(self, times, period_ns, offset_ns):
+        day_start = (times[0] // day_ns) * day_ns + offset_ns
+        first = day_start + ((times[0] - day_start) // period_ns) * period_ns
+        return first, (times - first) // period_ns
+
+    # Aggregating bars (or ticks when open = high = low = close) into bars of a longer period
+    def aggregate(self, times, bar_open, bar_high, bar_low, bar_close, period_ns, offset_ns, remove_nans = False):
+        if times.size == 0:
+            return self.to_frame(np.empty(0, dtype = 'int64'), *[np.empty(0, dtype = 'float32')] * 4)
+
+        first, bins = self.bins(times, period_ns, offset_ns)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(bins)) + 1])
+        ends = np.concatenate([starts[1:], [bins.size]]) - 1
+        bin_ids = bins[starts]
+        values = [bar_open[starts], np.maximum.reduceat(bar_high, starts), np.minimum.reduceat(bar_low, starts), bar_close[ends]]
+
+        # Empty bins are kept as nans unless removed (traditional markets)
+        if remove_nans:
+            return self.to_frame(first + bin_ids * period_ns, *values)
+        filled = []
+        for value in values:
+            filled_value = np.full(bin_ids[-1] + 1, np.nan, dtype = 'float32')
+            filled_value[bin_ids] = value
+            filled.append(filled_value)
+        return self.to_frame(first + np.arange(bin_ids[-1] + 1, dtype = 'int64') * period_ns, *filled)
+
+    def to_frame(self, index_ns, bar_open, bar_high, bar_low, bar_close):
+        index = pd.DatetimeIndex(np.asarray(index_ns, dtype = 'int64').astype('datetime64[ns]'), name = 'timestamp')
+        return pd.DataFrame({'open': bar_open, 'high': bar_high, 'low': bar_low, 'close': bar_close},
+            index = index, columns = ['open', 'high', 'low', 'close'])
+
+    # Ticks to bars of one period
+    def ohlc(self, times, prices, period_ns, offset_ns, remove_nans = False):
+        prices = np.asarray(prices, dtype = 'float32')
+        use = ~np.isnan(prices)
+        times, prices = times[use], prices[use]
+        return self.aggregate(times, prices, prices, prices, prices, period_ns, offset_ns, remove_nans)
+
+    # Ticks to bars of several periods in one pass
+    # periods: list of (name, period_ns, offset_ns, start_ns) where ticks before start_ns are not used for the period
+    # Returns a dict of bars dataframes by name
+    def ohlc_multi(self, times, prices, periods, remove_nans = False):
+        prices = np.asarray(prices, dtype = 'float32')
+        use = ~np.isnan(prices)
+        times, prices = times[use], prices[use]
+
+        # Non-empty minute bars
+        minute_bars = self.aggregate(times, prices, prices, prices, prices, minute_ns, 0, remove_nans = True)
+        minute_times = minute_bars.index.values.astype('datetime64[ns]').astype('int64')
+        minute_values = [minute_bars[column].values for column in ['open', 'high', 'low', 'close']]
+
+        bars = {}
+        for name, period_ns, offset_ns, start_ns in periods:
+            if period_ns % minute_ns == 0 and offset_ns % minute_ns == 0:
+                # Minute bar of the first tick is taken in full: it starts the period window
+                start = np.searchsorted(minute_times, (start_ns // minute_ns) * minute_ns, side = 'left')
+                bars[name] = self.aggregate(minute_times[start:], *[value[start:] for value in minute_values],
+                    period_ns = period_ns, offset_ns = offset_ns, remove_nans = remove_nans)
+            else:
+                start = np.searchsorted(times, start_ns, side = 'left')
+                bars[name] = self.aggregate(times[start:], *[prices[start:]] * 4,
+                    period_ns = period_ns, offset_ns = offset_ns, remove_nans = remove_nans)
+        return bars
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import random
+import threading
+
+import config
+
+# Retries of exchange requests and a circuit breaker per exchange shared by all the processes
+# Errors are classified by the exchange adapters:
+#   rate_limit - too many requests, retried with a longer backoff
+#   unavailable - 5xx / connection errors, retried and counted by the circuit breaker
+#   request - other errors returned by the exchange, retried (e.g. orders retried with less contracts)
+#   auth - invalid keys, not retried
+#   fatal - unknown errors, not retried
+retry_kinds = ['rate_limit', 'unavailable', 'request']
+breaker_kinds = ['rate_limit', 'unavailable']
+
+class retrypolicy(object):
+    def __init__(self):
+        self.base = config.retry_base
+        self.rate_limit_base = config.retry_rate_limit_base
+        self.cap = config.retry_cap
+        self.max_attempts = config.retry_max_attempts
+
+    # Capped exponential backoff with full jitter: processes retrying the same outage spread out
+    def delay(self, attempt, kind):
+        base = self.rate_limit_base if kind == 'rate_limit' else self.base
+        return random.uniform(0, min(self.cap, base * 2 ** attempt))
+
+    # Returns True if the request should be tried again (after the delay), attempt starts from 0
+    def should_retry(self, attempt, kind):
+        return kind in retry_kinds and attempt < self.max_attempts
+
+
+# State of the circuit in a file per exchange: {'failures': consecutive failures, 'open_until': timestamp,
+# 'probe_until': timestamp}. After failure_threshold failures in a row (from any process) the circuit opens and
+# requests fail fast for open_seconds. Then one process is let through as a probe: a success closes the circuit,
+# a failure opens it again. Updates are read-modify-write without locks, so the counts are approximate
+class circuitbreaker(object):
+    def __init__(self, folder = None):
+        self.folder = folder if folder is not None else config.circuit_folder
+        self.failure_threshold = config.circuit_failures
+        self.open_seconds = config.circuit_open_seconds
+        self.probe_seconds = config.circuit_probe_seconds
+        self.states = {}    # exchange: [file modification time, state]
+
+    def filename(self, exchange):
+        return os.path.join(self.folder, '{}.json'.format(exchange))
+
+    # State of the exchange, the file is read again only if it has changed
+    def read(self, exchange):
+        try:
+            stat = os.stat(self.filename(exchange))
+            mtime = (stat.st_ino, stat.st_mtime_ns)
+            if exchange not in self.states or self.states[exchange][0] != mtime:
+                with open(self.filename(exchange)) as f:
+                    self.states[exchange] = [mtime, json.load(f)]
+            return dict(self.states[exchange][1])
+        except (OSError, ValueError):
+            return {'failures': 0, 'open_until': 0, 'probe_until': 0}
+
+    def write(self, exchange, state):
+        try:
+            os.makedirs(self.folder, exist_ok = True)
+            tmp_filename = '{}.{}.{}.tmp'.format(self.filename(exchange), os.getpid(), threading.get_ident())
+            with open(tmp_filename, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_filename, self.filename(exchange))
+        except OSError as e:
+            print('Circuit state update failed: {}'.format(e))
+
+    # True if requests to the exchange should fail fast now
+    def is_open(self, exchange):
+        state = self.read(exchange)
+        if state['failures'] < self.failure_threshold:
+            return False
+        now = time.time()
+        if now < state['open_until'] or now < state['probe_until']:
+            return True
+        # Open period is over: this process probes the exchange, others wait for the result
+        state['probe_until'] = now + self.probe_seconds
+        self.write(exchange, state)
+        return False
+
+    def record_success(self, exchange):
+        if self.read(exchange)['failures'] > 0:
+            self.write(exchange, {'failures': 0, 'open_until': 0, 'probe_until': 0})
+
+    def record_failure(self, exchange):
+        state = self.read(exchange)
+        state['failures'] += 1
+        if state['failures'] >= self.failure_threshold:
+            state['open_until'] = time.time() + self.open_seconds
+            state['probe_until'] = 0
+            if state['failures'] == self.failure_threshold:
+                print('(i) circuit for {} is open for {}s'.format(exchange, self.open_seconds))
+        self.write(exchange, state)
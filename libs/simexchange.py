@@ -0,0 +1,287 @@
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+
+import config
+
+# Simulated exchange with the same functions as exch_api.api, for replays on the price log of a backtest (b_test)
+# Orders become active after the latency and are filled from the ticks between the calls: an order which can be
+# executed when it becomes active is filled at the tick price with slippage (taker fee), otherwise it is filled at
+# its price when the price gets there (maker fee). Post-only orders which would execute right away are canceled.
+# Positions are in contracts (bitmex: USD contracts with results in BTC) or units (oanda: results in the quote currency).
+# Funding is charged on bitmex positions every 8 hours. Only the market of the backtest has prices
+class simexchange(object):
+    def __init__(self, b_test, exchange = 'bitmex', margin_level = 1):
+        self.b_test = b_test
+        self.exchange = exchange
+        self.inverse = (exchange == 'bitmex')   # contracts in USD, results in BTC
+        self.latency = config.sim_latency
+        self.slippage = config.sim_slippage
+        self.maker_fee, self.taker_fee = config.sim_fees.get(exchange, [0, 0])
+        self.funding_rate = config.sim_funding_rate if self.inverse else 0
+        self.funding_hours = [4, 12, 20]    # UTC
+        self.balance = config.sim_balance.get(exchange, 0)
+        self.margin_level = margin_level
+        self.contracts_to_use = None
+
+        self.orders = {}        # order id: order
+        self.positions = {}     # market: [contracts (negative for shorts), entry price]
+        self.executions = []    # trades and funding in the bitmex execution format
+        self.last_update = None
+
+    ### Processing of the ticks since the last call
+    def update(self):
+        now = self.b_test.time()
+        if self.last_update is None:
+            self.last_update = now
+            return
+        if now <= self.last_update:
+            return
+        open_orders = [order for order in self.orders.values() if order['ordStatus'] == 'New']
+        history = self.b_test.price_history_since(self.last_update) if open_orders != [] else None
+        if history is not None:
+            timestamps, prices = history
+            fills = [self.order_fill(order, timestamps, prices) for order in open_orders]
+            for fill in sorted([fill for fill in fills if fill is not None], key = lambda fill: fill[0]):
+                self.fill(*fill[1:], timestamp = fill[0])
+        self.charge_funding(self.last_update, now)
+        self.last_update = now
+
+    # Fill of an order on the ticks: (timestamp, order, price, fee rate) or None if not filled
+    def order_fill(self, order, timestamps, prices):
+        start = np.searchsorted(timestamps, order['active_from'], side = 'left')
+        if start >= timestamps.size:
+            return None
+        if order['side'] == 'Buy':
+            crossed = prices[start:] <= order['price']
+        else:
+            crossed = prices[start:] >= order['price']
+
+        if not order['activated']:
+            order['activated'] = True
+            if crossed[0]:  # executes right away: taker at the tick price
+                sign = 1 if order['side'] == 'Buy' else -1
+                fill_price = float(prices[start]) * (1 + sign * self.slippage)
+                if sign * (fill_price - order['price']) > 0:
+                    fill_price = order['price']
+                return float(timestamps[start]), order, fill_price, self.taker_fee
+
+        # Resting order reached: maker at the order price
+        if crossed.any():
+            return float(timestamps[start + np.argmax(crossed)]), order, order['price'], self.maker_fee
+        return None
+
+    def fill(self, order, price, fee_rate, timestamp):
+        market = order['market']
+        signed = order['orderQty'] if order['side'] == 'Buy' else -order['orderQty']
+        contracts, entry = self.positions.get(market, [0, 0])
+
+        # Realised result on the part of the position which is closed
+        realised = 0
+        if contracts != 0 and (contracts > 0) != (signed > 0):
+            closed = min(abs(signed), abs(contracts)) * (1 if contracts > 0 else -1)
+            realised = self.result(closed, entry, price)
+        if contracts == 0 or (contracts > 0) == (signed > 0):
+            entry = (abs(contracts) * entry + abs(signed) * price) / (abs(contracts) + abs(signed))
+        elif abs(signed) > abs(contracts):  # flipped
+            entry = price
+        contracts += signed
+        if contracts == 0:
+            entry = 0
+        self.positions[market] = [contracts, entry]
+
+        home_notional = self.notional(signed, price)
+        fee = abs(home_notional) * fee_rate
+        self.balance += realised - fee
+        order.update({'ordStatus': 'Filled', 'cumQty': order['orderQty'], 'avgPx': price,
+            'simpleCumQty': abs(home_notional), 'commission_paid': fee})
+        self.executions.append({'timestamp': datetime.utcfromtimestamp(timestamp), 'execType': 'Trade',
+            'side': order['side'], 'homeNotional': home_notional, 'commission': fee_rate, 'price': price,
+            'orderID': order['orderID'], 'realised': realised, 'fee': fee})
+
+    # Position size in the settlement currency (BTC for contracts, units otherwise)
+    def notional(self, contracts, price):
+        return contracts / price if self.inverse else contracts
+
+    def result(self, contracts, entry, price):
+        if self.inverse:
+            return contracts * (1 / entry - 1 / price)
+        return contracts * (price - entry)
+
+    def charge_funding(self, time_from, time_to):
+        if self.funding_rate == 0:
+            return
+        hour = int(time_from // 3600) + 1
+        while hour * 3600 <= time_to:
+            if hour % 24 in self.funding_hours:
+                for market, (contracts, entry) in self.positions.items():
+                    if contracts != 0:
+                        home_notional = self.notional(contracts, self.b_test._curr_price)
+                        funding = home_notional * self.funding_rate     # longs pay when the rate is positive
+                        self.balance -= funding
+                        self.executions.append({'timestamp': datetime.utcfromtimestamp(hour * 3600),
+                            'execType': 'Funding', 'side': '', 'homeNotional': home_notional,
+                            'commission': self.funding_rate, 'price': self.b_test._curr_price, 'orderID': '',
+                            'realised': 0, 'fee': funding})
+            hour += 1
+
+    # Position which exists before the replay (e.g. a task started in the process mode), opened without fees
+    def open_position(self, market, contracts, price):
+        contracts = round(contracts) if self.inverse else contracts
+        self.positions[market] = [contracts, float(price)]
+
+    def price(self, market):
+        if market.lower() != str(self.b_test.market).lower():
+            return None
+        return self.b_test._curr_price
+
+    ### Functions of exch_api.api
+    def keys_select(self, user, strategy, exchange):
+        return 'simulated', 'simulated'
+
+    def return_margin(self):
+        return self.margin_level
+
+    def market_std(self, market):
+        return market
+
+    def bitmex_leverage(self, market, leverage=1):
+        self.margin_level = leverage
+        return {'leverage': leverage}
+
+    def oanda_last_transaction_id(self, market):
+        return 0
+
+    def is_market_open(self, exchange, market):
+        return True
+
+    def getticker(self, exchange, market):
+        self.update()
+        price = self.price(market)
+        return Decimal(str(price)) if price is not None else None
+
+    def gettickers(self, exchange, markets):
+        return {market: self.getticker(exchange, market) for market in markets}
+
+    def getopenorders(self, exchange, market):
+        self.update()
+        result = []
+        for order in self.orders.values():
+            if order['market'] == market and order['ordStatus'] == 'New':
+                result.append({'OrderUuid': order['orderID'], 'Quantity': order['orderQty'],
+                    'QuantityRemaining': Decimal(order['orderQty'] - order['cumQty']), 'Price': order['price'],
+                    'Limit': '', 'type': 'long' if order['side'] == 'Buy' else 'short'})
+        return result
+
+    def cancel(self, exchange, market, orderid):
+        self.update()
+        order = self.orders.get(orderid)
+        if order is None or order['ordStatus'] != 'New':
+            return 'unknown order'
+        order['ordStatus'] = 'Canceled'
+        return order
+
+    def cancel_orders(self, exchange, market):
+        for order in self.getopenorders(exchange, market):
+            self.cancel(exchange, market, order['OrderUuid'])
+        return 'completed'
+
+    def getorderhistory(self, exchange, market, lastid=0):
+        orders = [order for order in self.orders.values() if order['market'] == market]
+        return [{'OrderUuid': order['orderID']} for order in reversed(orders)]
+
+    def getorder(self, exchange, market, item):
+        self.update()
+        order = self.orders.get(item)
+        if order is None:
+            return None
+        filled = order['ordStatus'] == 'Filled'
+        if self.inverse:    # bitmex: price of the order
+            price_unit = order['avgPx'] if filled else order['price']
+            price = price_unit
+        else:               # oanda: price and value of the fill (negative for shorts), zeros until filled
+            price_unit = order['avgPx'] if filled else 0
+            price = price_unit * order['orderQty'] * (1 if order['side'] == 'Buy' else -1)
+        return {'OrderUuid': order['orderID'], 'Quantity': order['orderQty'],
+            'QuantityRemaining': Decimal(order['orderQty'] - order['cumQty']),
+            'PricePerUnit': price_unit, 'Price': price,
+            'CommissionPaid': order['commission_paid'], 'Status': order['ordStatus'],
+            'simpleCumQty': order['simpleCumQty']}
+
+    def getbalance(self, exchange, currency = None):
+        self.update()
+        return {'Available': float(self.balance), 'Total': float(self.balance)}
+
+    def getorderbook(self, exchange, market, type='bids'):
+        return [{'Rate': self.price(market), 'Quantity': config.sim_book_quantity}]
+
+    def getpositions(self, exchange, market=None, do_retry=True):
+        self.update()
+        result = []
+        for position_market, (contracts, entry) in self.positions.items():
+            if contracts == 0 or (market is not None and position_market != market):
+                continue
+            position = {'type': 'long' if contracts > 0 else 'short',
+                'contracts_no': abs(self.notional(contracts, self.price(position_market) or entry)),
+                'contracts': abs(contracts), 'entryprice': entry}
+            if market is None:
+                position['market'] = position_market
+            result.append(position)
+        if market is not None and result == []:
+            result.append({})
+        return result
+
+    def closepositions(self, exchange, positions=None, market=None, price=None, short_flag=None):
+        contracts_total = sum([(-position['contracts'] if position['type'] == 'short' else position['contracts'])
+            for position in positions if position != {}])
+        if contracts_total < 0:
+            return self.buylimit(exchange, market, None, price, -contracts_total)
+        elif contracts_total > 0:
+            return self.selllimit(exchange, market, None, price, contracts_total)
+
+    def buylimit(self, exchange, market, quantity, buy_rate, contracts=None, postonly=False):
+        return self.place('Buy', market, quantity, buy_rate, contracts, postonly)
+
+    def selllimit(self, exchange, market, sell_q_step, price_to_sell, contracts=None, postonly=False):
+        return self.place('Sell', market, sell_q_step, price_to_sell, contracts, postonly)
+
+    def place(self, side, market, quantity, rate, contracts, postonly):
+        self.update()
+        rate = float(rate)
+        if contracts is None:
+            contracts = round(float(quantity) * rate) if self.inverse else float(quantity)
+        now = self.b_test.time()
+        order_id = str(uuid.uuid4())
+        order = {'orderID': order_id, 'uuid': order_id, 'market': market, 'side': side, 'orderQty': abs(contracts),
+            'price': rate, 'ordStatus': 'New', 'cumQty': 0, 'avgPx': 0, 'simpleCumQty': 0, 'commission_paid': 0,
+            'placed': now, 'active_from': now + self.latency, 'activated': False}
+
+        # Post-only orders which would take liquidity are canceled by the exchange right away
+        price = self.price(market)
+        if postonly and price is not None and ((side == 'Buy' and price <= rate) or (side == 'Sell' and price >= rate)):
+            order['ordStatus'] = 'Canceled'
+        self.orders[order_id] = order
+        return dict(order)
+
+    def detailed_trade_history(self, exchange, market=None):
+        self.update()
+        return list(reversed(self.executions))
+
+    # Results of the trades and funding between the timestamps (same keys and meaning as exch_api): on bitmex the value
+    # of the trades in BTC (the robot adds the position value when the position was opened before), on oanda the realised result
+    def results_over_time(self, exchange, market, timestamp_from, timestamp_to, lastid=0):
+        self.update()
+        results = {'position_diff': 0, 'commission': 0, 'funding': 0}
+        for execution in self.executions:
+            timestamp = (execution['timestamp'] - datetime(1970, 1, 1)).total_seconds()
+            if not (timestamp_from < timestamp < timestamp_to):
+                continue
+            if execution['execType'] == 'Funding':
+                results['funding'] += execution['fee']
+            else:
+                results['position_diff'] += execution['homeNotional'] if self.inverse else execution['realised']
+                results['commission'] += execution['fee']
+        results['total_outcome'] = results['position_diff'] - results['commission'] - results['funding']
+        return results
@@ -1,36 +1,198 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
 import sqlite3 as lite
 
 # SQL connection / query class
+# Each thread keeps its own connection open (a new one is made after fork). The database is used in WAL mode
+# so that readers do not block the writer and many robot processes can work with it at the same time
 class sql:
-    def __init__(self):
+    def __init__(self, persistent = True):
         self.dbname = 'workflow.db'
         self.timeout = 30
+        self.persistent = persistent
+        self.cached_statements = 256    # prepared statements kept per connection
+        self.pragmas = ['PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL', 'PRAGMA cache_size=-8000']
+        self.local = threading.local()
+        self.unique_keys = {}   # (dbname, table, key columns): if there is a unique index for upserts
+        # Read-through cache of market_info shared by the threads of the process
+        self.market_info_ttl = 5    # seconds between checks for changes
+        self.market_info_lock = threading.Lock()
+        self.market_info_rows = {}
+        self.market_info_checked = None     # (dbname, time of the last check, max version seen)
+
+    # Connection of the current thread and process
+    def connection(self):
+        if not self.persistent:
+            return self.connect()
+        connections = getattr(self.local, 'connections', None)
+        if connections is None or self.local.pid != os.getpid():
+            self.local.connections, self.local.pid = {}, os.getpid()
+            connections = self.local.connections
+        if self.dbname not in connections:
+            connections[self.dbname] = self.connect()
+        return connections[self.dbname]
+
+    def connect(self):
+        con = lite.connect(self.dbname, timeout = self.timeout, cached_statements = self.cached_statements)
+        if self.persistent:
+            for pragma in self.pragmas:
+                con.execute(pragma)
+        return con
+
+    # Closing the connections of the current thread
+    def close(self):
+        connections = getattr(self.local, 'connections', None)
+        if connections is not None and self.local.pid == os.getpid():
+            for con in connections.values():
+                con.close()
+        self.local.connections = None
+
+    def release(self, con):
+        if not self.persistent:
+            con.close()
 
     # Return a query result
     def query (self, sql):
-        con = lite.connect(self.dbname, timeout = self.timeout)
-        with con:
-            cur = con.cursor()
-            cur.execute(sql)
-            res = cur.fetchall()
-        if con:
-            con.commit()
-            con.close()
+        con = self.connection()
+        try:
+            with con:
+                cur = con.cursor()
+                cur.execute(sql)
+                res = cur.fetchall()
+        finally:
+            self.release(con)
         return res
 
     # Return a query result and the record id
     def query_lastrow_id(self, sql):
-        con = lite.connect(self.dbname, timeout = self.timeout)
-        with con:
-            cur = con.cursor()
-            cur.execute(sql)
-            res = cur.fetchall()
-            last_id = cur.lastrowid
-        if con:
-            con.commit()
-            con.close()
+        con = self.connection()
+        try:
+            with con:
+                cur = con.cursor()
+                cur.execute(sql)
+                res = cur.fetchall()
+                last_id = cur.lastrowid
+        finally:
+            self.release(con)
         return last_id, res
 
+    # Run several queries in one connection and one transaction. Returns the results in the same order
+    def query_batch(self, sql_list):
+        con = self.connection()
+        res = []
+        try:
+            with con:
+                cur = con.cursor()
+                for sql in sql_list:
+                    cur.execute(sql)
+                    res.append(cur.fetchall())
+        finally:
+            self.release(con)
+        return res
+
+    ### Parameterized statements: values are passed separately from the sql (placeholders ?)
+    # Several statements in one transaction: with sql.transaction() as cur: cur.execute(...)
+    # Committed at the end of the block, rolled back if there is an exception
+    @contextmanager
+    def transaction(self):
+        con = self.connection()
+        try:
+            with con:
+                yield con.cursor()
+        finally:
+            self.release(con)
+
+    def execute(self, sql, params = ()):
+        with self.transaction() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def execute_lastrow_id(self, sql, params = ()):
+        with self.transaction() as cur:
+            cur.execute(sql, params)
+            return cur.lastrowid, cur.fetchall()
+
+    # Same statement for many sets of values in one transaction. Returns the number of rows changed
+    def executemany(self, sql, params_list):
+        with self.transaction() as cur:
+            cur.executemany(sql, params_list)
+            return cur.rowcount
+
+    # Insert or update rows (dicts with the same columns) by the key columns in one transaction
+    # INSERT ... ON CONFLICT is used when the key has a unique index, otherwise UPDATE and INSERT if the key is not there
+    def upsert(self, table, rows, key_columns):
+        if rows == []:
+            return
+        columns = list(rows[0].keys())
+        value_columns = [column for column in columns if column not in key_columns]
+        params_list = [[row[column] for column in columns] for row in rows]
+
+        with self.transaction() as cur:
+            if self.has_unique_key(cur, table, key_columns):
+                updates = ', '.join(['{} = excluded.{}'.format(column, column) for column in value_columns])
+                sql = "INSERT INTO {}({}) VALUES ({}) ON CONFLICT({}) DO {}".format(
+                    table, ', '.join(columns), ', '.join(['?'] * len(columns)), ', '.join(key_columns),
+                    'UPDATE SET {}'.format(updates) if value_columns != [] else 'NOTHING')
+                cur.executemany(sql, params_list)
+            else:
+                key_condition = ' AND '.join(['{} = ?'.format(column) for column in key_columns])
+                if value_columns != []:
+                    sql = "UPDATE {} SET {} WHERE {}".format(
+                        table, ', '.join(['{} = ?'.format(column) for column in value_columns]), key_condition)
+                    cur.executemany(sql, [[row[column] for column in value_columns + key_columns] for row in rows])
+                sql = "INSERT INTO {}({}) SELECT {} WHERE NOT EXISTS (SELECT 1 FROM {} WHERE {})".format(
+                    table, ', '.join(columns), ', '.join(['?'] * len(columns)), table, key_condition)
+                cur.executemany(sql, [params + [row[column] for column in key_columns] for params, row in zip(params_list, rows)])
+
+    # Checking if the key columns are the primary key or have a unique index (upsert syntax needs sqlite 3.24+)
+    def has_unique_key(self, cur, table, key_columns):
+        key = (self.dbname, table, tuple(sorted(key_columns)))
+        if key not in self.unique_keys:
+            unique = False
+            if lite.sqlite_version_info >= (3, 24, 0):
+                primary_key = [row[1] for row in cur.execute("PRAGMA table_info({})".format(table)).fetchall() if row[5] > 0]
+                unique = sorted(primary_key) == sorted(key_columns)
+                for index in cur.execute("PRAGMA index_list({})".format(table)).fetchall():
+                    if index[2] and not unique:
+                        index_columns = [row[2] for row in cur.execute("PRAGMA index_info({})".format(index[1])).fetchall()]
+                        unique = sorted(index_columns) == sorted(key_columns)
+            self.unique_keys[key] = unique
+        return self.unique_keys[key]
+
+    ### Market info (price, last_update, prediction, probability) of a market, None if there is no row
+    # Rows are kept in the process and refreshed at most every market_info_ttl seconds. The version column
+    # (change counter set by triggers, migration v3) is used to read only the rows changed since the last check,
+    # so a refresh with no changes is one index lookup. Without the column all the rows are read
+    def market_info(self, market):
+        with self.market_info_lock:
+            if (self.market_info_checked is None or self.market_info_checked[0] != self.dbname
+                    or time.time() - self.market_info_checked[1] > self.market_info_ttl):
+                self.market_info_refresh()
+            return self.market_info_rows.get(market)
+
+    def market_info_refresh(self):
+        if self.market_info_checked is None or self.market_info_checked[0] != self.dbname:
+            self.market_info_rows, max_version = {}, None
+        else:
+            max_version = self.market_info_checked[2]
+
+        try:
+            rows = self.execute("SELECT market, price, last_update, prediction, probability, version "
+                "FROM market_info WHERE version > ?", (-1 if max_version is None else max_version, ))
+        except lite.OperationalError:   # no version column
+            rows = [list(row) + [None] for row in
+                self.execute("SELECT market, price, last_update, prediction, probability FROM market_info")]
+            max_version = None
+
+        for market, price, last_update, prediction, probability, version in rows:
+            self.market_info_rows[market] = {'price': price, 'last_update': last_update,
+                'prediction': prediction, 'probability': probability}
+            if version is not None:
+                max_version = version if max_version is None else max(max_version, version)
+        self.market_info_checked = (self.dbname, time.time(), max_version)
+
     # Check if a market is supported
     def is_market_supported(self, market):
         sql_string = "SELECT id FROM markets WHERE market = '{}'".format(market)
@@ -40,31 +202,34 @@ class sql:
         else:
             return True
 
-    # Checking if we need to stop buyback
-    def check_bb_flag(self, robot):
+    ### Control flags set via Telegram for a task in one query: {'abort': bool, 'sell': bool}
+    # Table: jobs (abort, sell now), buys / buy_hold (abort), bback (buyback stop as abort)
+    control_columns = {
+        'jobs': ['job_id', ['abort_flag', 'selling']],
+        'buys': ['job_id', ['abort_flag']],
+        'buy_hold': ['job_id', ['abort_flag']],
+        'bback': ['id', ['abort_flag']]
+    }
 
-        sql_string = "SELECT abort_flag FROM bback WHERE id = {} AND userid = {}".format(robot.bb_id, robot.user_id)
-        rows = self.query(sql_string)
+    def control_flags(self, robot, table, task_id):
+        id_column, flag_columns = self.control_columns[table]
+        rows = self.execute("SELECT {} FROM {} WHERE {} = ? AND userid = ?".format(
+            ', '.join(flag_columns), table, id_column), (task_id, robot.user_id))
+        flags = dict(zip(flag_columns, rows[0])) if rows != [] else {}
+        # Buyback stop is any value which is set, abort for the other tasks and sell are 1 (as checked before)
+        if table == 'bback':
+            abort = bool(flags.get('abort_flag'))
+        else:
+            abort = flags.get('abort_flag') == 1
+        return {'abort': abort, 'sell': flags.get('selling') == 1}
 
-        try:
-            bb_flag = rows[0][0] # first result
-        except:
-            bb_flag = 0
-        return bool(bb_flag)
+    # Checking if we need to stop buyback
+    def check_bb_flag(self, robot):
+        return self.control_flags(robot, 'bback', robot.bb_id)['abort']
 
     # Checking cancel flag
     def check_cancel_flag(self, robot, job_id, table):
-
-        keep_running = True
-        sql_string = "SELECT abort_flag FROM {} WHERE job_id = '{}' AND userid = {}".format(table, job_id, robot.user_id)
-        rows = self.query(sql_string)
-        try:
-            flag_terminate = rows[0][0] # first result
-        except:
-            flag_terminate = 0
-        if flag_terminate == 1:
-            keep_running = False
-        return keep_running
+        return not self.control_flags(robot, table, job_id)['abort']
 
     # Checking sell flag
     def check_sell_flag(self, robot):
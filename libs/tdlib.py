@@ -6,8 +6,8 @@ warnings.filterwarnings("ignore")
 from datetime import datetime, timedelta
 import pytz
 import math
-
-import xgboost as xgb
+import re
+import os
 
 # Garbage collector
 import gc
@@ -18,9 +18,28 @@ import _thread
 import libs.sqltools as sqltools
 sql = sqltools.sql()
 
+# Binary price logs
+import libs.pricelog as pricelog
+price_log = pricelog.pricelog()
+
+# Incremental TD / RSI / MA
+from libs.tdstream import tdstream
+
 # Config file 
 import config
 
+# Bars shared between the calls
+import libs.barcache as barcache
+bar_cache = barcache.barcache(config.bar_cache_mb * 1024 * 1024)
+
+# Resampling ticks to bars
+import libs.resampler as resampler
+bars_resampler = resampler.resampler()
+
+# Models loaded once and reloaded when the files change
+import libs.modelregistry as modelregistry
+model_registry = modelregistry.modelregistry()
+
 # TD analysis
 class tdlib(object):
     def __init__(self):
@@ -28,6 +47,8 @@ class tdlib(object):
         self.rsi_df = None
         self.file_prefix = 'price_log/'
         self.using_data_source = False
+        self.td_streams = {}
+        self.td_streams_lock = _thread.allocate_lock()
 
     # To use in-memory instead of reading file all the time, useful for backtests
     def init_source(self, b_test):
@@ -37,19 +58,10 @@ class tdlib(object):
         self.using_data_source = True
         print('(i) initiated data source')
 
-    # To get just a snapshot of df
+    # To get just a snapshot of df: rows up to the timestamp (index is sorted so this is a slice, not a mask over all rows)
     def source_snapshot(self, timestamp):
-        return_df = self.source_data_full[self.source_data_full.index <= timestamp]
-        return return_df
-
-    # Skip file rows
-    def skip_rows_no(self, filename, nentries): 
-        # Using this in order to not read everything and not to store everything in pandas dataframe 
-        with open(filename) as f:
-            for i, l in enumerate(f):
-                pass
-        rows_skip = i - nentries
-        return rows_skip
+        end = self.source_data_full.index.searchsorted(timestamp, side = 'right')
+        return self.source_data_full.iloc[:end]
 
     # Define which markets are standard to remove NaNs
     def is_traditional(self, market):
@@ -58,14 +70,32 @@ class tdlib(object):
         else:
             return False
 
+    # Binary log for the csv log name
+    def binary_filename(self, filename):
+        return os.path.splitext(filename)[0] + '.bin'
+
+    # Binary log is used when it is enabled and has enough history (e.g. converted from csv)
+    def use_binary(self, filename, nentries):
+        return config.price_log_binary and price_log.entries_no(self.binary_filename(filename)) >= nentries
+
     # Reading transactions
     def read_transactions(self, filename, nentries, b_test):
-        if not config.backtesting_enabled:
+        if not config.backtesting_enabled and self.use_binary(filename, nentries):
+            timestamps, prices = price_log.tail(self.binary_filename(filename), nentries)
+            transactions = pd.DataFrame({'price': np.array(prices)}, index = pd.Index(np.array(timestamps), name = 'timestamp'))
+        elif not config.backtesting_enabled:
             try:
-                transactions = pd.read_csv(filename, skiprows=self.skip_rows_no(filename, nentries), names=['timestamp', 'price']).set_index('timestamp')
+                timestamps, prices = price_log.csv_tail(filename, nentries)
+                transactions = pd.DataFrame({'price': prices}, index = pd.Index(timestamps, name = 'timestamp'))
             except:
                 return None
         else:
+            # History loaded by the backtest up to the current line
+            price_history = b_test.price_history(nentries)
+            if price_history is not None:
+                timestamps, prices = price_history
+                return pd.DataFrame({'price': prices}, index = pd.Index(timestamps, name = 'timestamp'))
+
             # Checking if the nentries should be corrected (if there is no so much data and we use backtesting)
             if b_test._curr_pricelog_line_no - nentries + 1 < 0:
                 nentries -= b_test._curr_pricelog_line_no - 1
@@ -78,6 +108,67 @@ class tdlib(object):
 
         return transactions
 
+    # Ticks after the timestamp as (timestamps, prices) arrays. None if they cannot be read this way
+    def read_transactions_since(self, filename, timestamp, b_test, binary = False):
+        if self.using_data_source:
+            index = self.source_data_full.index
+            start = index.searchsorted(timestamp, side = 'right')
+            end = index.searchsorted(b_test.time(), side = 'right')
+            return np.array(index.values[start:end]), np.array(self.source_data_full['price'].values[start:end])
+        elif config.backtesting_enabled:
+            price_history = b_test.price_history_since(timestamp)
+        elif binary:
+            price_history = price_log.since(self.binary_filename(filename), timestamp)
+        else:
+            price_history = price_log.csv_since(filename, timestamp)
+        if price_history is None or price_history[0] is None:
+            return None
+        return np.array(price_history[0]), np.array(price_history[1])
+
+    # OHLC bars for market / exchange / period. Cached bars are updated with the new ticks only
+    # With tick_info, the time of the last tick and if the binary log was used are returned too (for the streams)
+    def bars_get(self, market, exch_use, period, b_test, tick_info = False):
+        filename = self.filename_define(market, exch_use)
+        remove_nans = self.is_traditional(exch_use)
+        price_base = self.get_period(period, b_test)
+        key = (market, exch_use, period, price_base, b_test.timedelta_str)
+
+        entry = bar_cache.get(key)
+        if entry is not None and self.using_data_source and b_test.time() < entry['last_tick_time']:
+            entry = None    # going back in time
+        if entry is not None:
+            new_transactions = self.read_transactions_since(filename, entry['last_tick_time'], b_test, entry['binary'])
+            if new_transactions is None:
+                entry = None
+            elif new_transactions[0].size > 0:
+                timestamps, prices = new_transactions
+                transactions = pd.DataFrame({'price': prices}, index = pd.Index(timestamps, name = 'timestamp'))
+                bars = self.transaction_resample(transactions, b_test, period, price_base, remove_nans = remove_nans)
+                entry = bar_cache.extend(entry, bars, float(timestamps[-1]), self.period_seconds(period)[0] * 10**9, remove_nans)
+
+        # Full read
+        if entry is None:
+            nentries = self.get_nentries(period)
+            binary = False
+            if not self.using_data_source:
+                binary = not config.backtesting_enabled and self.use_binary(filename, nentries)
+                transactions = self.read_transactions(filename, nentries, b_test)
+                if transactions is None:
+                    return (None, None, None) if tick_info else None
+            else:
+                transactions = self.source_snapshot(b_test.time()).tail(nentries).copy()
+            if len(transactions.index) == 0:
+                return (None, None, None) if tick_info else None
+            last_tick_time = float(transactions.index[-1])
+            bars = self.transaction_resample(transactions, b_test, period, price_base, remove_nans = remove_nans)
+            entry = bar_cache.entry_from_bars(bars, last_tick_time, binary)
+            del transactions, bars
+
+        bar_cache.put(key, entry)
+        if tick_info:
+            return bar_cache.to_frame(entry), entry['last_tick_time'], entry['binary']
+        return bar_cache.to_frame(entry)
+
     # Updated function for the new pandas lib; this calc is also more precise
     def RSI(self, period=14):
         delta =  self.rsi_df.diff()
@@ -132,6 +223,55 @@ class tdlib(object):
             price_base = b_test.td_price_base_constant + self.isdaytime(b_test) # e.g. for 4h. After april-something bars will start with 2, 4, 6
         return price_base
 
+    # Period length in seconds, its multiplier and base unit (e.g. '4h' -> 14400, 4, 3600)
+    def period_seconds(self, period):
+        match = re.match(r'^(\d*)(s|min|t|h|d)$', period.lower())
+        if match.group(1) != '':
+            multiplier = int(match.group(1))
+        else:
+            multiplier = 1
+        unit = {'s': 1, 'min': 60, 't': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+        return multiplier * unit, multiplier, unit
+
+    # Shift of bars start in ns, the same as resample(period, base = price_base) does
+    def period_offset_ns(self, period, price_base):
+        period_length, multiplier, unit = self.period_seconds(period)
+        return (price_base % multiplier) * unit * 10**9
+
+    # Incremental stream for market / exchange / period, brought up to date. None if the full recalc should be used
+    # For rsi / ma (short_flag is None) any stream of the market and period is fine
+    def td_stream(self, market, exch_use, period, short_flag, b_test):
+        if not config.td_streaming or b_test is None:
+            return None
+
+        with self.td_streams_lock:
+            if short_flag is None:
+                keys = [key for key in self.td_streams.keys() if key[:3] == (market, exch_use, period)]
+                key = keys[0] if keys != [] else (market, exch_use, period, False)
+            else:
+                key = (market, exch_use, period, short_flag)
+            if key not in self.td_streams:
+                self.td_streams[key] = tdstream(self, market, exch_use, period, key[3])
+            td_stream = self.td_streams[key]
+            try:
+                if not td_stream.update(b_test):
+                    return None
+            except:
+                td_stream.primed = False
+                return None
+        return td_stream
+
+    # If there is a stream of the market and period which is primed for the current bars grid
+    def td_stream_primed(self, market, exch_use, period, price_base, b_test):
+        if not config.td_streaming or b_test is None:
+            return False
+        with self.td_streams_lock:
+            for key, td_stream in self.td_streams.items():
+                if key[:3] == (market, exch_use, period) and td_stream.primed and (
+                        td_stream.key == (price_base, b_test.timedelta_str)):
+                    return True
+        return False
+
     # More convenient use of parameters
     def price_stats(self, robot, period, tail = 10, b_test = None):
         nentries = self.get_nentries(period)
@@ -142,20 +282,63 @@ class tdlib(object):
         market = market.replace('/', '_')
         return '{}{}_{}.csv'.format(self.file_prefix, market, exch_use.lower())
 
-    # Transactions resampling
-    def transaction_resample(self, transactions, b_test, period, remove_nans = False):
-        transactions.index = pd.to_datetime(transactions.index, unit='s')
-        transactions.index = transactions.index + pd.Timedelta(b_test.timedelta_str)  # convert to local time
-        transactions['price'] = transactions.price.astype('float32')
-
-        bars = transactions.price.resample(period, base = self.price_base).ohlc()
+    # Transactions resampling, bars start with the price base (see get_period)
+    def transaction_resample(self, transactions, b_test, period, price_base, remove_nans = False):
+        # Local time, bars start with the base (DST shift included)
+        local_ns = bars_resampler.local_ns(transactions.index.values, pd.Timedelta(b_test.timedelta_str).value)
+        period_ns = self.period_seconds(period)[0] * 10**9
 
         #Remove nans for traditional markets   # HERE reason for issue with oanda (why none @ 2017-02-07 07:00)
-        if remove_nans:
-            bars = bars.dropna(axis = 0, how = 'all')
+        bars = bars_resampler.ohlc(local_ns, transactions['price'].values, period_ns,
+            self.period_offset_ns(period, price_base), remove_nans = remove_nans)
 
         return bars
 
+    # Bars for several periods from one read of the ticks (one resampling pass), e.g. to fill the cache for features
+    # Each period uses its usual number of ticks (get_nentries) unless all_ticks is set. Returns a dict of bars by period
+    def transaction_resample_multi(self, transactions, b_test, periods, remove_nans = False, all_ticks = False):
+        timestamps = transactions.index.values
+        local_ns = bars_resampler.local_ns(timestamps, pd.Timedelta(b_test.timedelta_str).value)
+        periods_params = []
+        for period in periods:
+            if all_ticks:
+                start_ns = local_ns[0]
+            else:
+                start_ns = local_ns[max(local_ns.size - self.get_nentries(period), 0)]
+            periods_params.append([period, self.period_seconds(period)[0] * 10**9,
+                self.period_offset_ns(period, self.get_period(period, b_test)), start_ns])
+        return bars_resampler.ohlc_multi(local_ns, transactions['price'].values, periods_params, remove_nans = remove_nans)
+
+    # Filling the bars cache for the periods which are not there yet with one read of the ticks
+    # Periods with primed streams are skipped: streams are updated with new ticks and do not read the cache
+    def bars_prime(self, market, exch_use, periods, b_test):
+        keys = {}
+        for period in periods:
+            price_base = self.get_period(period, b_test)
+            key = (market, exch_use, period, price_base, b_test.timedelta_str)
+            if bar_cache.get(key) is None and not self.td_stream_primed(market, exch_use, period, price_base, b_test):
+                keys[period] = key
+        if len(keys) < 2:   # nothing to share
+            return
+
+        filename = self.filename_define(market, exch_use)
+        nentries = max([self.get_nentries(period) for period in keys.keys()])
+        binary = False
+        if not self.using_data_source:
+            binary = not config.backtesting_enabled and self.use_binary(filename, nentries)
+            transactions = self.read_transactions(filename, nentries, b_test)
+            if transactions is None:
+                return
+        else:
+            transactions = self.source_snapshot(b_test.time()).tail(nentries)
+        if len(transactions.index) == 0:
+            return
+
+        last_tick_time = float(transactions.index[-1])
+        bars_periods = self.transaction_resample_multi(transactions, b_test, list(keys.keys()), remove_nans = self.is_traditional(exch_use))
+        for period, bars in bars_periods.items():
+            bar_cache.put(keys[period], bar_cache.entry_from_bars(bars, last_tick_time, binary))
+
     # More convenient use of parameters in just rsi call
     def price_rsi_stats(self, robot, period, tail = 10, b_test = None, window_length = 14):
         nentries = self.get_nentries(period)
@@ -200,48 +383,40 @@ class tdlib(object):
 
     # Main statistics on candles
     def stats(self, market, exch_use, period = '1h', nentries = 100000, tail = 10, short_flag = False, b_test = None):
-        transactions, bars_prices_original, bars = None, None, None
+        bars = None
 
-        nentries = self.get_nentries(period)
+        # Only processing new ticks if possible
+        td_stream = self.td_stream(market, exch_use, period, short_flag, b_test)
+        if td_stream is not None and tail <= td_stream.history:
+            return td_stream.stats(tail)
 
-        # If using available data source
-        if not self.using_data_source:
-            filename = self.filename_define(market, exch_use)
-            #print(filename)
-            #filename = self.file_prefix + market + '_' + exch_use.lower() + '.csv'
-            transactions = self.read_transactions(filename, nentries, b_test)
-            if transactions is None:
-                return None
-            self.price_base = self.get_period(period, b_test)
-            bars = self.transaction_resample(transactions, b_test, period, remove_nans = self.is_traditional(exch_use))
+        # Bars from the cache (updated with new ticks)
+        bars = self.bars_get(market, exch_use, period, b_test)
+        if bars is None:
+            return None
 
-            # Checking preservation - not needed
-            '''
-            datelike = transactions.loc[:,transactions.dtypes.isin([np.dtype('datetime64[ns]')])]
-            datelike = datelike.resample(period, how=lambda x: Timestamp(x.view('i8').mean()))
-            concat([numeric,datelike],axis=1)
-            '''
+        # Checking the length
+        if len(bars.index) < 7:
+            return None
 
-            # Checking the length
-            if len(bars.index) < 7:
-                return None
+        # Working through TD
+        bars = self.td_calc(bars, short_flag)
+        bars_return =  bars.tail(tail).copy()
 
-        # If recalculating on the fly
-        else:
-            transactions = self.source_snapshot(b_test.time()).tail(nentries).copy()
-            # Base for starting time
-            self.price_base = self.get_period(period, b_test)
-            bars = self.transaction_resample(transactions, b_test, period, remove_nans=self.is_traditional(exch_use))
-        
-        # Initial conditions, working through TD
-        bearish_flip = False
-        bullish_flip = False
-        setup_up = 0
-        setup_down = 0
+        # Memory cleansing
+        del bars
+        gc.collect()
+        ### ended cleanup
 
-        size = bars['close'].size
-        # print "TDLib: Bars df size:", size
+        return bars_return
+
+    # TD setup, countdowns, move extremes and RSI for the bars
+    def td_calc(self, bars, short_flag = False):
+        bars, td_state = self.td_calc_state(bars, short_flag)
+        return bars
 
+    # Same as td_calc, also returns the state after the last bar (used to continue the calc incrementally)
+    def td_calc_state(self, bars, short_flag = False):
         # Calculate the RSI values
         self.rsi_df = bars['close']
         bars['rsi'] = self.RSI(14)  # window length of 14
@@ -255,207 +430,21 @@ class tdlib(object):
         bars['td_setup'] = pd.to_numeric(bars['td_setup'], errors='coerce')
         bars['move_extreme'] = pd.to_numeric(bars['move_extreme'], errors='coerce')
 
-        # Initial direction and values
-        direction_up = False
-        direction_down = False
-        move_extreme = None
-        countdown_up_flag = False
-        countdown_down_flag = False
-        countdown_up_list = []
-        countdown_down_list = []
+        # Flips, resets, extremes and countdown conditions on the whole arrays at once
+        td_flags = self.td_flags(bars)
+        bars['if_countdown_down'] = td_flags['if_countdown_down']
+        bars['if_countdown_up'] = td_flags['if_countdown_up']
 
-        if (bars['close'].iloc[5] > bars['close'].iloc[4]):
-            direction_up = True
-        elif (bars['close'].iloc[5] < bars['close'].iloc[4]):
-            direction_down = True
-
-        # Shifting for further calculations
-        bars['shifted_1'] = bars['close'].shift(1)
-        bars['shifted_2'] = bars['close'].shift(2)
-        bars['shifted_4'] = bars['close'].shift(4)
-        bars['shifted_5'] = bars['close'].shift(5)
-        
-        # Comparison operations, resulting in A (above) or B (below)
-        bars['bear_flip'] = bars.apply(lambda x : True if x['shifted_1'] > x['shifted_5'] and x['close'] < x['shifted_4'] else False, axis=1)
-        bars['bull_flip'] = bars.apply(lambda x : True if x['shifted_1'] < x['shifted_5'] and x['close'] > x['shifted_4'] else False, axis=1)
-        bars['bear_reset'] = bars.apply(lambda x : True if x['close'] > x['shifted_4'] else False, axis=1)
-        bars['bull_reset'] = bars.apply(lambda x : True if x['close'] < x['shifted_4'] else False, axis=1)
-        # For move_extremes
-        bars['shifted_1_low'] = bars['low'].shift(1)
-        bars['shifted_2_low'] = bars['low'].shift(2)
-        bars['shifted_1_high'] = bars['high'].shift(1)
-        bars['shifted_2_high'] = bars['high'].shift(2)
-        # Resulting move_extreme
-        bars['max_1_2'] = bars[['shifted_1_high', 'shifted_2_high']].max(axis = 1)
-        bars['min_1_2'] = bars[['shifted_1_low', 'shifted_2_low']].min(axis = 1)
-        # For countdowns
-        bars['if_countdown_down'] = bars.apply(lambda x: True if x['close'] <= x['shifted_2_low'] else False, axis=1)
-        bars['if_countdown_up'] = bars.apply(lambda x: True if x['close'] >= x['shifted_2_high'] else False, axis=1)
-
-        np_setup = np.zeros(shape = (size, 1), dtype = int)
-        np_direction = np.empty(shape = (size, 1), dtype=object)
-        np_move_extremes = np.empty(shape = (size, 1))
-        np_move_extremes.fill(np.nan)
-        # Countdown
-        np_countdown_up = np.zeros(shape = (size, 1), dtype = int)
-        np_countdown_down = np.zeros(shape = (size, 1), dtype = int)
-
-        ## Looping through, numpy to speed up
-        # 0 O
-        # 1 H
-        # 2 L
-        # 3 C
-        # 4 rsi
-        # 5 td_setup
-        # 6 td_direction
-        # 7 move_extr
-        # 8 shifted_1
-        # 9 shifted_2
-        # 10 shifted_4
-        # 11 shifted_5
-        # 12 bear_flip
-        # 13 bull_flip
-        # 14 bear_reset
-        # 15 bull_reset
-        # ...
-        # 20 max_1_2
-        # 21 min_1_2
-        # 22 if_countdown_down
-        # 23 if_countdown_up
-
-        # print "Directions", direction_down, direction_up # this is ok
-
-        for i, bar_row in enumerate(bars.values):
-            if i > 5:    # need 6 candles to start
-                ## Price flip
-                bearish_flip = False
-                bullish_flip = False
-
-                if setup_up == 9:
-                    setup_up = 0 # restart count
-                if setup_down == 9:
-                    setup_down = 0 # restart count
-
-                # Flips - bearish
-                # TEST
-                '''
-                if i < 20: 
-                    print "Close price", bar_row[3]   # this is ok  
-                    print "Bear_flip", bar_row[12]      # this is not 
-                    print "i-1 {} i-5 {}   i-3 {} i-10 {}".format(bar_row[8], bar_row[11], bar_row[3], bar_row[10]) 
-                '''
-
-                if bar_row[12]:
-                    bearish_flip = True
-                    direction_down = True
-                    bullish_flip = False
-                    move_extreme = None
-
-                # Flips - bullish
-                if bar_row[13]:
-                    bullish_flip = True
-                    direction_up = True
-                    bearish_flip = False
-                    move_extreme = None
-
-                if bearish_flip and direction_up:
-                    direction_up = False
-                    setup_down = 1
-                if bullish_flip and direction_down:
-                    direction_down = False
-                    setup_up = 1
-
-                ## TD Setup (sequential)        # bear reset
-                if direction_down and not bearish_flip:
-                    if bar_row[14]:    # restarting if a condition is not met
-                        setup_down = 1
-                    else:
-                        setup_down += 1
-
-                if direction_up and not bullish_flip:       # bull reset
-                    if bar_row[15]:  # restarting if a condition is not met
-                        setup_up = 1
-                    else:
-                        setup_up += 1
-
-                ## Move_extreme update; based on 2 completed td intervals so we have at least 1 -> 2
-                # That is why referring to 3 here (the script returns all including the current one )
-                # Otherwise it would be exiting on every flip potentially
-                if (direction_down and (setup_down > 2) and short_flag):
-                    if setup_down == 3:
-                        move_extreme = bar_row[20]
-                    else:
-                        if (bar_row[1] > move_extreme):
-                            move_extreme = bar_row[1]
-
-                if (direction_up and (setup_up > 2) and not short_flag):
-                    if setup_up == 3:
-                        move_extreme = bar_row[21]
-                    else:
-                        if (bar_row[2] < move_extreme):
-                            move_extreme = bar_row[2]
-
-                # Filling the np arrays
-                if direction_down:
-                    np_setup[i] = setup_down
-                    np_direction[i] = 'red'           # down
-                if direction_up:
-                    np_setup[i] = setup_up
-                    np_direction[i] = 'green'           # up
-                # Common for any direction
-                np_move_extremes[i] = move_extreme
-
-                # Countdowns check
-                # Will need to store a list with counters
-                # If there is active countdown but we get a 9 in the same direction again - one more countdown is added
-                # If a 9 in different direction - the previous direction countdown should stop
-                if direction_up and setup_up == 9:
-                    countdown_up_flag = True
-                    countdown_down_flag = False  # also in this case delete countdowns
-                    countdown_down_list = []
-                    countdown_up_list.append(0) # reserving place for counter increase
-                if direction_down and setup_down == 9:
-                    countdown_down_flag = True
-                    countdown_up_flag = False
-                    countdown_up_list = []
-                    countdown_down_list.append(0) # reserving place for counter increase
-                # TD seq buy: if bar 9 has a close less than or equal to the low of two bars earlier
-                # then bar 9 becomes 1 countdown
-                # if not met - then countdown 1 postponed until condition is met and continues until total of 13 closes
-                # each should be less or equal to the low 2 bars earlier
-                # If one of elements in on 13, delete it.
-                # This is a simplified approach as completion of 13 also requires comparison with 8th setup bar
-                if direction_up and countdown_up_flag and bar_row[23]:
-                    countdown_up_list = [x + 1 for x in countdown_up_list]
-                    countdown_up_list = [x for x in countdown_up_list if x != 13]
-                if countdown_up_list != []:
-                    np_countdown_up[i] = max(countdown_up_list) # this is enough for our purposes
-                if direction_down and countdown_down_flag and bar_row[22]:
-                    countdown_down_list = [x + 1 for x in countdown_down_list]
-                    countdown_down_list = [x for x in countdown_down_list if x != 13]
-                if countdown_down_list != []:
-                    np_countdown_down[i] = max(countdown_down_list) # this is enough for our purposes
+        # Running the setup / countdown state machine
+        np_setup, np_direction, np_move_extremes, np_countdown_up, np_countdown_down, td_state = self.td_sequential(
+            td_flags, short_flag, self.td_initial_state(bars))
 
         # Join np arrays with the dataframe
-        setup_df = pd.DataFrame(data = np_setup)
-        setup_df.index = bars.index.copy()
-        bars['td_setup'] = setup_df
-
-        setup_dir = pd.DataFrame(data = np_direction)
-        setup_dir.index = bars.index.copy()
-        bars['td_direction'] = setup_dir
-
-        move_extreme_df = pd.DataFrame(data = np_move_extremes)
-        move_extreme_df.index = bars.index.copy()
-        bars['move_extreme'] = move_extreme_df
-
-        np_countdown_up_df = pd.DataFrame(data = np_countdown_up)
-        np_countdown_up_df.index = bars.index.copy()
-        bars['countdown_up'] = np_countdown_up_df
-
-        np_countdown_down_df = pd.DataFrame(data = np_countdown_down)
-        np_countdown_down_df.index = bars.index.copy()
-        bars['countdown_down'] = np_countdown_down_df
+        bars['td_setup'] = np_setup
+        bars['td_direction'] = np_direction
+        bars['move_extreme'] = np_move_extremes
+        bars['countdown_up'] = np_countdown_up
+        bars['countdown_down'] = np_countdown_down
 
         # Change types to save memory
         bars['countdown_up'] = bars.countdown_up.astype('int8')
@@ -466,50 +455,220 @@ class tdlib(object):
         bars['low'] = bars.low.astype('float32')
         bars['close'] = bars.close.astype('float32')
 
-        # Deleting unnecessary rows
-        for elem in ['shifted_1', 'shifted_2', 'shifted_4', 'shifted_5',
-                'bear_flip', 'bull_flip', 'bear_reset', 'bull_reset', 'shifted_1_low',
-                'shifted_2_low', 'shifted_1_high', 'shifted_2_high',
-                'max_1_2', 'min_1_2'
-                ]:
-            del bars[elem]
+        # Memory cleansing
+        del np_setup, td_flags
+        del np_direction, np_move_extremes, np_countdown_down, np_countdown_up
 
+        return bars, td_state
+
+    # Shifting a numpy array the same way as pandas shift(n) does, with nans in the beginning
+    def shift_array(self, values, n):
+        shifted = np.empty(values.size, dtype = 'float64')
+        shifted[:n] = np.nan
+        if n < values.size:
+            shifted[n:] = values[:values.size - n]
+        return shifted
+
+    # Comparison operations for TD on the whole arrays (replaces row by row apply)
+    def td_flags(self, bars):
+        return self.td_flags_arrays(bars['close'].values, bars['high'].values, bars['low'].values)
+
+    def td_flags_arrays(self, close, high, low):
+        close = np.asarray(close, dtype = 'float64')
+        high = np.asarray(high, dtype = 'float64')
+        low = np.asarray(low, dtype = 'float64')
+
+        shifted_1 = self.shift_array(close, 1)
+        shifted_4 = self.shift_array(close, 4)
+        shifted_5 = self.shift_array(close, 5)
+        shifted_1_low = self.shift_array(low, 1)
+        shifted_2_low = self.shift_array(low, 2)
+        shifted_1_high = self.shift_array(high, 1)
+        shifted_2_high = self.shift_array(high, 2)
+
+        # Comparisons with nans are False, same as in the previous row-wise version
+        with np.errstate(invalid = 'ignore'):
+            td_flags = {
+                'bear_flip': (shifted_1 > shifted_5) & (close < shifted_4),
+                'bull_flip': (shifted_1 < shifted_5) & (close > shifted_4),
+                'bear_reset': close > shifted_4,
+                'bull_reset': close < shifted_4,
+                # For countdowns
+                'if_countdown_down': close <= shifted_2_low,
+                'if_countdown_up': close >= shifted_2_high
+            }
+        # Resulting move_extreme (nans are skipped like in pandas max / min)
+        td_flags['max_1_2'] = np.fmax(shifted_1_high, shifted_2_high)
+        td_flags['min_1_2'] = np.fmin(shifted_1_low, shifted_2_low)
+        td_flags['high'] = high
+        td_flags['low'] = low
+
+        return td_flags
+
+    # Initial direction and values for the TD state machine
+    def td_initial_state(self, bars):
+        direction_up = False
+        direction_down = False
+        if (bars['close'].iloc[5] > bars['close'].iloc[4]):
+            direction_up = True
+        elif (bars['close'].iloc[5] < bars['close'].iloc[4]):
+            direction_down = True
 
-        bars_return =  bars.tail(tail).copy()
+        # direction_up, direction_down, setup_up, setup_down, move_extreme,
+        # countdown_up_flag, countdown_down_flag, countdown_up_list, countdown_down_list
+        return [direction_up, direction_down, 0, 0, np.nan, False, False, [], []]
+
+    # TD setup / countdown state machine. Works with plain lists as this is much faster than rows of objects
+    # Returns the arrays to join with bars and the state after the last bar so that the calc could be continued
+    def td_sequential(self, td_flags, short_flag, td_state, start = 6):
+        (direction_up, direction_down, setup_up, setup_down, move_extreme,
+            countdown_up_flag, countdown_down_flag, countdown_up_list, countdown_down_list) = td_state
+        countdown_up_list = list(countdown_up_list)
+        countdown_down_list = list(countdown_down_list)
+
+        bear_flips = td_flags['bear_flip'].tolist()
+        bull_flips = td_flags['bull_flip'].tolist()
+        bear_resets = td_flags['bear_reset'].tolist()
+        bull_resets = td_flags['bull_reset'].tolist()
+        max_1_2 = td_flags['max_1_2'].tolist()
+        min_1_2 = td_flags['min_1_2'].tolist()
+        highs = td_flags['high'].tolist()
+        lows = td_flags['low'].tolist()
+        if_countdown_down = td_flags['if_countdown_down'].tolist()
+        if_countdown_up = td_flags['if_countdown_up'].tolist()
+
+        size = len(highs)
+        np_setup = [0] * size
+        np_direction = [None] * size
+        np_move_extremes = [np.nan] * size
+        np_countdown_up = [0] * size
+        np_countdown_down = [0] * size
+
+        for i in range(start, size):    # need 6 candles to start
+            ## Price flip
+            bearish_flip = False
+            bullish_flip = False
+
+            if setup_up == 9:
+                setup_up = 0 # restart count
+            if setup_down == 9:
+                setup_down = 0 # restart count
+
+            # Flips - bearish
+            if bear_flips[i]:
+                bearish_flip = True
+                direction_down = True
+                bullish_flip = False
+                move_extreme = np.nan
 
-        # Memory cleansing
-        del transactions
-        del bars
-        if bars_prices_original is not None:
-            del bars_prices_original
-        del np_setup, move_extreme, setup_down, setup_up
-        del np_direction, np_move_extremes, np_countdown_down, np_countdown_up
-        gc.collect()
-        ### ended cleanup
+            # Flips - bullish
+            if bull_flips[i]:
+                bullish_flip = True
+                direction_up = True
+                bearish_flip = False
+                move_extreme = np.nan
+
+            if bearish_flip and direction_up:
+                direction_up = False
+                setup_down = 1
+            if bullish_flip and direction_down:
+                direction_down = False
+                setup_up = 1
+
+            ## TD Setup (sequential)        # bear reset
+            if direction_down and not bearish_flip:
+                if bear_resets[i]:    # restarting if a condition is not met
+                    setup_down = 1
+                else:
+                    setup_down += 1
 
-        return bars_return
+            if direction_up and not bullish_flip:       # bull reset
+                if bull_resets[i]:  # restarting if a condition is not met
+                    setup_up = 1
+                else:
+                    setup_up += 1
+
+            ## Move_extreme update; based on 2 completed td intervals so we have at least 1 -> 2
+            # That is why referring to 3 here (the script returns all including the current one )
+            # Otherwise it would be exiting on every flip potentially
+            if (direction_down and (setup_down > 2) and short_flag):
+                if setup_down == 3:
+                    move_extreme = max_1_2[i]
+                else:
+                    if (highs[i] > move_extreme):
+                        move_extreme = highs[i]
+
+            if (direction_up and (setup_up > 2) and not short_flag):
+                if setup_up == 3:
+                    move_extreme = min_1_2[i]
+                else:
+                    if (lows[i] < move_extreme):
+                        move_extreme = lows[i]
+
+            # Filling the arrays
+            if direction_down:
+                np_setup[i] = setup_down
+                np_direction[i] = 'red'           # down
+            if direction_up:
+                np_setup[i] = setup_up
+                np_direction[i] = 'green'           # up
+            # Common for any direction
+            np_move_extremes[i] = move_extreme
+
+            # Countdowns check
+            # Will need to store a list with counters
+            # If there is active countdown but we get a 9 in the same direction again - one more countdown is added
+            # If a 9 in different direction - the previous direction countdown should stop
+            if direction_up and setup_up == 9:
+                countdown_up_flag = True
+                countdown_down_flag = False  # also in this case delete countdowns
+                countdown_down_list = []
+                countdown_up_list.append(0) # reserving place for counter increase
+            if direction_down and setup_down == 9:
+                countdown_down_flag = True
+                countdown_up_flag = False
+                countdown_up_list = []
+                countdown_down_list.append(0) # reserving place for counter increase
+            # TD seq buy: if bar 9 has a close less than or equal to the low of two bars earlier
+            # then bar 9 becomes 1 countdown
+            # if not met - then countdown 1 postponed until condition is met and continues until total of 13 closes
+            # each should be less or equal to the low 2 bars earlier
+            # If one of elements in on 13, delete it.
+            # This is a simplified approach as completion of 13 also requires comparison with 8th setup bar
+            if direction_up and countdown_up_flag and if_countdown_up[i]:
+                countdown_up_list = [x + 1 for x in countdown_up_list if x != 12]
+            if countdown_up_list != []:
+                np_countdown_up[i] = max(countdown_up_list) # this is enough for our purposes
+            if direction_down and countdown_down_flag and if_countdown_down[i]:
+                countdown_down_list = [x + 1 for x in countdown_down_list if x != 12]
+            if countdown_down_list != []:
+                np_countdown_down[i] = max(countdown_down_list) # this is enough for our purposes
+
+        td_state = [direction_up, direction_down, setup_up, setup_down, move_extreme,
+            countdown_up_flag, countdown_down_flag, countdown_up_list, countdown_down_list]
+
+        return (np.array(np_setup, dtype = int), np.array(np_direction, dtype = object),
+            np.array(np_move_extremes, dtype = 'float64'), np.array(np_countdown_up, dtype = int),
+            np.array(np_countdown_down, dtype = int), td_state)
 
 
     ### Only returning rsi
     def stats_rsi_only(self, market, exch_use, period = '1h', nentries = 100000, tail = 10, short_flag = False,
         b_test = None, window_length = 14, bars_to_use = None):
 
-        nentries = self.get_nentries(period)
+        # Only processing new ticks if possible (streams have the bars of the market, not the ones provided)
+        if window_length == 14 and bars_to_use is None:
+            td_stream = self.td_stream(market, exch_use, period, None, b_test)
+            if td_stream is not None:
+                return td_stream.rsi()
 
-        if not self.using_data_source:
-            # Added for cases when we have a different reference exchange / market for calculating the TD
-            filename = self.filename_define(market, exch_use)
-            transactions = self.read_transactions(filename, nentries, b_test)
-            if transactions is None:
-                return None
-        # if bars are provided, e.g. for traditional markets
+        # Bars provided or from the cache (updated with new ticks)
+        if bars_to_use is not None:
+            bars = bars_to_use
         else:
-            transactions = self.source_snapshot(b_test.time()).tail(nentries).copy()
-
-        # Base for starting time
-        self.price_base = self.get_period(period, b_test)
-        bars = self.transaction_resample(transactions, b_test, period, remove_nans=self.is_traditional(exch_use))
-        del transactions
+            bars = self.bars_get(market, exch_use, period, b_test)
+        if bars is None:
+            return None
 
         # Calculate the RSI values
         self.rsi_df = bars['close']
@@ -527,30 +686,18 @@ class tdlib(object):
     def stats_MA_only(self, market, exch_use, period = '1h', maperiod = 10, nentries = 100000, tail = 10, short_flag = False,
         b_test = None, ma_calc = 'simple'):
 
-        nentries = self.get_nentries(period)
+        # Only processing new ticks if possible
+        td_stream = self.td_stream(market, exch_use, period, None, b_test)
+        if td_stream is not None and maperiod <= td_stream.history:
+            return td_stream.ma(maperiod, ma_calc)
 
-        if not self.using_data_source:
-            # Added for cases when we have a different reference exchange / market for calculating the TD
-            filename = self.filename_define(market, exch_use)
-            transactions = self.read_transactions(filename, nentries, b_test)
-            if transactions is None:
-                return None
-        # if bars are provided, e.g. for traditional markets
-        else:
-            transactions = self.source_snapshot(b_test.time()).tail(nentries).copy()
-
-        # Base for starting time
-        self.price_base = self.get_period(period, b_test)
-        bars = self.transaction_resample(transactions, b_test, period, remove_nans = self.is_traditional(exch_use))
-        del transactions
+        # Bars from the cache (updated with new ticks)
+        bars = self.bars_get(market, exch_use, period, b_test)
+        if bars is None:
+            return None
 
         # Calculate the MA values
-        ma_df = bars['close']   # why not working for simple ma for oanda?
-
-        if ma_calc == 'simple':
-            ma_rolling = ma_df.rolling(window=maperiod, min_periods=maperiod).mean()
-        else:
-            ma_rolling = pd.ewma(ma_df, span=maperiod)
+        ma_rolling = self.moving_average(bars['close'], maperiod, ma_calc)   # why not working for simple ma for oanda?
 
         # Memory cleaning
         del bars
@@ -559,6 +706,13 @@ class tdlib(object):
 
         return ma_rolling
         
+    # Simple or exponential moving average of closes
+    def moving_average(self, ma_df, maperiod, ma_calc = 'simple'):
+        if ma_calc == 'simple':
+            return ma_df.rolling(window=maperiod, min_periods=maperiod).mean()
+        else:
+            return ma_df.ewm(span=maperiod).mean()
+
     ### Returning the max or min of last N candles for specific period 
     def last_extreme_close(self, market, exch_use, period = '1h', nentries = 100000, tail = 10, short_flag = False, number_compare = 4):
         bars = self.stats(market, exch_use, period, nentries, tail, short_flag)
@@ -1026,23 +1180,28 @@ class tdlib(object):
 
     # Predict, current approach 
     def predict_label(self, X, robot):
+        return self.predict_labels(X, robot.model_name)[0]
 
-        bst = xgb.Booster({'nthread': 4})  # init model
-        bst.load_model('models/{}'.format(robot.model_name))  # load the model
-
+    # Predictions for several rows (e.g. markets sharing the model) with one predict call
+    # Returns a list of (label, label_probability), one per row
+    def predict_labels(self, X, model_name):
+        filename = 'models/{}'.format(model_name)
         try: # may not work if there are Nones
-            dtest = xgb.DMatrix(X)
-            pred = bst.predict(dtest)
-            label = np.argmax(pred, axis=1)[0]   # giving a prediction:
-            # 0 : nothing
-            # 1 : long
-            # 2: short
-            label_probability = pred[0][int(label)]
-        except ValueError:   # in case it fails
-            label, label_probability = 0, 1
-            print('Note: Issue when predicting the value')
-
-        return label, label_probability
+            pred = model_registry.predict(filename, X)
+        except ValueError:   # in case it fails: row by row so that only the rows with issues are affected
+            if len(X.index) == 1:
+                print('Note: Issue when predicting the value')
+                return [(0, 1)]
+            results = []
+            for i in range(len(X.index)):
+                results.extend(self.predict_labels(X.iloc[i:i + 1], model_name))
+            return results
+
+        labels = np.argmax(pred, axis=1)   # giving a prediction:
+        # 0 : nothing
+        # 1 : long
+        # 2: short
+        return [(int(label), pred[i][int(label)]) for i, label in enumerate(labels)]
 
 
     ### Data preparation
@@ -1075,6 +1234,9 @@ class tdlib(object):
 
         bars_temp = None
 
+        # All the periods are resampled at once if not cached yet
+        self.bars_prime(robot.market, robot.exchange_abbr, period_arr, b_test)
+
         for period in period_arr:
             if robot.logger is not None:
                 robot.logger.lprint(["(i) updating features for {}".format(period)])
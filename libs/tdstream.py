@@ -0,0 +1,195 @@
+from collections import deque
+
+import pandas as pd
+import numpy as np
+
+# Incremental (streaming) TD / RSI / MA for one market, exchange and period
+# Primed once from the same history as tdlib.stats(), then updated only with the ticks which arrived since the last call:
+# the current bar is updated on each tick and TD setup / countdown, RSI and MA states are moved forward when a bar closes
+class tdstream(object):
+    def __init__(self, td_info, market, exch_use, period, short_flag = False, history = 500, rsi_window = 14):
+        self.td_info = td_info
+        self.market = market
+        self.exch_use = exch_use
+        self.period = period
+        self.short_flag = short_flag
+        self.history = history   # closed bars kept (enough for MAs and the tails requested by the robot)
+        self.rsi_window = rsi_window
+        self.remove_nans = td_info.is_traditional(exch_use)
+        self.filename = td_info.filename_define(market, exch_use)
+        self.period_length, _, _ = td_info.period_seconds(period)
+        self.primed = False
+        self.key = None
+
+        self.columns = ['timestamp', 'open', 'high', 'low', 'close', 'rsi', 'td_setup', 'td_direction', 'move_extreme',
+            'if_countdown_down', 'if_countdown_up', 'countdown_up', 'countdown_down']
+
+    # Start of the bar (in local time seconds) for a tick timestamp. Bars grid is the one from resample() when primed
+    def bar_start(self, timestamp):
+        local_time = timestamp + self.local_shift
+        return self.anchor + np.floor((local_time - self.anchor) / self.period_length) * self.period_length
+
+    # Bars index to seconds
+    def index_seconds(self, index):
+        return np.asarray((index - pd.Timestamp(0)) / pd.Timedelta(seconds = 1), dtype = 'float64')
+
+    # Full recalculation from the same bars as tdlib.stats() uses (shared bars cache, resampled once for all the calls)
+    def prime(self, b_test):
+        self.primed = False
+        price_base = self.td_info.get_period(self.period, b_test)
+        bars, last_tick_time, binary = self.td_info.bars_get(self.market, self.exch_use, self.period, b_test, tick_info = True)
+        if bars is None or len(bars.index) < 7:
+            return False
+        self.last_tick_time, self.binary = last_tick_time, binary
+
+        self.price_base = price_base
+        self.local_shift = pd.Timedelta(b_test.timedelta_str).total_seconds()
+        self.key = (self.price_base, b_test.timedelta_str)
+
+        self.prime_bars(bars)
+        del bars
+        return True
+
+    # State from resampled bars: all but the last bar are closed, the last one is the current bar
+    def prime_bars(self, bars):
+        bars_closed, self.td_state = self.td_info.td_calc_state(bars.iloc[:-1].copy(), self.short_flag)
+
+        timestamps = self.index_seconds(bars_closed.index).tolist()
+        columns_values = [timestamps] + [bars_closed[column].tolist() for column in self.columns[1:]]
+        self.rows = deque(zip(*columns_values), maxlen = self.history)
+
+        # RSI state is replayed through all closed bars
+        self.rsi_state = self.rsi_initial_state()
+        for close in bars_closed['close'].tolist():
+            self.rsi_state = self.rsi_step(self.rsi_state, close)
+
+        # Current (not closed yet) bar
+        last_bar = bars.iloc[-1]
+        self.current = [self.index_seconds(bars.index)[-1],
+            float(last_bar['open']), float(last_bar['high']), float(last_bar['low']), float(last_bar['close'])]
+        self.anchor = self.current[0]
+
+        del bars_closed
+        self.primed = True
+
+    # Bringing the state up to the current time
+    def update(self, b_test):
+        price_base = self.td_info.get_period(self.period, b_test)
+        if not self.primed or self.key != (price_base, b_test.timedelta_str):   # bars shift e.g. on DST change
+            return self.prime(b_test)
+        if self.td_info.using_data_source and b_test.time() < self.last_tick_time:   # going back in time
+            return self.prime(b_test)
+
+        timestamps, prices = self.new_ticks(b_test)
+        if timestamps is None:
+            return self.prime(b_test)
+        for timestamp, price in zip(timestamps, prices):
+            self.add_tick(timestamp, price)
+        if len(timestamps) > 0:
+            self.last_tick_time = timestamps[-1]
+        return True
+
+    # Ticks which arrived since the last update
+    def new_ticks(self, b_test):
+        new_transactions = self.td_info.read_transactions_since(self.filename, self.last_tick_time, b_test, self.binary)
+        if new_transactions is None:
+            return None, None
+        timestamps, prices = new_transactions
+        return timestamps.tolist(), prices.astype('float32').tolist()
+
+    # Updating the current bar or closing it if the tick belongs to the next one
+    def add_tick(self, timestamp, price):
+        bar_start = self.bar_start(timestamp)
+        if bar_start == self.current[0]:
+            self.current[2] = max(self.current[2], price)
+            self.current[3] = min(self.current[3], price)
+            self.current[4] = price
+        elif bar_start > self.current[0]:
+            self.close_bar(self.current)
+            # Empty bars in between (not for traditional markets where nans are removed)
+            if not self.remove_nans:
+                empty_start = self.current[0] + self.period_length
+                while empty_start < bar_start:
+                    self.close_bar([empty_start, np.nan, np.nan, np.nan, np.nan])
+                    empty_start += self.period_length
+            self.current = [bar_start, price, price, price, price]
+
+    # TD and RSI values for a new bar. Returns the row and states without changing the stream
+    def bar_values(self, bar):
+        bar_start, bar_open, bar_high, bar_low, bar_close = bar
+
+        # Last 5 closes and 2 highs / lows are enough for the flips and countdown conditions
+        previous = list(self.rows)[-5:]
+        closes = [row[4] for row in previous] + [bar_close]
+        highs = [row[2] for row in previous] + [bar_high]
+        lows = [row[3] for row in previous] + [bar_low]
+        td_flags = self.td_info.td_flags_arrays(closes, highs, lows)
+        td_flags = {key: value[-1:] for key, value in td_flags.items()}
+
+        np_setup, np_direction, np_move_extremes, np_countdown_up, np_countdown_down, td_state = self.td_info.td_sequential(
+            td_flags, self.short_flag, self.td_state, start = 0)
+
+        rsi_state = self.rsi_step(self.rsi_state, bar_close)
+
+        row = (bar_start, bar_open, bar_high, bar_low, bar_close, self.rsi_value(rsi_state),
+            int(np_setup[0]), np_direction[0], float(np_move_extremes[0]),
+            bool(td_flags['if_countdown_down'][0]), bool(td_flags['if_countdown_up'][0]),
+            int(np_countdown_up[0]), int(np_countdown_down[0]))
+
+        return row, td_state, rsi_state
+
+    # Moving the states forward with a closed bar
+    def close_bar(self, bar):
+        row, self.td_state, self.rsi_state = self.bar_values(bar)
+        self.rows.append(row)
+
+    ### RSI: same as pandas ewm(com = window - 1, adjust = False) used in tdlib.RSI, one value at a time
+    def rsi_initial_state(self):
+        return {'up': np.nan, 'down': np.nan, 'old_wt': 1., 'prev_close': np.nan}
+
+    def rsi_step(self, rsi_state, close):
+        alpha = 1. / self.rsi_window
+        delta = float(np.float32(close) - np.float32(rsi_state['prev_close']))
+        rsi_state = dict(rsi_state, prev_close = close)
+
+        if rsi_state['up'] == rsi_state['up']:
+            rsi_state['old_wt'] *= 1. - alpha
+            if delta == delta:
+                up, down = max(delta, 0.), min(delta, 0.)
+                old_wt = rsi_state['old_wt']
+                if rsi_state['up'] != up:
+                    rsi_state['up'] = ((old_wt * rsi_state['up']) + (alpha * up)) / (old_wt + alpha)
+                if rsi_state['down'] != down:
+                    rsi_state['down'] = ((old_wt * rsi_state['down']) + (alpha * down)) / (old_wt + alpha)
+                rsi_state['old_wt'] = 1.
+        elif delta == delta:
+            rsi_state['up'], rsi_state['down'] = max(delta, 0.), min(delta, 0.)
+
+        return rsi_state
+
+    def rsi_value(self, rsi_state):
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return float(100 - 100 / (1 + np.float64(rsi_state['up']) / abs(np.float64(rsi_state['down']))))
+
+    ### Returning values
+    # Same as tdlib.stats() tail: closed bars and the current one
+    def stats(self, tail = 10):
+        row, _, _ = self.bar_values(self.current)
+        rows = list(self.rows)[-(tail - 1):] + [row] if tail > 1 else [row]
+
+        bars = pd.DataFrame(rows, columns = self.columns)
+        bars['timestamp'] = (bars['timestamp'] * 10**9).astype('int64').astype('datetime64[ns]')
+        bars = bars.set_index('timestamp')
+        for column in ['open', 'high', 'low', 'close']:
+            bars[column] = bars[column].astype('float32')
+        for column in ['td_setup', 'countdown_up', 'countdown_down']:
+            bars[column] = bars[column].astype('int8')
+        return bars
+
+    # RSI values for all the stored bars
+    def rsi(self):
+        return self.stats(self.history + 1)['rsi']
+
+    # Moving averages for all the stored bars
+    def ma(self, maperiod, ma_calc = 'simple'):
+        return self.td_info.moving_average(self.stats(self.history + 1)['close'], maperiod, ma_calc)
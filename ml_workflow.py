@@ -8,6 +8,8 @@ from matplotlib.pylab import rcParams
 import backtest
 import libs.sqltools as sqltools
 import libs.tdlib as tdlib
+import libs.featurebuilder as featurebuilder
+import libs.migrations as migrations
 from multiprocessing import Pool
 import argparse
 
@@ -226,6 +228,27 @@ def generate_datapoints(time_date, finish_date, exchange_abbr, market, processor
             exit(0)
         '''
 
+# Bulk version: ticks are read and resampled once for all the data points, rows appended to DB in one go
+def generate_datapoints_bulk(time_date, finish_date, exchange_abbr, market):
+
+    time_interval = 30   # in minutes to add
+    date_points = []
+    while time_date < finish_date:
+        date_points.append(time_date)
+        time_date += timedelta(minutes=time_interval)
+
+    builder = featurebuilder.featurebuilder(td_info, exchange_abbr, market, period_arr = ['1h', '4h', '1d'])
+    bars_result = builder.build(date_points)
+    print("Generated {} data points of {}".format(len(bars_result.index), len(date_points)))
+
+    conn = sqlite3.connect("workflow.db")
+    bars_result.to_sql("labels_generated", conn, if_exists='append')
+    conn.commit()
+    conn.close()
+
+    # Indexes for labels_generated if the table was just created
+    migrations.migrations().migrate()
+
 ### Input check
 def check_input_var(exch_abbr, market, pickle_name, file_name_labels, step, processors_no, step_0_start_date, step_0_finish_date, modelname):
 
@@ -233,7 +256,7 @@ def check_input_var(exch_abbr, market, pickle_name, file_name_labels, step, proc
         return False
 
     if step == 0:
-        if None in [exch_abbr, market, file_name_labels, processors_no, step_0_start_date, step_0_finish_date]:
+        if None in [exch_abbr, market, file_name_labels, step_0_start_date, step_0_finish_date]:
             return False
     elif step == 1:
         if None in [exch_abbr, market, pickle_name, file_name_labels, step_0_start_date, step_0_finish_date]:
@@ -266,7 +289,7 @@ def process_input():
 --pickle_validate [step 1-3]: pickle_name for validation set (e.g. btc_data_validate) 
 --labels [step 1]: filename - interval data (e.g. ML/interval_data.csv)
 --validate_labels [step 1]: filename - interval data for validation (e.g. ML/interval_data_validate.csv)
---proc [step 0]: number of processors for calc on step 0. E.g. c5.18xlarge has 72 processors
+--proc [step 0]: number of processors for calc on step 0 point by point. If not provided, features are generated in bulk
 --start [step 0-1]: date (format 2016-12-15-00:25)
 --end [step 0-1]: date (format 2018-09-20-00:55)
         '''
@@ -352,43 +375,41 @@ def intervals_labels(db_name, labels_file, pickle_to_save):
 
         labels_arr = pd.read_csv(labels_file) #, names=['timestamp','label']).set_index('timestamp')
 
-        arr_labels = []
+        # Labelled ranges to 30min timestamps
+        label_times, label_values = [], []
         for index, row in labels_arr.iterrows():
+            try:
+                label = int(row['label'])
+            except:
+                continue
             date_start = datetime.strptime(row['start'], '%d-%m-%Y %H:%M')
             date_end = datetime.strptime(row['end'], '%d-%m-%Y %H:%M')
             time_range = pd.date_range(date_start, date_end, freq='30min')
-            for x in time_range:
-                try:
-                    arr_labels.append([str(x), int(row['label'])])
-                except:
-                    pass
+            label_times.append(time_range.values.astype('datetime64[ns]'))
+            label_values.append(np.full(len(time_range), label))
 
-        arr_labels = pd.DataFrame(arr_labels, columns=['timestamp', 'label'])
+        arr_labels = pd.DataFrame({
+            'label_timestamp': np.concatenate(label_times) if label_times != [] else np.empty(0, dtype='datetime64[ns]'),
+            'label': np.concatenate(label_values) if label_values != [] else np.empty(0, dtype=int)
+        })
+        arr_labels['order'] = np.arange(len(arr_labels.index))
 
         conn = sqlite3.connect(db_name)
         sql_text = "SELECT * FROM labels_generated where market = '{}' and exchange = '{}'".format(market, exch_abbr)
         train = pd.read_sql(sql_text, conn, index_col='timestamp')
 
-        train.index = pd.to_datetime(train.index)
+        train.index = pd.to_datetime(train.index).astype('datetime64[ns]')
         train = train.sort_index()
 
         conn.close()
 
-        # Glue this with btc_data_points_30min, each should be within the range
-        labeled_dataset = None
-
-        for index, row in arr_labels.iterrows():
-            timest_conv = datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S')
-            print(">", index, row['label'], timest_conv)
-
-            bars_tmp = train[train.index < timest_conv][-1:] # get only the last point; put this into new df
-
-            #bars_tmp.reset_index(drop=True, inplace=True)
-            bars_tmp['label'] = row['label']
-            if labeled_dataset is None:
-                labeled_dataset = bars_tmp.copy()
-            else:
-                labeled_dataset = labeled_dataset.append(bars_tmp.copy())
+        # Glue this with btc_data_points_30min: each label gets the last point before its timestamp (as-of join)
+        train_columns = list(train.columns)
+        train = train.reset_index()
+        labeled_dataset = pd.merge_asof(arr_labels.sort_values('label_timestamp', kind='stable'), train,
+            left_on='label_timestamp', right_on='timestamp', direction='backward', allow_exact_matches=False)
+        labeled_dataset = labeled_dataset[labeled_dataset['timestamp'].notnull()].sort_values('order')
+        labeled_dataset = labeled_dataset.set_index('timestamp')[train_columns + ['label']]
 
         print(labeled_dataset.info())
         print(labeled_dataset.head())
@@ -584,7 +605,10 @@ if __name__ == "__main__":
 
     # 0. Create features set
     if step == 0:
-        generate_datapoints(step_0_start_date, step_0_finish_date, exch_abbr, market, processors_no) # do this for training points mapping to features, preferably on AWS
+        if processors_no is not None:
+            generate_datapoints(step_0_start_date, step_0_finish_date, exch_abbr, market, processors_no) # do this for training points mapping to features, preferably on AWS
+        else:
+            generate_datapoints_bulk(step_0_start_date, step_0_finish_date, exch_abbr, market)
 
     # 1. Read labels intervals file to generate labels
     if step == 1:
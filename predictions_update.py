@@ -1,4 +1,6 @@
 import time as t
+import traceback
+import pandas as pd
 
 # TD analysis library
 import libs.tdlib as tdlib
@@ -9,7 +11,6 @@ sql = sqltools.sql()
 
 import robo_class  # class to store robot job constants and used variables
 import config
-import _thread
 
 ## Backtest import
 import backtest
@@ -22,52 +23,74 @@ for elem in config.markets_list:
 
 dict_robots = {}
 dict_b_tests = {}
-
-
-# Func to update DB with the prediction
-def update_prediction_db(prediction, prediction_probability, market, robo_instance):
-        
-
-        if prediction is not None and prediction_probability is not None:
-            sql_string = "SELECT id FROM market_info WHERE market = '{}'".format(market)
-            rows = sql.query(sql_string)
-            #print(sql_string, rows)
-
-            if rows != []:
-                # Existing - updating
-                key_row_id = rows[0][0]
-                sql_string = "UPDATE market_info SET prediction = '{}', probability = {} WHERE id = {}".format(
-                    robo_instance.predicted_name(prediction), prediction_probability, key_row_id
-                )
-                sql.query(sql_string)
-                #print(sql_string)
-            else:
-                # New - inserting
-                sql_string = "INSERT INTO market_info(market, prediction, probability) VALUES ('{}', '{}', {})".format(
-                    robo_instance.market, predicted_name(prediction), prediction_probability
-                )
-                sql.query(sql_string)
-                #print(sql_string)
-
-# Func to run the calcs
-def run_calc(robo_instance, btest_instance):
-    firstrun = True
-
-    while True:
-        timer_minute = int(btest_instance.strftime("%M"))
-
-        if (timer_minute in robo_instance.control_bars_minutes) or (firstrun):
-            label_to_predict = td_info.get_features_realtime(robo_instance, dict_b_tests[market])
-            prediction, prediction_probability = td_info.predict_label(label_to_predict, robo_instance)
-            print("Market {}, prediction {}, probability {}".format(robo_instance.market, prediction, prediction_probability))
-            update_prediction_db(prediction, prediction_probability, robo_instance.market.upper(), robo_instance)
-
-            firstrun = False
-
+last_run_minutes = {}
+
+
+# Func to update DB with the predictions: all the markets in one transaction
+def update_prediction_db(results):
+    try:
+        rows = []
+        for market, prediction, prediction_probability, robo_instance in results:
+            if prediction is not None and prediction_probability is not None:
+                rows.append({'market': market.upper(), 'prediction': robo_instance.predicted_name(prediction),
+                    'probability': float(prediction_probability)})
+        sql.upsert('market_info', rows, ['market'])
+    except:
+        print("Predictions update in the db failed: {}".format(traceback.format_exc()))
+        for market, prediction, prediction_probability, robo_instance in results:
+            last_run_minutes.pop(market, None)
+
+# Markets which are due at the current minute (all of them on the first run), once per control bar minute
+def markets_due(firstrun):
+    markets = []
+    for market, robo_instance in dict_robots.items():
+        timer_minute = int(dict_b_tests[market].strftime("%M"))
+        minute_key = dict_b_tests[market].strftime("%Y%m%d%H%M")
+        if firstrun or ((timer_minute in robo_instance.control_bars_minutes) and (last_run_minutes.get(market) != minute_key)):
+            markets.append(market)
+            last_run_minutes[market] = minute_key
         else:
-            print("Market {}, timer_minute {}. Sleeping...".format(robo_instance.market, timer_minute))
-
-        btest_instance.sleep(30)
+            print("Market {}, timer_minute {}. Sleeping...".format(market, timer_minute))
+    return markets
+
+# Func to run the calcs: features for every market due, then one predict per model for all its markets
+# A market which fails is left out of the batch (and tried again on the next check), the others are still updated
+def run_calc(markets):
+    markets_by_model = {}
+    for market in markets:
+        markets_by_model.setdefault(dict_robots[market].model_name, []).append(market)
+
+    results = []
+    for model_name, model_markets in markets_by_model.items():
+        features, features_markets = [], []
+        for market in model_markets:
+            try:
+                label_to_predict = td_info.get_features_realtime(dict_robots[market], dict_b_tests[market])
+                if label_to_predict is None or len(label_to_predict.index) != 1:
+                    raise ValueError('no features for the current bar')
+                features.append(label_to_predict)
+                features_markets.append(market)
+            except:
+                print("Market {}, features failed: {}".format(market, traceback.format_exc()))
+                last_run_minutes.pop(market, None)
+        if features == []:
+            continue
+
+        try:
+            X = pd.concat(features, ignore_index = True)[features[0].columns]
+            predictions = td_info.predict_labels(X, model_name)
+        except:
+            print("Model {}, predictions failed: {}".format(model_name, traceback.format_exc()))
+            for market in features_markets:
+                last_run_minutes.pop(market, None)
+            continue
+
+        for market, (prediction, prediction_probability) in zip(features_markets, predictions):
+            print("Market {}, prediction {}, probability {}".format(market, prediction, prediction_probability))
+            results.append([market, prediction, prediction_probability, dict_robots[market]])
+
+    if results != []:
+        update_prediction_db(results)
 
 # Create dictionary of robots
 for elem in list_markets_assets:
@@ -86,11 +109,10 @@ for elem in list_markets_assets:
     dict_robots[market].update_thresholds()
 
 # Do updates only when needed and write in the db
-for key, robo_instance in dict_robots.items():
-
-    print("Starting thread for", robo_instance.market)
-    _thread.start_new_thread( run_calc, (robo_instance, dict_b_tests[robo_instance.market], ) )
-
-# Run forever
+firstrun = True
 while True:
-    t.sleep(60)
+    markets = markets_due(firstrun)
+    if markets != []:
+        run_calc(markets)
+    firstrun = False
+    t.sleep(30)
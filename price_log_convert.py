@@ -0,0 +1,37 @@
+# Converting price logs between csv and binary formats
+# Stop price_log_n_update before converting so that no ticks are lost
+import os
+import argparse
+
+import libs.pricelog as pricelog
+price_log = pricelog.pricelog()
+
+def parse_params():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--to', type=str, default='bin', help="Target format: bin or csv")
+    parser.add_argument('--file', type=str, help="Price log file to convert (all files in the folder if not provided)")
+    parser.add_argument('--folder', type=str, default='price_log', help="Price log folder")
+    args, unknown = parser.parse_known_args()
+    return args
+
+### Start
+print('Use example: price_log_convert.py --to=bin --file=price_log/BTC_USD_bmex.csv')
+
+args = parse_params()
+source_ext, target_ext = ('.csv', '.bin') if args.to == 'bin' else ('.bin', '.csv')
+
+if args.file is not None:
+    filenames = [args.file]
+else:
+    filenames = [os.path.join(args.folder, filename) for filename in sorted(os.listdir(args.folder))
+        if filename.endswith(source_ext)]
+
+for filename in filenames:
+    filename_target = os.path.splitext(filename)[0] + target_ext
+    if args.to == 'bin':
+        records_no = price_log.csv_import(filename, filename_target)
+    else:
+        records_no = price_log.csv_export(filename, filename_target)
+    print('{} -> {}: {} records'.format(filename, filename_target, records_no))
+
+print('Done')
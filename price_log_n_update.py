@@ -6,6 +6,8 @@ from time import sleep, time
 # Custom libraries and config
 import config
 import libs.sqltools as sqltools
+import libs.pricelog as pricelog
+import libs.pricecollector as pricecollector
 import exch_api
 
 from libs.aux_functions import send_chat_message
@@ -13,6 +15,7 @@ from libs.aux_functions import send_chat_message
 
 ### Init values for stuff
 sql = sqltools.sql()
+price_log = pricelog.pricelog()
 e_api = exch_api.api(user=config.telegram_chat_id)
 
 # Vars
@@ -21,6 +24,7 @@ dir_to = config.dir_to
 
 start_time_dir_copy = start_time = time()
 file_prefix = 'price_log/'
+csv_handles = {}    # csv logs are kept open between appends
 
 
 ### Define filename
@@ -65,10 +69,13 @@ def check_dir():
 ######################
 def append_line(data, filename):
 
-    with open(filename, 'a', newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(data)
-        print("-- price added in the price log")
+    if filename not in csv_handles:
+        csvfile = open(filename, 'a', newline='')
+        csv_handles[filename] = csvfile, csv.writer(csvfile)
+    csvfile, csvwriter = csv_handles[filename]
+    csvwriter.writerow(data)
+    csvfile.flush()
+    print("-- price added in the price log")
 
 
 ### Exchange asssets names generator
@@ -83,26 +90,14 @@ def map_exchange_name(abbr):
     elif abbr == 'oanda':
         return 'oanda'
 
-# Update market info in the db (price)
-def update_db_price(instrument, price):
-    if price is None:
-        price = 0
-
-    sql_string = "SELECT id FROM market_info WHERE market = '{}'".format((instrument))
-    #print(sql_string)
-
-    rows = sql.query(sql_string)
-    if rows != []:
-        # Existing - updating
-        key_row_id = rows[0][0]
-        sql_string = "UPDATE market_info SET price = {}, last_update = {} WHERE id = {}".format(price, time(), key_row_id)
-        #print (sql_string)
-        sql.query(sql_string)
-    else:
-        # New - inserting
-        sql_string = "INSERT INTO market_info(market, price, last_update) VALUES ('{}', {}, {})".format((instrument), price, time())
-        #print(sql_string)
-        sql.query(sql_string)
+# Update market info in the db (prices): all the instruments in one commit
+def update_db_prices(prices):
+    rows = []
+    for instrument, price in prices:
+        if price is None:
+            price = 0
+        rows.append({'market': instrument, 'price': price, 'last_update': time()})
+    sql.upsert('market_info', rows, ['market'])
 
 # Check updates
 def update_dictionaries(elem, ticker):
@@ -113,17 +108,50 @@ def update_dictionaries(elem, ticker):
          updates_last_dict[elem] = time()
 
 ### Add the price line for an element
-def add_price(exch_name, elem, price_ticker):
+def add_price(exch_name, elem, price_ticker, timestamp = None):
 
     id = "{}_{}".format(elem.upper(), map_exchange_name(exch_name))
     filename = file_dict[id]
 
-    timestamp = time()
+    if timestamp is None:
+        timestamp = time()
     data = [timestamp, price_ticker]
 
-    append_line(data, filename)
-
-### Run the price grabber
+    if config.price_log_csv:
+        append_line(data, filename)
+    if config.price_log_binary:
+        price_log.append(price_log.filename_define(elem.upper(), map_exchange_name(exch_name)), timestamp, price_ticker)
+
+### Storage writer for the collector: ticks are logged as they come, the DB is updated once per cycle
+prices_update = []
+
+def write_tick(exch_name, elem, timestamp, price_ticker):
+    if price_ticker is False:
+        print("> Market is closed for {} {}".format(exch_name, elem))
+        return
+
+    print("> {}: {}".format(elem, price_ticker))
+    if price_ticker is not None:
+        prices_update.append([elem, price_ticker])
+        add_price(exch_name, elem, price_ticker, timestamp)
+    else:   # something is wrong
+        notify_text = "Warning: no price value for {}. Not updating the DB.".format(elem)
+        print(notify_text)
+        send_chat_message(config.telegram_chat_id, notify_text)
+
+def cycle_end():
+    global prices_update
+
+    # Prices of all the instruments to the DB
+    if prices_update != []:
+        update_db_prices(prices_update)
+        print("-- DB updated")
+        prices_update = []
+
+    # File copies if needed
+    price_files_copy()
+
+### Run the price grabber: all the instruments are requested concurrently
 def run(instruments_bitmex, instruments_oanda, e_api):
 
     # Run for bitmex and oanda
@@ -132,50 +160,8 @@ def run(instruments_bitmex, instruments_oanda, e_api):
         'oanda': instruments_oanda
     }
 
-    while True:
-
-        # Exchanges
-        for exch_name, exch_arr in exch_dict.items():
-            for elem in exch_arr:
-
-                # Check trading hours
-                try:
-                    market_open = e_api.is_market_open(exch_name, elem)
-                except:
-                    notify_text = "Warning: cannot check if the market is open (connection issues)"
-                    print(notify_text)
-                    send_chat_message(config.telegram_chat_id, notify_text)
-
-                if market_open:
-                    # Get the prices
-                    try:
-                        price_ticker = float(e_api.getticker(exch_name, elem))
-                    except:
-                        price_ticker = None
-
-                    print("> {}: {}".format(elem, price_ticker))
-
-                    # If not None
-                    if price_ticker is not None:
-                        update_db_price(elem, price_ticker)
-                        print("-- DB updated")
-                    else:   # something is wrong
-                        notify_text = "Warning: no price value for {}. Not updating the DB.".format(elem)
-                        print(notify_text)
-                        send_chat_message(config.telegram_chat_id, notify_text)
-                else:
-                    print("> Market is closed for {}".format(exch_name))
-                    price_ticker = None
-
-                ## Logging prices
-                if price_ticker is not None:
-                    add_price(exch_name, elem, price_ticker)
-
-        # File copies if needed
-        price_files_copy()
-
-        # Sleep for all
-        sleep(1)
+    collector = pricecollector.pricecollector(e_api, exch_dict, write_tick, cycle_end)
+    collector.run()
 
 
 ### To copy price files
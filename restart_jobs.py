@@ -6,6 +6,8 @@ import libs.sqltools as sqltools
 sql = sqltools.sql()
 
 import libs.platformlib as platform                                  # detecting the OS and setting proper folders
+import libs.jobhost as jobhost   # jobs submitted to robot_host.py if enabled
+job_host = jobhost.jobhost()
 import argparse
 import os
 import time
@@ -16,6 +18,12 @@ from sys import exit
 
 def start_command(command, start=False, testmode=False):
     global cmd_init
+    # Job host starts the jobs by itself, no need to wait between them
+    if config.job_host_enabled:
+        print('Job host:', command)
+        if start:
+            job_host.submit(command)
+        return
     if platform_run == 'Windows':
         cmd_str = cmd_init + ' ' + command
     else:
@@ -136,7 +144,7 @@ if not do_restart:
 
 # Restarting 
 
-print('(!) Now close the windows with user tasks. All jobs will be deleted from the DB and commands will be relaunched.')
+print('(!) Now close the windows with user tasks (or stop robot_host.py and its jobs). All jobs will be deleted from the DB and commands will be relaunched.')
 time.sleep(60)
 
 # Deleting tasks
@@ -31,6 +31,9 @@ decimal.getcontext().rounding = 'ROUND_DOWN'
 import libs.sqltools as sqltools
 sql = sqltools.sql()
 
+import libs.controlchannel as controlchannel   # wake-ups on Telegram commands
+control_channel = controlchannel.controlchannel()
+
 import libs.platformlib as platform                                  # detecting the OS and setting proper folders
 import libs.aux_functions as aux_functions  # various auxiliary functions
 import libs.tdlib as tdlib    # Price analysis library - in threads
@@ -48,6 +51,7 @@ import backtest     # Backtest import
 b_test = backtest.backtesting()
 
 import exch_api  # exchanges 
+import libs.simexchange as simexchange   # simulated exchange for backtests
 
 ### Platform
 platform = platform.platformlib()
@@ -59,17 +63,23 @@ parser = argparse.ArgumentParser()
 parser.add_argument('--userid', type=int, help="User id (telegram")
 parser.add_argument("--core_strategy", type=str, help="Core strategy name (blank is standard)")   # strategy (standard / micro)  # deprecate this
 parser.add_argument('--is_restart', type=int, help="Restart indicator (1 or 0)")
-args, unknown = parser.parse_known_args()
-user_id = getattr(args, 'userid')
 
-if user_id is None:
-    user_id = config.telegram_chat_id     # my id
+# User and restart indicator from the launch parameters (parsed again by jobs started in the job host)
+def launch_user_params():
+    args, unknown = parser.parse_known_args()
+    user_id = getattr(args, 'userid')
+
+    if user_id is None:
+        user_id = config.telegram_chat_id     # my id
+
+    is_restart = getattr(args, 'is_restart')
+    if is_restart is not None:  # restart indicator
+        is_restart = True
+    else:
+        is_restart = False
+    return args, user_id, is_restart
 
-is_restart = getattr(args, 'is_restart')
-if is_restart is not None:  # restart indicator
-    is_restart = True
-else:
-    is_restart = False
+args, user_id, is_restart = launch_user_params()
 
 # Using coinigy to get prices so that there are no stringent restrictions on api request rates (frequency)
 from libs.coinigylib import coinigy 
@@ -103,6 +113,16 @@ def send_chat_message(user_to, text):
 '''
 
 
+### Backtests on the simulated exchange (libs/simexchange.py): orders, balance and positions go through e_api as in the real mode
+def sim_exchange_used():
+    return config.backtesting_enabled and config.backtesting_sim_exchange
+
+### Trading simulated by the robot without exchange requests: simulation mode and backtests (unless on the simulated exchange)
+def trading_simulated(robot):
+    if sim_exchange_used():
+        return False
+    return robot.simulation or config.backtesting_enabled
+
 ### Notify admin about issues
 def issue_notify(robot_instance, error, only_admin = False):
     admin_id = config.telegram_chat_id
@@ -118,7 +138,7 @@ def issue_notify(robot_instance, error, only_admin = False):
 ### Function to get original value
 def original_value(robot, exchange, market, e_api):
     try:
-        if not robot.simulation and not b_test.backtesting:
+        if not trading_simulated(robot):
             if exchange == 'bitmex':
                 all_positions = e_api.getpositions(exchange, market)
                 if all_positions != [{}]:
@@ -194,7 +214,7 @@ def buyer_check_positions(robot, e_api):
                     positions = e_api.getpositions(robot.exchange, robot.market)
                     #print positions #TEST
                     contracts_check = positions[0]['contracts']
-                    b_test.sleep(robot.sleep_buy_timer)
+                    control_sleep(robot, b_test, robot.sleep_buy_timer)
                     #print "Contracts check", contracts_check
             except:
                 retry = False
@@ -221,7 +241,7 @@ def ensure_balance(robot, checked_price = None):
 
     result = True # default
 
-    if robot.simulation or config.backtesting_enabled:
+    if trading_simulated(robot):
         return True
     else:
         # On bitmex, BTC only is used as collateral
@@ -401,6 +421,13 @@ def buy_back_wrapper(robot, b_test):
             sql.query(sql_string)
             robot.terminate()
 
+### Sleeping in the loops: live robots wake up early when the flags are changed via Telegram
+def control_sleep(robot, b_test, seconds):
+    if b_test.backtesting:
+        b_test.sleep(seconds)
+    else:
+        control_channel.wait(robot.user_id, seconds)
+
 ### Cycle to wait for the price feed. Ensure that we never get Nones in the current price
 def get_price_feed(robot, b_test):
     price_update = None
@@ -481,7 +508,7 @@ def buy_back(robot, price_base, time_bb_initiated, b_test = b_test):
 
         # No need to sleep if the buyback is confirmed
         if not (td_result and over_threshold):
-            b_test.sleep(int(robot.sleep_timer_buyback/robot.speedrun))
+            control_sleep(robot, b_test, int(robot.sleep_timer_buyback/robot.speedrun))
 
     # Finishing up
     return td_result, td_direction
@@ -498,7 +525,7 @@ def sell_orders_info(robot, b_test = None):
         robot.earned_ratio_multiple = ((float(robot.price_entry) / float(robot.price_exit) -1)*robot.margin_level) + 1
 
     try: # to handle errors
-        if not robot.simulation and not config.backtesting_enabled:
+        if not trading_simulated(robot):
             # Reset values if we are not simulating
             robot.main_curr_from_sell = 0
             robot.commission_total = 0
@@ -564,11 +591,11 @@ def sell_orders_info(robot, b_test = None):
             #robot.logger.lprint(['Robot contracts start', robot.contracts_start]) #DEBUG
 
         # For bitmex in simulation we are accounting for loss/profit. In real mode it is done when calculating contracts anyway
-        if robot.exchange == 'bitmex' and robot.simulation:
+        if robot.exchange == 'bitmex' and trading_simulated(robot):
             # Accounting for the loss or the profit
             robot.main_curr_from_sell = float(robot.value_original) * float(robot.earned_ratio_multiple) * robot.margin_level
         # In the real mode, accounting for:
-        if robot.exchange == 'bitmex' and not robot.simulation:
+        if robot.exchange == 'bitmex' and not trading_simulated(robot):
             robot.main_curr_from_sell = float(robot.earned_ratio_multiple) * robot.main_curr_from_sell
 
     except:
@@ -603,7 +630,7 @@ def sell_orders_outcome(robot, b_test = None):
         if robot.exchange not in ['bitmex', 'oanda']:
             robot.logger.lprint(['Exchange currently not supported'])
         else: # calculation for bitmex based on timestamps
-            if not b_test.backtesting:
+            if not b_test.backtesting or sim_exchange_used():
                 if robot.exchange == 'bitmex':
                     # If we have both start and end timestamps
                     if robot.timestamp_start_initiate is not None and robot.timestamp_finish is not None:
@@ -817,11 +844,10 @@ def stop_reconfigure(robot, mode = None, b_test = None):
 
     # Get predictions from the DB if not backtesting
     if not b_test.backtesting:
-        sql_string = "SELECT prediction, probability FROM market_info WHERE market = '{}'".format(robot.market)
-        rows = sql.query(sql_string)
-        if rows != []:
-            robot.prediction = robot.predicted_num_from_name(rows[0][0])
-            robot.prediction_probability = float(rows[0][1])
+        info = sql.market_info(robot.market)
+        if info is not None:
+            robot.prediction = robot.predicted_num_from_name(info['prediction'])
+            robot.prediction_probability = float(info['probability'])
 
     # If backtesting
     else:
@@ -883,14 +909,14 @@ def sell_now(at_price, b_test = None):      # change for oanda: oanda closure is
     if robot.sell_portion is not None:
         robot.sell_portion = float(robot.sell_portion)
 
-    if robot.simulation:
+    if trading_simulated(robot):
         robot.balance_start = float(robot.simulation_balance)
         robot.balance_available = float(robot.simulation_balance)       # balance_available as of balance to close
         robot.remaining_sell_balance = float(robot.simulation_balance)
 
     # For bitmex / oanda, we will be trading contracts, no adjustments are available. Getting the balances and setting the original value
     if robot.exchange in ['bitmex', 'oanda']:
-        if not robot.simulation and not b_test.backtesting:
+        if not trading_simulated(robot):
             # There were issues with testnet returning blanks so changed this
             contracts_check = {}
             positions = e_api.getpositions(robot.exchange, robot.market)  # first not empty result
@@ -942,7 +968,7 @@ def sell_now(at_price, b_test = None):      # change for oanda: oanda closure is
             process_db_updates(robot, sql, b_test, type='update')
 
             # 0. Check open orders, cancel if unfilled
-            if not robot.simulation:
+            if not trading_simulated(robot):
                 orders_retry = True
                 orders_retry_count = 0
                 while orders_retry and orders_retry_count < 10:
@@ -964,13 +990,13 @@ def sell_now(at_price, b_test = None):      # change for oanda: oanda closure is
 
 
             # 1. Sell portion
-            if robot.simulation:
+            if trading_simulated(robot):
                 # If we are in the simulation mode - use the value from the previous run
                 robot.balance_available = robot.remaining_sell_balance
                 sell_portion = robot.balance_available
 
             # For bitmex, we will be trading contracts, no adjustments are available
-            if robot.exchange in ['bitmex', 'oanda'] and not robot.simulation:
+            if robot.exchange in ['bitmex', 'oanda'] and not trading_simulated(robot):
                 # There were issues with testnet returning blanks so changed this
                 contracts_check = {}
                 positions = e_api.getpositions(robot.exchange, robot.market)  # first not empty result as there could be just 1 position open
@@ -1015,7 +1041,7 @@ def sell_now(at_price, b_test = None):      # change for oanda: oanda closure is
                         sell_q_step = sell_portion
 
                     # Price update
-                    if robot.exchange != 'bitmex' or config.backtesting_enabled:
+                    if robot.exchange != 'bitmex' or (config.backtesting_enabled and not sim_exchange_used()):
                         price_last_sell = get_price_feed(robot, b_test)
                     else:
                         # When we are long, on the exit we sell -> get the price from bids (the highest which is the first in the array)
@@ -1035,7 +1061,7 @@ def sell_now(at_price, b_test = None):      # change for oanda: oanda closure is
                     current_postonly_flag = postonly_attempts_confirm(robot, timer_sell_now_start)
 
                     # Actually place sell orders if we are not in the simulation mode - re-check
-                    if not robot.simulation:
+                    if not trading_simulated(robot):
                         # For bitmex, we will be placing contracts in the other direction (short)
                         if robot.exchange == 'bitmex':      # Bitmex
                             # Balance_available is the number of contracts here. Creating orders depending on the side (long or short)
@@ -1142,25 +1168,24 @@ def process_db_updates(robot, sql, b_test, type = 'insert'):
         sql_string = "INSERT INTO jobs(market, simulation, mooning, selling, price_curr, " \
                             "percent_of, abort_flag, stop_loss, entry_price, mode, tp_p, sl_p, exchange, " \
                             "userid, core_strategy, short_flag) " \
-                            "VALUES ('{}', {}, {},  {},  {},  {},  {}, {}, {}, '{}', {}, {}, '{}', {}, '{}', {})".format(
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        robot.job_id, rows = sql.execute_lastrow_id(sql_string, (
                             robot.market.upper(), int(robot.simulation),
                             int(False), int(False), robot.price_entry, 100, int(False), int(robot.stop_loss),
-                            robot.price_entry, 0, 0, 0, robot.exchange,
-                            robot.user_id, robot.core_strategy, int(robot.short_flag))
-        robot.job_id, rows = sql.query_lastrow_id(sql_string)
+                            robot.price_entry, '0', 0, 0, robot.exchange,
+                            robot.user_id, robot.core_strategy, int(robot.short_flag)))
         robot.logger.lprint(['Job id:', robot.job_id])
     elif type == 'update':
         if not b_test.backtesting:
-            sql_string = "UPDATE jobs SET price_curr={}, percent_of={}, last_update={} WHERE job_id={} " \
-            "AND userid = {} AND core_strategy = '{}'".format(
-                round(robot.price, 8), robot.percent_of_entry, b_test.time(), robot.job_id,
-                robot.user_id, robot.core_strategy)
-            sql.query(sql_string)
+            sql_string = "UPDATE jobs SET price_curr=?, percent_of=?, last_update=? WHERE job_id=? " \
+            "AND userid = ? AND core_strategy = ?"
+            sql.execute(sql_string, (round(robot.price, 8), robot.percent_of_entry, b_test.time(), robot.job_id,
+                robot.user_id, robot.core_strategy))
 
 ### Collecting orders in the process pre-flow
 def process_orders_init(robot, e_api, b_test):
 
-    if not robot.simulation and not config.backtesting_enabled:
+    if not trading_simulated(robot):
         orders_opening = None   #sometimes api fails and ends with an error - so retrying here
         while orders_opening is None:
             try:
@@ -1213,11 +1238,19 @@ def process(robot, b_test = None):
         robot.simulation_balance = robot.limit_sell_amount
         robot.sell_portion = robot.limit_sell_amount
 
+    # On the simulated exchange, the position of the task is opened at the entry price if it is not there yet
+    if sim_exchange_used() and e_api.getpositions(robot.exchange, robot.market) == [{}]:
+        if robot.market in config.primary_calc_markets:
+            contracts = robot.price_entry * robot.limit_sell_amount
+        else:
+            contracts = robot.limit_sell_amount / robot.price_entry
+        e_api.open_position(robot.market, contracts, robot.price_entry)
+
     if robot.limit_sell_amount > 0:
         robot.logger.lprint(["Maximum quantity to sell", robot.limit_sell_amount])
 
     ### Set up the margin on bitmex
-    if robot.exchange == 'bitmex' and not robot.simulation and not config.backtesting_enabled:
+    if robot.exchange == 'bitmex' and not trading_simulated(robot):
         set_margin = e_api.bitmex_leverage(robot.market, robot.margin_level)
         if set_margin == 'balance_insufficient':
             robot.logger.lprint(["Cannot set the margin due to insufficient balance, proceeding as is"])
@@ -1241,19 +1274,20 @@ def process(robot, b_test = None):
     init_pre_check(robot, coinigy, b_test)
 
     ### 2. Checking available balance. If bitmex - checking whether we have a long or a short position
-    if not robot.simulation:
+    if not trading_simulated(robot):
         balance = e_api.getbalance(robot.exchange, robot.currency)
 
         # Updating the balance snapshot for history
-        sql_string = "INSERT INTO user_balances(userid, balance, timestamp, core_strategy) VALUES ({}, {}, {}, '{}')".format(
-            robot.user_id, balance['Total'], b_test.time(), robot.core_strategy)
-        sql.query(sql_string)
+        if not b_test.backtesting:
+            sql_string = "INSERT INTO user_balances(userid, balance, timestamp, core_strategy) VALUES ({}, {}, {}, '{}')".format(
+                robot.user_id, balance['Total'], b_test.time(), robot.core_strategy)
+            sql.query(sql_string)
 
         # Checking the direction based on the actual poritions
         process_direction_check(robot, e_api)
 
     #ML-based short flag when simulation 
-    if robot.simulation: 
+    if trading_simulated(robot): 
         short_flag_on_prediction(robot)
         if robot.short_flag is None:
             # Just pick any
@@ -1357,8 +1391,8 @@ def process(robot, b_test = None):
         ########### Stop loss triggered
         if sale_trigger:
 
-            # Introduced a time lag for backtests
-            if config.backtesting_enabled:
+            # Introduced a time lag for backtests (the simulated exchange has its own order latency)
+            if config.backtesting_enabled and not sim_exchange_used():
                 add_time_lag(robot, b_test)
 
             # Stop-loss triggered   predicted_name(robot.prediction), robot.prediction_probability  #<HERE>
@@ -1382,7 +1416,8 @@ def process(robot, b_test = None):
 
         ### Check if 'close now' request has been initiated
         if not b_test.backtesting:
-            sell_init_flag = sql.check_sell_flag(robot)
+            control_flags = sql.control_flags(robot, 'jobs', robot.job_id)
+            sell_init_flag = control_flags['sell']
             if sell_init_flag and approved_flag and run_flag:
                 robot.logger.lprint(["Sale initiated via Telegram @", robot.price])
                 robot.stopped_mode = 'telegram'
@@ -1404,12 +1439,12 @@ def process(robot, b_test = None):
         # Checking cancellation request and sleeping
         if run_flag and approved_flag:
             if not b_test.backtesting:
-                approved_flag = sql.check_cancel_flag(robot, robot.job_id, 'jobs')
+                approved_flag = not control_flags['abort']
                 if not approved_flag:
                     robot.logger.lprint(["Shutdown was requested via Telegram"])
                     robot.stopped_mode = 'telegram'
                     robot.sleep_timer = 0
-            b_test.sleep(robot.sleep_timer)
+            control_sleep(robot, b_test, robot.sleep_timer)
 
     ### 10. Exit point for the main cycle, sell cycle, mooning cycle
     sql_string = "DELETE FROM jobs WHERE job_id = {} " \
@@ -1439,8 +1474,8 @@ def process(robot, b_test = None):
 
 ### Aux: set margin on bitmex. Workaround because it is sometimes reset for no reason
 def init_set_margin(robot, e_api):
-    if robot.exchange == 'bitmex' and (robot.mode not in ['now-s', 'fullta-s']):
-        if not config.backtesting_enabled:
+    if robot.exchange == 'bitmex' and ((robot.mode not in ['now-s', 'fullta-s']) or sim_exchange_used()):
+        if not config.backtesting_enabled or sim_exchange_used():
             set_margin = e_api.bitmex_leverage(robot.market, robot.margin_level)
             if set_margin == 'balance_insufficient':
                 robot.logger.lprint(["Cannot set the margin due to insufficient balance, proceeding as is"])
@@ -1575,22 +1610,18 @@ def init_orders_process(robot, buy_uuid, e_api, b_test, sum_paid, sum_quantity,
 def init_db_upd(robot, sql, b_test, type = 'update'):
     if type == 'update':
         if not robot.fixed_price_flag and not b_test.backtesting:
-            sql_string = "UPDATE buys SET price = {}, last_update={} WHERE job_id = {} " \
-                         "AND userid = {} AND core_strategy = '{}' ".format(
-                robot.price, b_test.time(), robot.job_id, robot.user_id, robot.core_strategy)
-            #print(sql_string)
-            sql.query(sql_string)
+            sql_string = "UPDATE buys SET price = ?, last_update = ? WHERE job_id = ? " \
+                         "AND userid = ? AND core_strategy = ?"
+            sql.execute(sql_string, (robot.price, b_test.time(), robot.job_id, robot.user_id, robot.core_strategy))
     elif type == 'delete':
-        sql_string = "DELETE FROM buys WHERE job_id = {} " \
-                     "AND userid = {} AND core_strategy = '{}' ".format(
-            robot.job_id, robot.user_id, robot.core_strategy)
-        sql.query(sql_string)
+        sql_string = "DELETE FROM buys WHERE job_id = ? " \
+                     "AND userid = ? AND core_strategy = ?"
+        sql.execute(sql_string, (robot.job_id, robot.user_id, robot.core_strategy))
     elif type == 'wf_delete':
         if robot.wf_id is not None:
-            sql_string = "DELETE FROM workflow WHERE wf_id = {} " \
-                         "AND userid = {} AND core_strategy = '{}' ".format(
-                robot.wf_id, robot.user_id, robot.core_strategy)
-            sql.query(sql_string)
+            sql_string = "DELETE FROM workflow WHERE wf_id = ? " \
+                         "AND userid = ? AND core_strategy = ?"
+            sql.execute(sql_string, (robot.wf_id, robot.user_id, robot.core_strategy))
             robot.wf_id = None
 
 ### Checking if actually should start
@@ -1625,7 +1656,7 @@ def init_launch_position_opening(initiate_position_launch, robot):
 ### Updating prices to open position for
 def init_price_update(robot, e_api, initiate_position_launch):
     if initiate_position_launch:
-        if not config.backtesting_enabled:
+        if not config.backtesting_enabled or sim_exchange_used():
             if not robot.fixed_price_flag: # otherwise price is in the input
                 # When we are long, on the enter we buy -> get the price from asks (the lowest ask (sell price) which is the first in the array)
                 # When we are short, on the enter we sell -> get the price from bids (the highest bid (buy price), which is the first in the array)
@@ -1703,7 +1734,7 @@ def init_quantity(robot, e_api, buy_rate, contracts):
 
     # on OANDA, the number of units should be whole
     elif robot.exchange == 'oanda':
-        if not b_test.backtesting:
+        if not b_test.backtesting or sim_exchange_used():
             # Because we could have something like 0.99 units when there is enough margin left.
             # Subtracting 0.4 to e.g. not round 1.2 up to 2
             quantity = int(math.ceil(quantity - Decimal(0.4)))
@@ -1737,7 +1768,7 @@ def init_position_open(robot, e_api, buy_flag, buy_rate, contracts, sum_quantity
     current_postonly_flag = postonly_attempts_confirm(robot, robot.timer_init_start)
 
     # Proceeding with the position
-    if robot.simulation:
+    if trading_simulated(robot):
         buy_flag, robot.sleep_buy_timer = False, 0
         robot.logger.lprint(['Bought in simulation:', sum_quantity, quantity, buy_rate])
         sum_quantity = quantity
@@ -1826,7 +1857,7 @@ def init_position_open(robot, e_api, buy_flag, buy_rate, contracts, sum_quantity
 def init_post_results(robot, sum_quantity, sum_paid, source_filled, avg_price):
 
     if sum_quantity > 0:
-        if not robot.simulation:
+        if not trading_simulated(robot):
             if robot.exchange == 'bitmex':
                 if robot.market in config.primary_calc_markets:  # robot.market == 'btc/usd':
                     avg_price = round(Decimal(sum_quantity) / Decimal(str(sum_paid)), 8)  # cause we are buying contracts there
@@ -1839,8 +1870,8 @@ def init_post_results(robot, sum_quantity, sum_paid, source_filled, avg_price):
             # If simulation
             sum_paid = robot.source_position
 
-        # Fix for the backtesting - we will just use ticker as an average price paid
-        if config.backtesting_enabled:
+        # Fix for the backtesting - we will just use ticker as an average price paid (fills are known on the simulated exchange)
+        if config.backtesting_enabled and not sim_exchange_used():
             avg_price = robot.price
 
         # Take absolute values if avg_price and spent as oanda returns negatives
@@ -1959,13 +1990,13 @@ def init_check_wf(robot, sql):
 ### USD - local curr rates update
 def usd_rate_value(robot, e_api):
     if robot.exchange == 'oanda':
-        if not robot.simulation:
+        if not robot.simulation and not sim_exchange_used():
             usd_x_rate = e_api.getticker('oanda', 'AUD_USD')
         else:
-            usd_x_rate = 1  # does not matter
+            usd_x_rate = 1  # does not matter (the simulated exchange balance is in usd)
 
-        # If market is closed
-        if usd_x_rate is None:
+        # If market is closed (False) or there is no price
+        if usd_x_rate is None or usd_x_rate is False:
             # a workaround to get the last known
             usd_x_rate = robot.usd_x_rate_last
         else:
@@ -2112,8 +2143,8 @@ def buyer(robot, b_test):
                     initiate_position_launch, pre_order_open_state, flag_buyer_check_positions, approved_flag,
                     balance_issue_notify, robot, sum_quantity, b_test, buy_rate, buy_flag)
 
-                ### Extra: time lag for backtests
-                if config.backtesting_enabled:
+                ### Extra: time lag for backtests (the simulated exchange has its own order latency)
+                if config.backtesting_enabled and not sim_exchange_used():
                     add_time_lag(robot, b_test)
 
                 ### 4.8. Placing an order when requirements are met
@@ -2131,9 +2162,9 @@ def buyer(robot, b_test):
 
             # Sleeping depending on whether we have started buying or not 
             if ratio == 0: 
-                b_test.sleep(30)
+                control_sleep(robot, b_test, 30)
             else: 
-                b_test.sleep(robot.sleep_buy_timer)
+                control_sleep(robot, b_test, robot.sleep_buy_timer)
 
         except: # unknown issues with opening a position
             err_msg = traceback.format_exc()
@@ -2294,10 +2325,13 @@ def params_update_from_args(robot, args):
 #####            Main script  logic              #####
 ###################################    
 
-if __name__ == "__main__":
+# Runs the job from the launch parameters in sys.argv (robot.py or a job in robot_host.py)
+def main():
+    global robot, e_api, coinigy, user_id, is_restart, args, codename, core_strategy, run_program_mode
 
     ### Process input
-    argv, args, codename, core_strategy = process_launch_parameters(argv)
+    args, user_id, is_restart = launch_user_params()
+    launch_argv, args, codename, core_strategy = process_launch_parameters(argv)
 
     # Initialising the class to store all the constants and parameters
     robot = robo_class.Scripting(user_id, strategy = core_strategy, codename = codename)
@@ -2308,7 +2342,7 @@ if __name__ == "__main__":
     robot.user_id = user_id  # storing user_id from the launch in a proper variable
 
     # Checking the program mode etc
-    run_program_mode = robot.input(*argv)  # * to unpack the arguments
+    run_program_mode = robot.input(*launch_argv)  # * to unpack the arguments
 
     # Check if market is supported and the strategy is supported
     if not sql.is_market_supported(robot.market):
@@ -2318,8 +2352,11 @@ if __name__ == "__main__":
 
     robot.logger.lprint(["Core strategy:", robot.core_strategy])
 
-    # Initiating exchange api
-    e_api = exch_api.api(user_id, strategy = core_strategy)
+    # Initiating exchange api (simulated on the backtest prices if enabled)
+    if sim_exchange_used():
+        e_api = simexchange.simexchange(b_test, robot.exchange, margin_level = robot.margin_level)
+    else:
+        e_api = exch_api.api(user_id, strategy = core_strategy)
 
     # Initiating price feed api
     coinigy = coinigy(user_id, e_api = e_api)
@@ -2392,4 +2429,8 @@ if __name__ == "__main__":
             robot.run_continued = False
         except: # any other unknown exit
             err_msg = traceback.format_exc()
-            issue_notify(robot, err_msg)
\ No newline at end of file
+            issue_notify(robot, err_msg)
+
+
+if __name__ == "__main__":
+    main()
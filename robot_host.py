@@ -0,0 +1,35 @@
+################# Use examples #############
+# Runs robot jobs as forks of one process (see libs/jobhost.py), set job_host_enabled in config
+# so that the daemon and restart_jobs.py send the jobs here instead of opening a terminal per job
+# > python robot_host.py
+# Submitting a job by hand (same parameters as for robot.py):
+# > python robot_host.py --submit="process r bmex btc/usd 6398 --userid=123"
+################# Libraries ##################
+import sys
+import shlex
+import argparse
+
+import config
+import libs.jobhost as jobhost
+
+# Parse custom params if there are any
+parser = argparse.ArgumentParser()
+parser.add_argument('--submit', type=str, help="Job parameters to add to the queue (as for robot.py)")
+args, unknown = parser.parse_known_args()
+
+job_host = jobhost.jobhost()
+
+if args.submit is not None:
+    job_host.submit(args.submit)
+    sys.exit(0)
+
+# Loading the robot with all its libraries once, the jobs get them from the host
+sys.argv = sys.argv[:1]
+import robot
+
+# Runs in the job process: launch parameters are put to argv as if robot.py was started with them
+def run_job(command):
+    sys.argv[:] = ['robot.py'] + shlex.split(command)
+    robot.main()
+
+job_host.run(run_job)
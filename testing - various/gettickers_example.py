@@ -0,0 +1,88 @@
+# Example: batched tickers (exch_api gettickers) against local stand-in exchange clients
+# The bitmex and oanda clients of exch_api.api are replaced with stand-ins answering the instrument and pricing
+# requests from local prices, so no keys or network are needed. Shows the bulk call next to the per-market calls
+# and the number of requests each of them makes
+# > python "testing - various/gettickers_example.py"
+
+import os
+import sys
+import json
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import exch_api
+
+
+### Stand-in exchanges
+class standin_result(object):
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value, None
+
+
+class standin_bitmex(object):
+    def __init__(self, prices):
+        self.prices = prices    # symbol: last price
+        self.requests = 0
+        self.Instrument = self
+        self.Trade = self
+
+    def Instrument_get(self, filter = None, columns = None, **kwargs):
+        self.requests += 1
+        symbols = json.loads(filter)['symbol']
+        return standin_result([{'symbol': symbol, 'lastPrice': self.prices[symbol]}
+            for symbol in symbols if symbol in self.prices])
+
+    def Trade_get(self, symbol = None, **kwargs):
+        self.requests += 1
+        return standin_result([{'symbol': symbol, 'price': self.prices[symbol]}])
+
+
+class standin_oanda(object):
+    def __init__(self, prices, closed = []):
+        self.prices = prices    # instrument: bid
+        self.closed = closed
+        self.requests = 0
+
+    def request(self, endpoint):
+        self.requests += 1
+        instruments = endpoint.params['instruments'].split(',')
+        return {'prices': [{'instrument': instrument, 'closeoutBid': str(self.prices[instrument]),
+            'status': 'non-tradeable' if instrument in self.closed else 'tradeable'}
+            for instrument in instruments if instrument in self.prices]}
+
+
+### Api object without keys from the db
+def standin_api():
+    e_api = exch_api.api.__new__(exch_api.api)
+    e_api.oanda_account_id = 'standin'
+    e_api.adapters = {}
+    e_api.user, e_api.rate_limit_accounts = None, {}
+    exch_api.rate_limiter.limits = {}   # no limits for the stand-ins
+    e_api.bitmex = standin_bitmex({'XBTUSD': 6512.5, 'ETHUSD': 205.35})
+    e_api.oanda = standin_oanda({'SPX500_USD': 2801.2, 'NAS100_USD': 7105.8, 'XAU_USD': 1231.45, 'USD_JPY': 112.61},
+        closed = ['USD_JPY'])
+    return e_api
+
+
+if __name__ == "__main__":
+    e_api = standin_api()
+    markets = {
+        'bitmex': ['BTC/USD', 'ETH/USD', 'XBTZ18'],
+        'oanda': ['SPX500_USD', 'NAS100_USD', 'XAU_USD', 'USD_JPY', 'BCO_USD']
+    }
+
+    for exchange, exchange_markets in markets.items():
+        print('{}: gettickers {}'.format(exchange, e_api.gettickers(exchange, exchange_markets)))
+    requests_batch = [e_api.bitmex.requests, e_api.oanda.requests]
+
+    # Markets without prices are skipped here as getticker reports them as errors
+    for exchange, exchange_markets in markets.items():
+        for market in exchange_markets[:-1]:
+            print('{}: getticker {} {}'.format(exchange, market, e_api.getticker(exchange, market)))
+
+    print('Requests with gettickers: bitmex {}, oanda {}'.format(*requests_batch))
+    print('Requests with getticker: bitmex {}, oanda {}'.format(
+        e_api.bitmex.requests - requests_batch[0], e_api.oanda.requests - requests_batch[1]))
@@ -0,0 +1,100 @@
+# Retry policy and circuit breaker of exch_api against a local fault-injecting stand-in exchange
+# The stand-in adapter answers getticker from a script of faults (rate limit, 5xx, auth, ok) and the scenarios
+# print the outcome, the number of requests and the time taken. Delays are scaled down to run in seconds
+# Several processes share the circuit of the stand-in, run with --procs to see them fail fast together
+# > python "testing - various/retry_faults.py" --procs=4
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from multiprocessing import Pool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import exch_api
+import libs.retrypolicy as retrypolicy
+
+
+### Stand-in exchange: faults are taken from the script in order, then the last one repeats
+class fault(Exception):
+    def __init__(self, kind):
+        Exception.__init__(self, 'injected {}'.format(kind))
+        self.kind = kind
+
+
+class faulty_adapter(exch_api.exchange_adapter):
+    exchange = 'faulty'
+    script = ['ok']
+    requests = 0
+
+    def classify_error(self, error):
+        if isinstance(error, fault):
+            return error.kind, str(error)
+        return exch_api.exchange_adapter.classify_error(self, error)
+
+    def getticker(self, market, param1=None, param2=None, param3=None):
+        faulty_adapter.requests += 1
+        kind = self.script[min(faulty_adapter.requests - 1, len(self.script) - 1)]
+        if kind != 'ok':
+            raise fault(kind)
+        return 100.0
+
+
+def standin_api(folder):
+    exch_api.register_adapter('faulty', faulty_adapter)
+    exch_api.retry_policy.base, exch_api.retry_policy.rate_limit_base, exch_api.retry_policy.cap = 0.01, 0.05, 0.2
+    exch_api.circuit_breaker = retrypolicy.circuitbreaker(folder)
+    exch_api.circuit_breaker.open_seconds, exch_api.circuit_breaker.probe_seconds = 1, 0.5
+    e_api = exch_api.api.__new__(exch_api.api)
+    e_api.adapters = {}
+    e_api.user, e_api.rate_limit_accounts = None, {}
+    e_api.contracts_to_use = None
+    return e_api
+
+
+def scenario(params):
+    folder, name, script = params
+    e_api = standin_api(folder)
+    faulty_adapter.script, faulty_adapter.requests = script, 0
+    time_start = time.time()
+    result = e_api.getticker('faulty', 'TEST')
+    return name, result, faulty_adapter.requests, time.time() - time_start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--procs', type=int, default=4, help="Processes hitting the failing exchange at once")
+    args, unknown = parser.parse_known_args()
+
+    scenarios = [
+        ['recovers after 5xx', ['unavailable', 'unavailable', 'ok']],
+        ['rate limited then ok', ['rate_limit', 'rate_limit', 'ok']],
+        ['invalid keys', ['auth']],
+        ['unknown error', ['fatal']],
+        ['request error retried', ['request', 'ok']],
+    ]
+
+    folder = tempfile.mkdtemp()
+    try:
+        for name, script in scenarios:
+            print('{}: result {}, requests {}, {:.2f}s'.format(*scenario([folder, name, script])))
+            shutil.rmtree(folder, ignore_errors = True)
+
+        # Outage: the first process opens the circuit, the others fail fast
+        pool = Pool(args.procs)
+        results = pool.map(scenario, [[folder, 'outage {}'.format(i), ['unavailable']] for i in range(args.procs)])
+        pool.close()
+        pool.join()
+        for result in results:
+            print('{}: result {}, requests {}, {:.2f}s'.format(*result))
+
+        # After the open period one probe goes through and closes the circuit
+        time.sleep(1.1)
+        print('{}: result {}, requests {}, {:.2f}s'.format(*scenario([folder, 'probe after outage', ['ok']])))
+        print('Circuit state: {}'.format(retrypolicy.circuitbreaker(folder).read('faulty')))
+    finally:
+        shutil.rmtree(folder, ignore_errors = True)
@@ -0,0 +1,82 @@
+# Replay on the simulated exchange: a simple strategy is run against libs/simexchange.py on the price log
+# Each step moves the backtest time forward, the strategy reverses the position every few hours with limit orders
+# placed off the current price (some fill as maker later, some are taken right away), and closes before the end.
+# Prints the results with fees and funding and the replay speed in simulated minutes per second
+# > python "testing - various/sim_replay.py" --exchange=bmex --market=USD-BTC --start=2018-06-01 --end=2018-07-01
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))   # price_log folder
+
+import config
+config.backtesting_enabled = True
+
+import backtest
+import libs.simexchange as simexchange
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exchange', type=str, default='bmex', help="Exchange abbreviation (bmex / oanda)")
+    parser.add_argument('--market', type=str, default='USD-BTC', help="Market as in the price log filename")
+    parser.add_argument('--start', type=str, default='2018-06-01', help="Start date")
+    parser.add_argument('--end', type=str, default='2018-07-01', help="End date")
+    parser.add_argument('--step', type=int, default=60, help="Seconds between the strategy checks")
+    parser.add_argument('--hold', type=int, default=4, help="Hours to hold a position")
+    parser.add_argument('--contracts', type=int, default=1000, help="Contracts (bitmex) or units (oanda) per order")
+    parser.add_argument('--offset', type=float, default=0.001, help="Limit price offset from the current price")
+    args, unknown = parser.parse_known_args()
+
+    exchange = config.exch_types[args.exchange]['fullname']
+    b_test = backtest.backtesting()
+    b_test.init_testing(datetime.strptime(args.start, '%Y-%m-%d'), datetime.strptime(args.end, '%Y-%m-%d'),
+        args.exchange, args.market)
+    sim = simexchange.simexchange(b_test, exchange)
+    balance_start = sim.getbalance(exchange)['Total']
+    time_start, replay_start, orders_no = b_test.time(), time.time(), 0
+    side, position_start = 'Buy', None
+
+    while not b_test.finished:
+        price = float(sim.getticker(exchange, args.market))
+
+        # Closing before the end of the replay with an order which crosses the price
+        if b_test._end_time - b_test.time() < 10 * args.step + sim.latency:
+            if side is not None:
+                sim.cancel_orders(exchange, args.market)
+                positions = sim.getpositions(exchange, args.market)
+                if positions != [{}]:
+                    sign = 1 if positions[0]['type'] == 'short' else -1
+                    sim.closepositions(exchange, positions, args.market, price * (1 + sign * args.offset))
+                    orders_no += 1
+                side = None
+
+        # Reversing the position every hold hours: open orders are canceled, the position is closed and a new one opened
+        elif position_start is None or b_test.time() - position_start >= args.hold * 3600:
+            sim.cancel_orders(exchange, args.market)
+            positions = sim.getpositions(exchange, args.market)
+            if positions != [{}]:
+                sim.closepositions(exchange, positions, args.market, price)
+                orders_no += 1
+            if side == 'Buy':
+                sim.buylimit(exchange, args.market, None, price * (1 - args.offset), args.contracts)
+            else:
+                sim.selllimit(exchange, args.market, None, price * (1 + args.offset), args.contracts)
+            side = 'Sell' if side == 'Buy' else 'Buy'
+            position_start = b_test.time()
+            orders_no += 1
+
+        b_test.sleep(args.step)
+
+    replay_seconds = time.time() - replay_start
+    simulated_minutes = (b_test.time() - time_start) / 60
+    results = sim.results_over_time(exchange, args.market, time_start - 1, b_test.time() + 1)
+    print('Orders {}, trades {}'.format(orders_no, len([e for e in sim.executions if e['execType'] == 'Trade'])))
+    print('Result {:.6f}, commission {:.6f}, funding {:.6f}, outcome {:.6f}'.format(
+        results['position_diff'], results['commission'], results['funding'], results['total_outcome']))
+    print('Balance {:.6f} -> {:.6f}'.format(balance_start, sim.getbalance(exchange)['Total']))
+    print('Replay: {:.0f} simulated minutes in {:.2f}s ({:.0f} minutes per second)'.format(
+        simulated_minutes, replay_seconds, simulated_minutes / replay_seconds))
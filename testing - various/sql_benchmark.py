@@ -0,0 +1,90 @@
+# Benchmark: sqltools query latency with a connection per query (previous behaviour) vs persistent connections in WAL mode
+# Many robot processes run the queries of the main loop (prediction read, job price update, cancel flag, sell flag)
+# against a copy of the workflow.db schema and the per-query latencies are printed
+# > python "testing - various/sql_benchmark.py" --procs=20 --loops=200
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import libs.sqltools as sqltools
+
+root_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+### Database with the workflow.db schema and one job per robot
+def create_db(dbname, robots_no):
+    sql = sqltools.sql(persistent = False)
+    sql.dbname = dbname
+    with open(os.path.join(root_folder, 'workflow.db.sql')) as f:
+        schema = f.read()
+    con = sql.connect()
+    con.executescript(schema)
+    for robot_no in range(robots_no):
+        market = 'USD-M{}'.format(robot_no)
+        con.execute("INSERT INTO jobs(job_id, market, abort_flag, selling, userid, core_strategy) "
+            "VALUES ({}, '{}', 0, 0, 1, 'standard')".format(robot_no + 1, market))
+        con.execute("INSERT INTO market_info(market, prediction, probability) VALUES ('{}', 'long', 0.5)".format(market))
+    con.commit()
+    con.close()
+
+
+### One robot process: main loop queries, returns the latencies in ms
+def robot_loop(params):
+    dbname, persistent, robot_no, loops = params
+    sql = sqltools.sql(persistent = persistent)
+    sql.dbname = dbname
+    market = 'USD-M{}'.format(robot_no)
+    queries = [
+        "SELECT prediction, probability FROM market_info WHERE market = '{}'".format(market),
+        "UPDATE jobs SET price_curr = {}, percent_of = {} WHERE job_id = {}",
+        "SELECT abort_flag FROM jobs WHERE job_id = '{}' AND userid = 1".format(robot_no + 1),
+        "SELECT selling FROM jobs WHERE market = '{}' AND userid = 1 AND core_strategy = 'standard'".format(market)
+    ]
+    latencies = []
+    for loop_no in range(loops):
+        for query in queries:
+            if query.startswith('UPDATE'):
+                query = query.format(100 + loop_no, loop_no, robot_no + 1)
+            time_start = time.time()
+            sql.query(query)
+            latencies.append((time.time() - time_start) * 1000)
+    sql.close()
+    return latencies
+
+
+def run(dbname, persistent, procs, loops):
+    pool = Pool(procs)
+    time_start = time.time()
+    results = pool.map(robot_loop, [[dbname, persistent, robot_no, loops] for robot_no in range(procs)])
+    time_total = time.time() - time_start
+    pool.close()
+    pool.join()
+    return np.concatenate([np.array(latencies) for latencies in results]), time_total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--procs', type=int, default=20, help="Number of concurrent robot processes")
+    parser.add_argument('--loops', type=int, default=200, help="Main loop iterations per robot")
+    args, unknown = parser.parse_known_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        for persistent, name in [[False, 'connection per query'], [True, 'persistent WAL']]:
+            dbname = os.path.join(folder, 'workflow_{}.db'.format(int(persistent)))
+            create_db(dbname, args.procs)
+            latencies, time_total = run(dbname, persistent, args.procs, args.loops)
+            print("{}: {} queries from {} processes in {:.2f}s, latency ms: mean {:.3f}, p50 {:.3f}, p95 {:.3f}, p99 {:.3f}, max {:.1f}".format(
+                name, latencies.size, args.procs, time_total, latencies.mean(),
+                np.percentile(latencies, 50), np.percentile(latencies, 95), np.percentile(latencies, 99), latencies.max()))
+    finally:
+        shutil.rmtree(folder)
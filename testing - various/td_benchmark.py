@@ -0,0 +1,208 @@
+# Benchmark: vectorised TD (tdlib.td_calc) vs the previous row-wise apply version
+# Checks that the outputs are identical and prints the timings
+# > python "testing - various/td_benchmark.py" --file=price_log/BTC_USD_bmex.csv --period=1h
+# > python "testing - various/td_benchmark.py" --ticks=2000000 --period=5min   (synthetic random walk)
+
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# TD analysis library
+import libs.tdlib as tdlib
+td_info = tdlib.tdlib()
+
+
+### Previous version of the TD calc (row-wise apply and a loop through bars.values)
+def td_calc_legacy(bars, short_flag = False):
+    bearish_flip = False
+    bullish_flip = False
+    setup_up = 0
+    setup_down = 0
+
+    size = bars['close'].size
+
+    td_info.rsi_df = bars['close']
+    bars['rsi'] = td_info.RSI(14)
+
+    bars.loc[:, 'td_setup'] = 0
+    bars.loc[:, 'td_direction'] = ''
+    bars.loc[:, 'move_extreme'] = None
+    bars['td_setup'] = pd.to_numeric(bars['td_setup'], errors='coerce')
+    bars['move_extreme'] = pd.to_numeric(bars['move_extreme'], errors='coerce')
+
+    direction_up = False
+    direction_down = False
+    move_extreme = None
+    countdown_up_flag = False
+    countdown_down_flag = False
+    countdown_up_list = []
+    countdown_down_list = []
+
+    if (bars['close'].iloc[5] > bars['close'].iloc[4]):
+        direction_up = True
+    elif (bars['close'].iloc[5] < bars['close'].iloc[4]):
+        direction_down = True
+
+    bars['shifted_1'] = bars['close'].shift(1)
+    bars['shifted_2'] = bars['close'].shift(2)
+    bars['shifted_4'] = bars['close'].shift(4)
+    bars['shifted_5'] = bars['close'].shift(5)
+    bars['bear_flip'] = bars.apply(lambda x : True if x['shifted_1'] > x['shifted_5'] and x['close'] < x['shifted_4'] else False, axis=1)
+    bars['bull_flip'] = bars.apply(lambda x : True if x['shifted_1'] < x['shifted_5'] and x['close'] > x['shifted_4'] else False, axis=1)
+    bars['bear_reset'] = bars.apply(lambda x : True if x['close'] > x['shifted_4'] else False, axis=1)
+    bars['bull_reset'] = bars.apply(lambda x : True if x['close'] < x['shifted_4'] else False, axis=1)
+    bars['shifted_1_low'] = bars['low'].shift(1)
+    bars['shifted_2_low'] = bars['low'].shift(2)
+    bars['shifted_1_high'] = bars['high'].shift(1)
+    bars['shifted_2_high'] = bars['high'].shift(2)
+    bars['max_1_2'] = bars[['shifted_1_high', 'shifted_2_high']].max(axis = 1)
+    bars['min_1_2'] = bars[['shifted_1_low', 'shifted_2_low']].min(axis = 1)
+    bars['if_countdown_down'] = bars.apply(lambda x: True if x['close'] <= x['shifted_2_low'] else False, axis=1)
+    bars['if_countdown_up'] = bars.apply(lambda x: True if x['close'] >= x['shifted_2_high'] else False, axis=1)
+
+    np_setup = np.zeros(shape = (size, 1), dtype = int)
+    np_direction = np.empty(shape = (size, 1), dtype=object)
+    np_move_extremes = np.empty(shape = (size, 1))
+    np_move_extremes.fill(np.nan)
+    np_countdown_up = np.zeros(shape = (size, 1), dtype = int)
+    np_countdown_down = np.zeros(shape = (size, 1), dtype = int)
+
+    for i, bar_row in enumerate(bars.values):
+        if i > 5:
+            bearish_flip = False
+            bullish_flip = False
+            if setup_up == 9:
+                setup_up = 0
+            if setup_down == 9:
+                setup_down = 0
+            if bar_row[12]:
+                bearish_flip = True
+                direction_down = True
+                bullish_flip = False
+                move_extreme = None
+            if bar_row[13]:
+                bullish_flip = True
+                direction_up = True
+                bearish_flip = False
+                move_extreme = None
+            if bearish_flip and direction_up:
+                direction_up = False
+                setup_down = 1
+            if bullish_flip and direction_down:
+                direction_down = False
+                setup_up = 1
+            if direction_down and not bearish_flip:
+                if bar_row[14]:
+                    setup_down = 1
+                else:
+                    setup_down += 1
+            if direction_up and not bullish_flip:
+                if bar_row[15]:
+                    setup_up = 1
+                else:
+                    setup_up += 1
+            if (direction_down and (setup_down > 2) and short_flag):
+                if setup_down == 3:
+                    move_extreme = bar_row[20]
+                else:
+                    if (bar_row[1] > move_extreme):
+                        move_extreme = bar_row[1]
+            if (direction_up and (setup_up > 2) and not short_flag):
+                if setup_up == 3:
+                    move_extreme = bar_row[21]
+                else:
+                    if (bar_row[2] < move_extreme):
+                        move_extreme = bar_row[2]
+            if direction_down:
+                np_setup[i] = setup_down
+                np_direction[i] = 'red'
+            if direction_up:
+                np_setup[i] = setup_up
+                np_direction[i] = 'green'
+            np_move_extremes[i] = move_extreme
+            if direction_up and setup_up == 9:
+                countdown_up_flag = True
+                countdown_down_flag = False
+                countdown_down_list = []
+                countdown_up_list.append(0)
+            if direction_down and setup_down == 9:
+                countdown_down_flag = True
+                countdown_up_flag = False
+                countdown_up_list = []
+                countdown_down_list.append(0)
+            if direction_up and countdown_up_flag and bar_row[23]:
+                countdown_up_list = [x + 1 for x in countdown_up_list]
+                countdown_up_list = [x for x in countdown_up_list if x != 13]
+            if countdown_up_list != []:
+                np_countdown_up[i] = max(countdown_up_list)
+            if direction_down and countdown_down_flag and bar_row[22]:
+                countdown_down_list = [x + 1 for x in countdown_down_list]
+                countdown_down_list = [x for x in countdown_down_list if x != 13]
+            if countdown_down_list != []:
+                np_countdown_down[i] = max(countdown_down_list)
+
+    for name, values in [['td_setup', np_setup], ['td_direction', np_direction], ['move_extreme', np_move_extremes],
+            ['countdown_up', np_countdown_up], ['countdown_down', np_countdown_down]]:
+        values_df = pd.DataFrame(data = values)
+        values_df.index = bars.index.copy()
+        bars[name] = values_df
+
+    bars['countdown_up'] = bars.countdown_up.astype('int8')
+    bars['countdown_down'] = bars.countdown_down.astype('int8')
+    bars['td_setup'] = bars.td_setup.astype('int8')
+    for elem in ['open', 'high', 'low', 'close']:
+        bars[elem] = bars[elem].astype('float32')
+
+    for elem in ['shifted_1', 'shifted_2', 'shifted_4', 'shifted_5',
+            'bear_flip', 'bull_flip', 'bear_reset', 'bull_reset', 'shifted_1_low',
+            'shifted_2_low', 'shifted_1_high', 'shifted_2_high',
+            'max_1_2', 'min_1_2'
+            ]:
+        del bars[elem]
+
+    return bars
+
+
+### Price data: a price log file or a synthetic random walk
+def load_transactions(filename, ticks_no):
+    if filename is not None:
+        transactions = pd.read_csv(filename, names=['timestamp', 'price']).set_index('timestamp')
+    else:
+        rng = np.random.RandomState(42)
+        timestamps = 1420070400 + np.cumsum(rng.randint(1, 30, size = ticks_no)).astype('float64')
+        prices = 300 * np.exp(np.cumsum(rng.normal(0, 0.0005, size = ticks_no)))
+        transactions = pd.DataFrame({'price': prices}, index = pd.Index(timestamps, name = 'timestamp'))
+    transactions.index = pd.to_datetime(transactions.index, unit='s')
+    transactions['price'] = transactions.price.astype('float32')
+    return transactions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file', type=str, help="Price log csv (timestamp, price). Synthetic data if not provided")
+    parser.add_argument('--ticks', type=int, default=1000000, help="Number of synthetic ticks")
+    parser.add_argument('--period', type=str, default='1h', help="Bars period, e.g. 5min, 1h, 4h")
+    args, unknown = parser.parse_known_args()
+
+    transactions = load_transactions(args.file, args.ticks)
+    bars = transactions.price.resample(args.period).ohlc()
+    print("Ticks: {}, bars ({}): {}".format(len(transactions), args.period, len(bars)))
+
+    for short_flag in [False, True]:
+        time_start = time.time()
+        bars_legacy = td_calc_legacy(bars.copy(), short_flag)
+        time_legacy = time.time() - time_start
+
+        time_start = time.time()
+        bars_new = td_info.td_calc(bars.copy(), short_flag)
+        time_new = time.time() - time_start
+
+        pd.testing.assert_frame_equal(bars_legacy, bars_new, check_exact = True)
+        print("short_flag {}: identical output. Row-wise {:.3f}s, vectorised {:.3f}s, speedup x{:.1f}".format(
+            short_flag, time_legacy, time_new, time_legacy / time_new))
@@ -81,6 +81,7 @@ CREATE TABLE IF NOT EXISTS `market_info` (
 	`prediction`	TEXT,
 	`probability`	REAL,
 	`last_update`	INTEGER,
+	`version`	INTEGER DEFAULT 0,
 	PRIMARY KEY(`id`)
 );
 CREATE TABLE IF NOT EXISTS `losses` (
@@ -236,4 +237,47 @@ CREATE INDEX IF NOT EXISTS `ix_labels_generated_timestamp` ON `labels_generated`
 CREATE INDEX IF NOT EXISTS `ix_labels_generated_prices_timestamp` ON `labels_generated_prices` (
 	`timestamp`
 );
+CREATE INDEX IF NOT EXISTS `ix_labels_generated_market_exchange_timestamp` ON `labels_generated` (
+	`market`,
+	`exchange`,
+	`timestamp`
+);
+CREATE INDEX IF NOT EXISTS `ix_jobs_market_userid` ON `jobs` (
+	`market`,
+	`userid`,
+	`core_strategy`
+);
+CREATE INDEX IF NOT EXISTS `ix_jobs_userid` ON `jobs` (
+	`userid`
+);
+CREATE INDEX IF NOT EXISTS `ix_buys_market_userid` ON `buys` (
+	`market`,
+	`userid`
+);
+CREATE INDEX IF NOT EXISTS `ix_buys_userid` ON `buys` (
+	`userid`
+);
+CREATE INDEX IF NOT EXISTS `ix_bback_userid` ON `bback` (
+	`userid`
+);
+CREATE INDEX IF NOT EXISTS `ix_workflow_market_exchange_userid` ON `workflow` (
+	`market`,
+	`exchange`,
+	`userid`,
+	`core_strategy`
+);
+CREATE INDEX IF NOT EXISTS `ix_keys_user_strategy_exchange` ON `keys` (
+	`user`,
+	`strategy`,
+	`exchange`
+);
+CREATE UNIQUE INDEX IF NOT EXISTS `ux_market_info_market` ON `market_info` (
+	`market`
+);
+CREATE INDEX IF NOT EXISTS `ix_market_info_version` ON `market_info` (
+	`version`
+);
+CREATE TRIGGER IF NOT EXISTS market_info_version_insert AFTER INSERT ON market_info BEGIN UPDATE market_info SET version = (SELECT MAX(version) FROM market_info) + 1 WHERE id = NEW.id; END;
+CREATE TRIGGER IF NOT EXISTS market_info_version_update AFTER UPDATE OF price, last_update, prediction, probability ON market_info BEGIN UPDATE market_info SET version = (SELECT MAX(version) FROM market_info) + 1 WHERE id = NEW.id; END;
+PRAGMA user_version = 3;
 COMMIT;